@@ -0,0 +1,59 @@
+""" Memory and speed benchmark for the in-memory block index.
+
+    Indexes a synthetic chain of headers with a fork every few hundred blocks and reports
+    bytes per header, insertion rate, the cost of lookups, ancestor queries and fork choice, and
+    the cost of the copy a reloaded chain takes from chain.block_indexes instead of rebuilding.
+
+    Usage: python3 -m benchmarks.block_index [number of headers]
+"""
+import sys
+import time
+import random
+import tracemalloc
+from blockchain.chaindb.block_index import BlockIndex
+from blockchain.util import sha256_2_bytes
+
+if __name__ == '__main__':
+    num_headers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(0)
+    digests = [sha256_2_bytes(str(i)) for i in range(num_headers)]
+
+    tracemalloc.start()
+    start = time.time()
+    index = BlockIndex()
+    parent, height = None, 0
+    for i in range(num_headers):
+        if i % 500 == 499 and height > 10:
+            # start a short fork a few blocks back
+            parent_id = index.ancestor(index.lookup(parent), height - 5)
+            parent, height = index.digest(parent_id), height - 4
+        index.add(digests[i], parent, height, float(i), 2 ** 248, 256)
+        parent, height = digests[i], height + 1
+    elapsed = time.time() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print("Indexed", num_headers, "headers in %.1fs (%d headers/s)" % (elapsed, num_headers / elapsed))
+    print("Index memory: %.1f MB (%.1f bytes/header)" % (memory / 2 ** 20, memory / num_headers))
+
+    start = time.time()
+    for digest in rng.sample(digests, 100000):
+        index.lookup(digest)
+    print("Lookup: %.2f us" % ((time.time() - start) / 100000 * 10 ** 6))
+
+    tip = index.best
+    start = time.time()
+    for i in range(10000):
+        index.ancestor(tip, rng.randrange(index.heights[tip]))
+    print("Ancestor at random height: %.2f us" % ((time.time() - start) / 10000 * 10 ** 6))
+
+    start = time.time()
+    for i in range(10000):
+        index.last_common_ancestor(tip, rng.randrange(num_headers))
+    print("Last common ancestor: %.2f us" % ((time.time() - start) / 10000 * 10 ** 6))
+    print("Best tip: height", index.heights[tip], "weight", index.weight(tip))
+
+    start = time.time()
+    for i in range(10):
+        index.copy()
+    print("Copy: %.2f ms" % ((time.time() - start) / 10 * 10 ** 3))
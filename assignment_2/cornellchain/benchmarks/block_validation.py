@@ -0,0 +1,83 @@
+""" Block.is_valid benchmark on a full (900 transaction) block.
+
+    Two thirds of the transactions spend genesis outputs; the rest spend outputs created
+    earlier in the same block, so the block exercises intra-block dependencies. Validation
+    is timed in the calling process, on process pools of several sizes (context-free checks),
+    and with inputs resolved through several numbers of state shards.
+
+    Usage: python3 -m benchmarks.block_validation [runs] [pool sizes] [shard counts] (sizes comma separated)
+"""
+import os
+import sys
+import time
+import tempfile
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+from blockchain import chaindb, block, shards
+from blockchain.chaindb import Blockchain
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+BLOCK_TXS = 900
+
+class UnsealedBlock(PoWBlock):
+    """ PoW block that skips mining, so only transaction checks are timed. """
+
+    def seal_is_valid(self):
+        return True
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+def build_blocks():
+    """ Genesis block with one output per transaction, and a full block spending them. """
+    genesis_tx = Transaction([], [TransactionOutput("Genesis", "Alice", 1000) for i in range(BLOCK_TXS)])
+    genesis = UnsealedBlock(0, [genesis_tx], "genesis", is_genesis=True)
+    txs = []
+    independent = 2 * BLOCK_TXS // 3
+    for i in range(independent):
+        txs.append(Transaction([genesis_tx.hash + ":" + str(i)], [TransactionOutput("Alice", "Alice", 600), TransactionOutput("Alice", "Bob", 400)]))
+    for i in range(BLOCK_TXS - independent):
+        # spend the change of an earlier transaction in this block
+        txs.append(Transaction([txs[i].hash + ":0"], [TransactionOutput("Alice", "Carol", 600)]))
+    return genesis, UnsealedBlock(1, txs, genesis.hash)
+
+def time_validation(full_block, runs):
+    """ Best-of-runs wall time of full_block.is_valid(), in seconds. """
+    best = None
+    for run in range(runs):
+        start = time.perf_counter()
+        valid, reason = full_block.is_valid()
+        elapsed = time.perf_counter() - start
+        assert valid, reason
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    pool_sizes = [int(size) for size in sys.argv[2].split(",") if size] if len(sys.argv) > 2 else [2, 4]
+    shard_counts = [int(count) for count in sys.argv[3].split(",") if count] if len(sys.argv) > 3 else [1, 2, 4]
+
+    chaindb.chain = Blockchain()
+    genesis, full_block = build_blocks()
+    assert chaindb.chain.add_block(genesis, save=False)
+
+    config.VALIDATION_PROCESSES = 0
+    serial = time_validation(full_block, runs)
+    print("Transactions:", len(full_block.transactions))
+    print("in process:   %.2f ms" % (serial * 1000))
+    for size in pool_sizes:
+        config.VALIDATION_PROCESSES = size
+        block.check_transactions([(tx, None) for tx in full_block.transactions]) # start the workers outside the timing
+        elapsed = time_validation(full_block, runs)
+        print("%d processes:  %.2f ms (%.2fx)" % (size, elapsed * 1000, serial / elapsed))
+    config.VALIDATION_PROCESSES = 0
+    for count in shard_counts:
+        config.VALIDATION_SHARDS = count
+        shards.get_coordinator().sync(chaindb.chain) # load the shards outside the timing
+        elapsed = time_validation(full_block, runs)
+        print("%d shards:     %.2f ms (%.2fx)" % (count, elapsed * 1000, serial / elapsed))
+    if block.validation_pool is not None:
+        block.validation_pool.terminate()
+    if shards.coordinator is not None:
+        shards.coordinator.stop()
@@ -0,0 +1,79 @@
+""" Block validation benchmark with and without assume-valid checkpoints.
+
+    Builds a linear chain of full blocks, where every transaction spends an output of the
+    previous block, then times Block.is_valid on every block: once while replaying the chain
+    into a fresh Blockchain, fully validated, and once against a chain that knows every header
+    (as after a snapshot import) with a checkpoint at the top, so that every block is an
+    ancestor of a known checkpoint and skips transaction checks. (A checkpoint that is not
+    known yet vouches for nothing, so replaying blocks in order never skips checks.)
+
+    Usage: python3 -m benchmarks.checkpoints [blocks] [txs per block]
+"""
+import os
+import sys
+import time
+import tempfile
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.transaction import Transaction, TransactionOutput
+from benchmarks.block_validation import UnsealedBlock
+
+def build_chain(num_blocks, txs_per_block, outputs_per_tx=1):
+    """ Genesis plus num_blocks blocks of txs_per_block transactions each; only the first output
+    of each transaction is spent later, so extra outputs grow the unspent output set. """
+    genesis_tx = Transaction([], [TransactionOutput("Genesis", "Alice", 1000) for i in range(txs_per_block)])
+    blocks = [UnsealedBlock(0, [genesis_tx], "genesis", is_genesis=True)]
+    refs = [genesis_tx.hash + ":" + str(i) for i in range(txs_per_block)]
+    for height in range(1, num_blocks + 1):
+        txs = [Transaction([ref], [TransactionOutput("Alice", "Alice", 1000 - height)] +
+            [TransactionOutput("Alice", "Bob", 0) for i in range(outputs_per_tx - 1)]) for ref in refs]
+        refs = [tx.hash + ":0" for tx in txs]
+        blocks.append(UnsealedBlock(height, txs, blocks[-1].hash))
+    return blocks
+
+def replay(blocks):
+    """ Add blocks to a fresh chain in order; returns the chain and the time taken in seconds. """
+    chain = Blockchain()
+    chaindb.chain = chain # validation reads the global chain
+    start = time.perf_counter()
+    for block in blocks:
+        assert chain.add_block(block, save=False)
+    return chain, time.perf_counter() - start
+
+def validate_replaying(blocks):
+    """ Add blocks to a fresh chain in order; returns the time spent validating each before it is added, in seconds. """
+    chain = Blockchain()
+    chaindb.chain = chain
+    validating = 0
+    for block in blocks:
+        start = time.perf_counter()
+        assert block.is_valid()[0]
+        validating += time.perf_counter() - start
+        assert chain.add_block(block, save=False)
+    return validating
+
+def validate_with_headers(blocks):
+    """ Validate blocks against a fresh chain knowing only their headers; returns the time taken in seconds. """
+    chain = Blockchain()
+    chaindb.chain = chain
+    for block in blocks:
+        chain.add_header(block.digest, block.parent_digest, block.height, block.timestamp, block.target, block.get_weight())
+    start = time.perf_counter()
+    for block in blocks:
+        assert block.is_valid()[0]
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    txs_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    blocks = build_chain(num_blocks, txs_per_block)
+    print("Blocks:", len(blocks), "transactions:", sum(len(block.transactions) for block in blocks))
+
+    config.CHECKPOINTS = [(blocks[-1].height, blocks[-1].hash)]
+    full_time = validate_replaying(blocks) # the checkpoint is only known once the last block is added
+    assumed_time = validate_with_headers(blocks)
+    print("full validation: %.3fs" % full_time)
+    print("assume-valid:    %.3fs (%.1fx)" % (assumed_time, full_time / assumed_time))
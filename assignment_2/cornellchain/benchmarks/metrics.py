@@ -0,0 +1,65 @@
+""" Metrics registry overhead benchmark.
+
+    Times the recording primitives (Counter.inc, Histogram.observe) from one thread and from several
+    at once, then the instrumentation added around each block validation and p2p message (two clock
+    reads, a counter and a histogram) against a full block's Block.is_valid, and against handle_message
+    for an "addblock" of a block the node already has (which reopens the database and checks the header).
+
+    Usage: python3 -m benchmarks.metrics [calls] [threads]
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+import contextlib
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+from blockchain import chaindb, metrics
+from p2p import gossip
+from benchmarks.block_validation import build_blocks, time_validation
+
+def per_call(function, calls):
+    """ Wall time of function(), averaged over calls, in nanoseconds. """
+    start = time.perf_counter()
+    for i in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e9
+
+def per_call_threaded(function, calls, threads):
+    """ Wall time of function() called calls times from each of several threads at once, per call, in nanoseconds. """
+    workers = [threading.Thread(target=lambda: [function() for i in range(calls)]) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (calls * threads) * 1e9
+
+def instrumentation():
+    """ What add_block and handle_message add per call. """
+    started = time.perf_counter()
+    metrics.p2p_messages_received.inc("other")
+    metrics.p2p_handle_seconds.observe(time.perf_counter() - started, "other")
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    counter = lambda: metrics.p2p_messages_sent.inc("addblock")
+    histogram = lambda: metrics.commit_seconds.observe(.003)
+    print("Counter.inc:       %6.0f ns per call, %6.0f ns with %d threads" % (per_call(counter, calls),
+        per_call_threaded(counter, calls // threads, threads), threads))
+    print("Histogram.observe: %6.0f ns per call, %6.0f ns with %d threads" % (per_call(histogram, calls),
+        per_call_threaded(histogram, calls // threads, threads), threads))
+
+    added = per_call(instrumentation, calls)
+    genesis, full_block = build_blocks()
+    assert chaindb.chain.add_block(genesis)
+    validation = time_validation(full_block, 5) * 1e9
+    with contextlib.redirect_stdout(io.StringIO()): # handle_message prints every sender
+        message = per_call(lambda: gossip.handle_message("addblock", str(genesis), "http://127.0.0.1:1/"), 100)
+    print("Instrumentation:   %6.0f ns per call" % added)
+    print("  vs is_valid on a %d-transaction block (%.1f ms): %.4f%%" % (len(full_block.transactions), validation / 1e6, added / validation * 100))
+    print("  vs handle_message of a known block (%.2f ms): %.3f%%" % (message / 1e6, added / message * 100))
@@ -0,0 +1,73 @@
+""" Reorg engine benchmark on randomly forked chains from generate_example_pow_chain.py.
+
+    Generates a forked PoW chain, replays it into a fresh Blockchain, and compares the cost
+    of keeping the UTXO set on the best tip with update_tip (proportional to reorg depth)
+    against rebuilding it from genesis on every tip change (proportional to chain length).
+
+    Usage: python3 -m benchmarks.reorg [height to reach] [fork probability]
+"""
+import os
+import io
+import sys
+import time
+import tempfile
+import contextlib
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.transaction import OutPoint
+from generate_example_pow_chain import generate_chain
+
+class TimedBlockchain(Blockchain):
+    """ Blockchain that records the depth and duration of every tip update. """
+
+    def __init__(self):
+        super().__init__()
+        self.tip_updates = []
+
+    def update_tip(self):
+        start = time.perf_counter()
+        disconnected, connected = super().update_tip()
+        if connected:
+            self.tip_updates.append((len(disconnected), len(connected), time.perf_counter() - start))
+        return disconnected, connected
+
+def utxos_from_scratch(chain, tip_hash):
+    """ Rebuild the UTXO set by replaying the whole chain ending in tip_hash (the cost without a reorg engine). """
+    utxos = {}
+    for block_hash in reversed(chain.get_chain_ending_with(tip_hash)):
+        for tx in chain.get_block(block_hash).transactions:
+            for input_ref in tx.input_refs:
+                utxos.pop(input_ref, None)
+            for output_index, output in enumerate(tx.outputs):
+                utxos[OutPoint(tx.txid, output_index)] = output
+    return utxos
+
+if __name__ == '__main__':
+    height_to_reach = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fork_probability = float(sys.argv[2]) if len(sys.argv) > 2 else .3
+
+    chaindb.chain = Blockchain()
+    with contextlib.redirect_stdout(io.StringIO()):
+        blocks = generate_chain(chaindb.chain, height_to_reach=height_to_reach, fork_probability=fork_probability, broadcast=False)
+
+    chain = TimedBlockchain()
+    chaindb.chain = chain # validation reads the global chain
+    scratch_times = []
+    for block in blocks:
+        old_tip = chain.tip
+        chain.add_block(block, save=False)
+        if chain.tip != old_tip:
+            start = time.perf_counter()
+            utxos = utxos_from_scratch(chain, chain.tip.hex())
+            scratch_times.append(time.perf_counter() - start)
+    assert utxos == dict(chain.utxos.items()), "reorg engine state diverged from a full replay"
+
+    reorgs = [update for update in chain.tip_updates if update[0] > 0]
+    engine_time = sum(update[2] for update in chain.tip_updates)
+    print("Blocks:", len(blocks), "best height:", chain.get_max_height(), "unspent outputs:", len(chain.utxos))
+    print("Tip changes:", len(chain.tip_updates), "reorgs:", len(reorgs),
+        "max reorg depth:", max([update[0] for update in reorgs] + [0]))
+    print("update_tip:          total %.3fs, %.3f ms per tip change" % (engine_time, engine_time / len(chain.tip_updates) * 1000))
+    print("replay from genesis: total %.3fs, %.3f ms per tip change" % (sum(scratch_times), sum(scratch_times) / len(scratch_times) * 1000))
@@ -0,0 +1,46 @@
+""" Node bootstrap benchmark: importing a chain state snapshot vs replaying the chain.
+
+    Builds the linear chain from benchmarks/checkpoints.py (with an extra unspent output per
+    transaction, so the unspent output set grows with the chain), replays it, exports a snapshot
+    of the result and imports it into a fresh chain, reporting times, snapshot size and
+    peak memory allocated while exporting.
+
+    Usage: python3 -m benchmarks.snapshot [blocks] [txs per block] [outputs per transaction]
+"""
+import io
+import sys
+import time
+import tempfile
+import tracemalloc
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.chaindb.snapshot import export_snapshot, import_snapshot
+from benchmarks.checkpoints import build_chain, replay
+
+if __name__ == '__main__':
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    txs_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    outputs_per_tx = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    chain, replay_time = replay(build_chain(num_blocks, txs_per_block, outputs_per_tx))
+    with tempfile.TemporaryFile() as out_file:
+        tracemalloc.start()
+        start = time.perf_counter()
+        export_snapshot(chain, out_file)
+        export_time = time.perf_counter() - start
+        export_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        out_file.seek(0)
+        data = out_file.read()
+
+    imported = Blockchain()
+    chaindb.chain = imported
+    start = time.perf_counter()
+    import_snapshot(imported, io.BytesIO(data))
+    import_time = time.perf_counter() - start
+    assert imported.tip == chain.tip and dict(imported.utxos.items()) == dict(chain.utxos.items())
+
+    print("Blocks:", len(chain.blocks), "unspent outputs:", len(chain.utxos))
+    print("replay from genesis: %.3fs" % replay_time)
+    print("export snapshot:     %.3fs, %d bytes, %.1f KB peak allocations" % (export_time, len(data), export_peak / 1024))
+    print("import snapshot:     %.3fs (%.1fx faster than replay)" % (import_time, replay_time / import_time))
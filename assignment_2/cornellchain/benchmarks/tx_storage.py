@@ -0,0 +1,170 @@
+""" Memory and disk-size benchmark for transaction storage.
+
+    Adds the same generated chain, one committed block at a time as a node does, to a fresh
+    FileStorage with each layout: every transaction and output its own persistent ZODB object
+    (as before they became inline value types), the current value types, and the value types
+    with the block and transaction indexes as plain dicts on the Blockchain (as before they
+    became BTrees, so every commit rewrites them whole). Reports the bytes written by the
+    commits, the packed size, the object count and the memory needed to load every block
+    back, per transaction.
+
+    Usage: python3 -m benchmarks.tx_storage [number of blocks] [transactions per block]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+import persistent
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+import transaction
+import ZODB, ZODB.FileStorage
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+
+class PersistentTransactionOutput(persistent.Persistent):
+    """ Transaction output as stored before outputs became value types: its own database object. """
+
+    def __init__(self, sender, receiver, amount):
+        self.sender = sender
+        self.receiver = receiver
+        self.amount = amount
+
+    __repr__ = TransactionOutput.__repr__
+
+class PersistentTransaction(persistent.Persistent):
+    """ Transaction as stored before transactions became value types: its own database object,
+    holding a list of PersistentTransactionOutput. """
+
+    def __init__(self, input_refs, outputs):
+        self.input_refs = [OutPoint.from_string(ref) if isinstance(ref, str) else ref for ref in input_refs]
+        self.outputs = list(outputs)
+        self.txid = self.calculate_txid()
+
+    def __eq__(self, other):
+        return isinstance(other, PersistentTransaction) and self.txid == other.txid
+
+    def __hash__(self):
+        return hash(self.txid)
+
+    hash = Transaction.hash
+    calculate_txid = Transaction.calculate_txid
+    calculate_hash = Transaction.calculate_hash
+    is_valid = Transaction.is_valid
+    header = Transaction.header
+    __repr__ = Transaction.__repr__
+
+class DictIndexBlockchain(Blockchain):
+    """ Blockchain with its block and transaction indexes stored as plain dicts, as before they became BTrees. """
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = {}
+        self.blocks_spending_input = {}
+        self.blocks_containing_tx = {}
+        self.all_transactions = {}
+
+class BenchBlock(PoWBlock):
+    """ PoW block with a fixed target and no mining. """
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+    def seal_is_valid(self):
+        return True
+
+def generate_blocks(num_blocks, txs_per_block, tx_class, output_class, seed=0):
+    """ Generate a linear chain of blocks where every transaction spends one earlier output.
+
+    Args:
+        num_blocks (int): Number of blocks to generate (including genesis).
+        txs_per_block (int): Number of transactions in every non-genesis block.
+        tx_class (type): Class used to build transactions.
+        output_class (type): Class used to build transaction outputs.
+        seed (int, optional): Random seed, so both layouts store the same chain.
+
+    Returns:
+        (:obj:`list` of :obj:`Block`): Generated blocks in height order.
+    """
+    rng = random.Random(seed)
+    users = ["Alice", "Bob", "Charlie", "Dave", "Errol", "Frank"]
+    genesis_tx = tx_class([], [output_class("Genesis", user, 100000000) for user in users])
+    utxos = [(genesis_tx.hash + ":" + str(i), user, 100000000) for i, user in enumerate(users)]
+    blocks = [BenchBlock(0, [genesis_tx], "genesis", is_genesis=True, timestamp=0)]
+    for height in range(1, num_blocks):
+        txs = []
+        for i in range(txs_per_block):
+            input_ref, sender, amount = utxos.pop(rng.randrange(len(utxos)))
+            receiver = rng.choice(users)
+            amount_to_send = int(amount * rng.random())
+            tx = tx_class([input_ref], [output_class(sender, receiver, amount_to_send),
+                output_class(sender, sender, amount - amount_to_send)])
+            txs.append(tx)
+            utxos.append((tx.hash + ":0", receiver, amount_to_send))
+            utxos.append((tx.hash + ":1", sender, amount - amount_to_send))
+        blocks.append(BenchBlock(height, txs, blocks[-1].hash, timestamp=height))
+    return blocks
+
+def measure(blocks, chain_class, db_dir):
+    """ Add blocks to a fresh chain of class chain_class in a FileStorage, committing each, then reload them all
+    from a cold cache.
+
+    Returns:
+        (int, int, int, int, float): bytes written by the commits, packed file size in bytes, number of stored
+        objects, bytes allocated to load every block, and seconds spent adding the blocks.
+    """
+    path = os.path.join(db_dir, "bench.db")
+    db = ZODB.DB(ZODB.FileStorage.FileStorage(path))
+    connection = db.open()
+    connection.root.blockchain = chain_class()
+    transaction.commit()
+    chain = connection.root.blockchain
+    chaindb.chain = chain # validation reads the global chain
+    start = time.perf_counter()
+    for block in blocks:
+        assert chain.add_block(block)
+    elapsed = time.perf_counter() - start
+    written = os.path.getsize(path)
+    db.pack()
+    packed = os.path.getsize(path)
+    object_count = len(db.storage)
+    db.close()
+
+    tracemalloc.start()
+    db = ZODB.DB(ZODB.FileStorage.FileStorage(path, read_only=True), cache_size=10 ** 7)
+    connection = db.open()
+    before = tracemalloc.get_traced_memory()[0]
+    for block in connection.root.blockchain.blocks.values():
+        for tx in block.transactions:
+            for output in tx.outputs:
+                output.amount # unghost every object
+    loaded = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    db.close()
+    return written, packed, object_count, loaded, elapsed
+
+if __name__ == '__main__':
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    txs_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    num_txs = 1 + (num_blocks - 1) * txs_per_block
+
+    layouts = [("persistent txs (before)", PersistentTransaction, PersistentTransactionOutput, Blockchain),
+        ("value txs (after)", Transaction, TransactionOutput, Blockchain),
+        ("value txs, dict indexes", Transaction, TransactionOutput, DictIndexBlockchain)]
+    print("Chain of", num_blocks, "blocks,", num_txs, "transactions, one commit per block")
+    print("%-24s %12s %12s %10s %12s %10s" % ("layout", "written/tx", "packed/tx", "objects", "memory/tx", "add time"))
+    for name, tx_class, output_class, chain_class in layouts:
+        db_dir = tempfile.mkdtemp()
+        try:
+            # afresh, as stored blocks belong to their database
+            blocks = generate_blocks(num_blocks, txs_per_block, tx_class, output_class)
+            written, packed, object_count, loaded, elapsed = measure(blocks, chain_class, db_dir)
+        finally:
+            shutil.rmtree(db_dir)
+        print("%-24s %12.1f %12.1f %10d %12.1f %9.2fs" % (name, written / num_txs, packed / num_txs, object_count,
+            loaded / num_txs, elapsed))
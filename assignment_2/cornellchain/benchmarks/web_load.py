@@ -0,0 +1,148 @@
+""" Explorer load benchmark: requests per second from the Flask development server vs production serving
+    with gunicorn workers over a ZEO server, synchronous (WSGI) and asynchronous (ASGI; see webapp/server.py).
+
+    Builds a chain of full blocks in a temporary database, then, for each server, opens a number of event
+    streams that stay idle (as browser tabs on the explorer do), has client threads request random explorer
+    pages, best-chain pages, blocks and API heights for a while, and reports requests per second, the median
+    and 95th percentile latencies and failed or timed out requests. Production serving is skipped if gunicorn
+    or ZEO are not installed.
+
+    Usage: python3 -m benchmarks.web_load [blocks] [seconds per server] [client threads] [workers] [threads per worker]
+        [idle event streams]
+"""
+import os
+import sys
+import time
+import random
+import socket
+import threading
+import subprocess
+import urllib.request
+import importlib.util
+import tempfile
+import config
+config.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db") # never touch a real node database
+from blockchain import chaindb
+from benchmarks.checkpoints import build_chain
+from webapp import server
+
+DEV_PORT = 5099
+WEB_PORT = 8099
+ZEO_PORT = 9099
+#: Seconds before a request counts as failed
+REQUEST_TIMEOUT = 10
+
+def serve_dev(path, port):
+    """ Run the development server (as run_node.py does, without the reloader) on the database at path. """
+    config.DB_PATH = path
+    from webapp.app import app
+    app.run(port=port, debug=True, use_reloader=False)
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(base_url + "/api/tip").read()
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+def run_load(base_url, paths, seconds, num_clients):
+    """ Request random paths from num_clients threads for seconds; returns the sorted latencies and error count. """
+    latencies, errors = [], [0]
+    deadline = time.time() + seconds
+
+    def client(rng):
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + rng.choice(paths), timeout=REQUEST_TIMEOUT).read()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(random.Random(i),)) for i in range(num_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+def open_idle_streams(port, count):
+    """ Open count event streams that are never read from; returns their sockets. """
+    streams = []
+    for i in range(count):
+        stream = socket.create_connection(("127.0.0.1", port))
+        stream.sendall(b"GET /events HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        streams.append(stream)
+    time.sleep(1)
+    return streams
+
+def report(name, latencies, errors, seconds):
+    if not latencies:
+        print("%-32s no successful requests (%d errors)" % (name, errors))
+        return
+    print("%-32s %7.1f requests/s, median %6.1fms, p95 %6.1fms, %d errors" % (name, len(latencies) / seconds,
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, errors))
+
+def stop(process):
+    process.terminate()
+    process.wait()
+
+def measure(name, port, process, paths, seconds, num_clients, num_streams):
+    """ Load the server on port, run by process (which is stopped after), with num_streams idle event streams open. """
+    streams = []
+    try:
+        wait_until_up("http://127.0.0.1:" + str(port))
+        streams = open_idle_streams(port, num_streams)
+        report(name, *run_load("http://127.0.0.1:" + str(port), paths, seconds, num_clients), seconds)
+    finally:
+        for stream in streams:
+            stream.close()
+        stop(process)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "dev":
+        serve_dev(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    num_clients = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else config.WEB_WORKERS
+    threads = int(sys.argv[5]) if len(sys.argv) > 5 else config.WEB_THREADS
+    num_streams = int(sys.argv[6]) if len(sys.argv) > 6 else 0
+
+    blocks = build_chain(num_blocks, 5)
+    for block in blocks:
+        assert chaindb.chain.add_block(block, save=False)
+    chaindb.chain.commit()
+    block_hashes = [block.hash for block in blocks]
+    path = chaindb.storage.getName()
+    chaindb.connection.close()
+    chaindb.db.close()
+    rng = random.Random(0)
+    paths = []
+    for i in range(200):
+        height = rng.randrange(len(block_hashes))
+        paths += ["/?height=" + str(height), "/best?height=" + str(height), "/block/" + block_hashes[height],
+            "/api/heights/" + str(height)]
+    print("Blocks:", len(block_hashes), "distinct paths:", len(set(paths)), "clients:", num_clients,
+        "idle event streams:", num_streams, "for %.0fs each" % seconds)
+
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.web_load", "dev", path, str(DEV_PORT)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    measure("development server", DEV_PORT, process, paths, seconds, num_clients, num_streams)
+
+    if importlib.util.find_spec("gunicorn") is None or importlib.util.find_spec("ZEO") is None:
+        print("production serving skipped: needs the gunicorn and ZEO packages")
+        sys.exit(0)
+    zeo_server = server.start_zeo_server(path, ZEO_PORT)
+    try:
+        for asgi in (False, True):
+            process = server.start_gunicorn(0, False, WEB_PORT, workers, threads, ZEO_PORT, asgi)
+            measure("%d %s workers x %d threads" % (workers, "ASGI" if asgi else "WSGI", threads), WEB_PORT, process,
+                paths, seconds, num_clients, num_streams)
+    finally:
+        stop(zeo_server)
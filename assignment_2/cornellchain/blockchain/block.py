@@ -1,9 +1,65 @@
 from abc import ABC, abstractmethod # We want to make Block an abstract class; either a PoW or PoA block
 import blockchain
-from blockchain.util import sha256_2_string, encode_as_str
+from blockchain import shards
+from blockchain.util import sha256_2_string, encode_as_str, hash_from_hex
 import time
+import config
 import persistent
-from blockchain.util import nonempty_intersection
+import multiprocessing
+
+#: Worker pool for check_transactions; created on first use (see config.VALIDATION_PROCESSES)
+validation_pool = None
+
+def check_transaction(tx, spent_outputs):
+    """ Context-free checks on a single transaction: everything that needs only the transaction
+    itself and the outputs its inputs spend, so it can run in any process, in any order.
+
+    Args:
+        tx (:obj:`Transaction`): Transaction to check.
+        spent_outputs (:obj:`list` of :obj:`TransactionOutput`): Outputs spent by tx's inputs, in order;
+            None to run only the syntax check.
+
+    Returns:
+        str: Error message for the first failed check, or None if all checks pass.
+    """
+    if not tx.is_valid():
+        return "Malformed transaction included"
+    if spent_outputs is None:
+        return None
+    # every input was sent to the same user (would normally carry a signature from this user; we leave this out for simplicity) [test_user_consistency]
+    user_transacting = spent_outputs[0].receiver
+    for output in spent_outputs:
+        if output.receiver != user_transacting:
+            return "User inconsistencies"
+    # every output was sent from the same user (would normally carry a signature from this user; we leave this out for simplicity)
+    # (this MUST be the same user as the outputs are locked to above) [test_user_consistency]
+    for output in tx.outputs:
+        if output.sender != user_transacting:
+            return "User inconsistencies"
+    # the sum of the input values is at least the sum of the output values (no money created out of thin air) [test_no_money_creation]
+    if sum([output.amount for output in tx.outputs]) > sum([output.amount for output in spent_outputs]):
+        return "Creating money"
+    return None
+
+def check_transactions(check_args):
+    """ Run check_transaction over a block's transactions, on the validation process pool
+    when it is enabled and the block is large enough to be worth shipping to it.
+
+    Args:
+        check_args (:obj:`list` of (:obj:`Transaction`, :obj:`list` of :obj:`TransactionOutput`)): Arguments for each call.
+
+    Returns:
+        (:obj:`list` of str): Result of check_transaction for each transaction, in order.
+    """
+    global validation_pool
+    processes = config.VALIDATION_PROCESSES
+    if not processes or len(check_args) < config.PARALLEL_VALIDATION_MIN_TXS:
+        return [check_transaction(*args) for args in check_args]
+    if validation_pool is None or validation_pool._processes != processes:
+        if validation_pool is not None:
+            validation_pool.terminate()
+        validation_pool = multiprocessing.Pool(processes)
+    return validation_pool.starmap(check_transaction, check_args, chunksize=max(1, len(check_args) // (4 * processes)))
 
 class Block(ABC, persistent.Persistent):
 
@@ -82,6 +138,16 @@ class Block(ABC, persistent.Persistent):
         """
         return sha256_2_string(str(self.header()))
 
+    @property
+    def digest(self):
+        """ bytes: Raw form of self.hash, used as the block's key in chain indexes (None if malformed). """
+        return hash_from_hex(self.hash)
+
+    @property
+    def parent_digest(self):
+        """ bytes: Raw form of self.parent_hash, used to look up the parent in chain indexes (None if malformed). """
+        return hash_from_hex(self.parent_hash)
+
     def __repr__(self):
         """ Get a full representation of a block as string, for debugging purposes; includes all transactions.
 
@@ -100,30 +166,19 @@ class Block(ABC, persistent.Persistent):
         self.seal_data = seal_data
         self.hash = self.calculate_hash()
 
-    def is_valid(self):
-        """ Check whether block is fully valid according to block rules.
-
-        Includes checking for no double spend, that all transactions are valid, that all header fields are correctly
-        computed, etc.
+    def validate_header(self):
+        """ Check the block rules that need only the block header, not the transactions.
+        Cheap enough to run on every block (or bare header) received, before the transactions
+        are parsed; is_valid runs these checks too.
 
         Returns:
-            bool, str: True if block is valid, False otherwise plus an error or success message.
+            bool, str: True if the header is valid, False otherwise plus an error or success message.
         """
+        chain = blockchain.chaindb.chain
 
-        chain = blockchain.chaindb.chain # This object of type Blockchain may be useful
-
-        # Solution for (1a)
-
-        # (checks that apply to all blocks)
-        # Check that Merkle root calculation is consistent with transactions in block (use the calculate_merkle_root function) [test_rejects_invalid_merkle]
-        if not (self.merkle == self.calculate_merkle_root()):
-            return False, "Merkle root failed to match"
         # Check that block.hash is correctly calculated [test_rejects_invalid_hash]
         if not (self.hash == self.calculate_hash()):
             return False, "Hash failed to match"
-        # Check that there are at most 900 transactions in the block [test_rejects_too_many_txs]
-        if len(self.transactions) > 900:
-            return False, "Too many transactions"
 
         # (checks that apply to genesis block)
         if self.is_genesis:
@@ -133,96 +188,191 @@ class Block(ABC, persistent.Persistent):
             if not (self.parent_hash == "genesis"):
                 return False, "Invalid genesis"
 
+        # Check that blocks at checkpoint heights are the checkpointed blocks
+        if config.CHECKPOINTS and dict(config.CHECKPOINTS).get(self.height, self.hash) != self.hash:
+            return False, "Checkpoint mismatch"
+
         # (checks that apply only to non-genesis blocks)
         if not self.is_genesis:
             # Check that parent exists [test_nonexistent_parent]
-            if not self.parent_hash in chain.blocks:
+            index = chain.block_index
+            parent_id = index.lookup(self.parent_digest)
+            if parent_id is None:
                 return False, "Nonexistent parent"
-            parent_block = chain.blocks[self.parent_hash]
             # Check that height is correct w.r.t. parent height [test_bad_height]
-            if not (self.height == parent_block.height + 1):
+            if not (self.height == index.heights[parent_id] + 1):
                 return False, "Invalid height"
             # Check that timestamp is non-decreasing [test_bad_timestamp]
-            if self.timestamp < parent_block.timestamp:
+            if self.timestamp < index.timestamps[parent_id]:
                 return False, "Invalid timestamp"
             # Check that seal is correctly computed and satisfies "target" requirements [test_bad_seal]
             if not self.seal_is_valid():
                 return False, "Invalid seal"
+        return True, "Header checks passed"
+
+    def is_assumed_valid(self):
+        """ Check whether a checkpoint in config.CHECKPOINTS vouches for this block: the checkpointed
+        block is already known to the chain (eg its header, from a snapshot) and this block is its
+        ancestor. Such blocks skip transaction checks. A block on any other branch, or below a
+        checkpoint that is not known yet, is validated fully, since it may never be reorged away.
+
+        Returns:
+            bool: True if transaction checks can be skipped for this block.
+        """
+        if not config.CHECKPOINTS:
+            return False
+        digest = self.digest
+        index = blockchain.chaindb.chain.block_index
+        for height, block_hash in config.CHECKPOINTS:
+            if height < self.height:
+                continue
+            checkpoint_id = index.lookup(hash_from_hex(block_hash))
+            if checkpoint_id is None:
+                continue # not known yet, so its ancestry cannot be checked
+            ancestor_id = index.ancestor(checkpoint_id, self.height)
+            if ancestor_id != -1 and index.digest(ancestor_id) == digest:
+                return True
+        return False
+
+    def is_valid(self):
+        """ Check whether block is fully valid according to block rules.
+
+        Includes checking for no double spend, that all transactions are valid, that all header fields are correctly
+        computed, etc.
+
+        Returns:
+            bool, str: True if block is valid, False otherwise plus an error or success message.
+        """
+
+        chain = blockchain.chaindb.chain # This object of type Blockchain may be useful
+
+        # Solution for (1a)
+
+        # (checks that apply to all blocks)
+        # Check that Merkle root calculation is consistent with transactions in block (use the calculate_merkle_root function) [test_rejects_invalid_merkle]
+        if not (self.merkle == self.calculate_merkle_root()):
+            return False, "Merkle root failed to match"
+        # Check that there are at most 900 transactions in the block [test_rejects_too_many_txs]
+        if len(self.transactions) > 900:
+            return False, "Too many transactions"
+        # Check the header on its own (hash, genesis rules, parent, height, timestamp, seal)
+        header_valid, reason = self.validate_header()
+        if not header_valid:
+            return False, reason
+
+        # (checks that apply only to non-genesis blocks, unless a checkpoint vouches for their transactions)
+        if not self.is_genesis and not self.is_assumed_valid():
+            parent_digest = self.parent_digest
+            # Resolve every input to the output it spends, checking conflicts and ordering serially
+            # (these depend on the chain and on earlier transactions in this block)
+            index = chain.block_index
+            parent_id = index.lookup(parent_digest)
+            spent_outputs = None # spent_outputs[i] is the list of outputs spent by transaction i
+            conflict = None
+            if chain.snapshot_base is not None and not index.is_ancestor(index.lookup(chain.snapshot_base), parent_id):
+                # there is no undo data below a snapshot, so its tip can never be disconnected
+                return False, "Forks below snapshot"
+            if chain.finalized is not None and not index.is_ancestor(index.lookup(chain.finalized), parent_id):
+                # every branch off the finalized chain has been pruned, and can never become the best chain
+                return False, "Forks below finalized block"
+            if chain.pruned_height >= 0:
+                pruned_id = index.ancestor(parent_id, chain.pruned_height)
+                if pruned_id == -1 or not index.is_in_main_chain(pruned_id):
+                    # the transactions and undo data a fork there would need have been pruned
+                    return False, "Forks below pruned blocks"
+            if parent_digest == chain.tip:
+                # blocks extending the tip can resolve their inputs against the unspent outputs there
+                # (sharded across processes if configured); if any input is missing, the serial pass
+                # below finds the exact error
+                if config.VALIDATION_SHARDS:
+                    spent_outputs = shards.get_coordinator().resolve(chain, self.transactions)
+                else:
+                    spent_outputs = shards.resolve_from_utxos(chain, self.transactions)
+            elif chain.snapshot_base is not None:
+                # the transactions below a snapshot are not indexed, so side branches resolve their inputs
+                # against the unspent outputs too, as they stand at the parent
+                spent_outputs = shards.resolve_from_utxos(chain, self.transactions, chain.branch_utxo_changes(parent_digest))
+            if spent_outputs is None:
+                txs_in_block = {} # same-block dependencies: inputs may only spend outputs of earlier transactions
+                inputs_spent_in_block = set()
+                spent_outputs = []
+                for tx in self.transactions:
+                    conflict = self.resolve_inputs(tx, chain, index, parent_id, txs_in_block, inputs_spent_in_block)
+                    if isinstance(conflict, str):
+                        break
+                    spent_outputs.append(conflict)
+                    txs_in_block[tx.txid] = tx
+                    conflict = None
+
+            # Context-free checks need only the transaction and the outputs it spends, so they can run
+            # in parallel; transactions after a conflict get the syntax check only
+            check_args = [(tx, spent_outputs[i] if i < len(spent_outputs) else None) for i, tx in enumerate(self.transactions)]
+            errors = check_transactions(check_args)
             # Check that all transactions within are valid (use tx.is_valid) [test_malformed_txs]
-            for tx in self.transactions:
-                if not tx.is_valid():
-                    return False, "Malformed transaction included"
-
-            # Check that for every transaction
-            txs_in_block = {}
-            inputs_spent_in_block = []
-            blocks_in_chain = chain.get_chain_ending_with(self.parent_hash)
-            for tx in self.transactions:
-                user_transacting = None
-                # the transaction has not already been included on a block on the same blockchain as this block [test_double_tx_inclusion_same_chain]
-                if nonempty_intersection(blocks_in_chain, chain.blocks_containing_tx.get(tx.hash, [])):
-                    return False, "Double transaction inclusion"
-                # (or twice in this block; you will have to check this manually) [test_double_tx_inclusion_same_block]
-                if tx.hash in txs_in_block:
-                    return False, "Double transaction inclusion"
-                # for every input ref in the tx
-                total_amount_input = 0
-                for input_ref in tx.input_refs:
-                    input_tx_hash = input_ref.split(":")[0]
-                    input_index = int(input_ref.split(":")[1])
-
-                    # each input_ref is valid (aka can be looked up in its holding transaction) [test_failed_input_lookup]
-                    if input_tx_hash in txs_in_block:
-                        candidate_tx = txs_in_block[input_tx_hash]
-                    elif input_tx_hash in chain.all_transactions:
-                        candidate_tx = chain.all_transactions[input_tx_hash]
-                    else:
-                        return False, "Required output not found"
-                    if not input_index < len(candidate_tx.outputs):
-                        return False, "Required output not found"
-                    output_for_input = candidate_tx.outputs[input_index]
-                    total_amount_input += output_for_input.amount
-
-                    # every input was sent to the same user (would normally carry a signature from this user; we leave this out for simplicity) [test_user_consistency]
-                    if user_transacting == None:
-                        user_transacting = output_for_input.receiver
-                    else:
-                        if not output_for_input.receiver == user_transacting:
-                            return False, "User inconsistencies"
-
-                    # no input_ref has been spent in a previous block on this chain [test_doublespent_input_same_chain]
-                    if nonempty_intersection(blocks_in_chain, chain.blocks_spending_input.get(input_ref, [])):
-                        return False, "Double-spent input"
-                    # (or in this block; you will have to check this manually) [test_doublespent_input_same_block]
-                    if input_ref in inputs_spent_in_block:
-                        return False, "Double-spent input"
-                    # each input_ref points to a transaction on the same blockchain as this block [test_input_txs_on_chain]
-                    if nonempty_intersection(blocks_in_chain, chain.blocks_containing_tx.get(input_tx_hash, [])):
-                        inputs_spent_in_block.append(input_ref)
-                        continue
-                    # (or in this block; you will have to check this manually) [test_input_txs_in_block]
-                    if input_tx_hash in txs_in_block:
-                        inputs_spent_in_block.append(input_ref)
-                        continue
-                    return False, "Input transaction not found"
-
-                total_amount_output = 0
-                for output in tx.outputs:
-                    # every output was sent from the same user (would normally carry a signature from this user; we leave this out for simplicity)
-                    # (this MUST be the same user as the outputs are locked to above) [test_user_consistency]
-                    if (output.sender != user_transacting):
-                        return False, "User inconsistencies"
-                    total_amount_output += output.amount
-                # the sum of the input values is at least the sum of the output values (no money created out of thin air) [test_no_money_creation]
-                if total_amount_output > total_amount_input:
-                    return False, "Creating money"
-                txs_in_block[tx.hash] = tx
+            if "Malformed transaction included" in errors:
+                return False, "Malformed transaction included"
+            for error in errors[:len(spent_outputs)]:
+                if error is not None:
+                    return False, error
+            if conflict is not None:
+                return False, conflict
         return True, "All checks passed"
 
         # Placeholder for (1a)
         return True, "All checks passed"
 
 
+    def resolve_inputs(self, tx, chain, index, parent_id, txs_in_block, inputs_spent_in_block):
+        """ Contextual checks for one transaction of this block, in block order.
+
+        Args:
+            tx (:obj:`Transaction`): Transaction to check.
+            chain (:obj:`Blockchain`): Chain the block is being added to.
+            index (:obj:`BlockIndex`): The chain's block index.
+            parent_id (int): Id of this block's parent in index.
+            txs_in_block (:obj:`dict` of (bytes to :obj:`Transaction`)): Earlier transactions in this block.
+            inputs_spent_in_block (:obj:`set` of :obj:`OutPoint`): Inputs spent by earlier transactions in this block;
+                the inputs of tx are added on success.
+
+        Returns:
+            (:obj:`list` of :obj:`TransactionOutput`): outputs spent by tx, or an error message (str) on failure.
+        """
+        # the transaction has not already been included on a block on the same blockchain as this block [test_double_tx_inclusion_same_chain]
+        if chain.chain_contains_any(parent_id, chain.blocks_containing(tx.txid)):
+            return "Double transaction inclusion"
+        # (or twice in this block; you will have to check this manually) [test_double_tx_inclusion_same_block]
+        if tx.txid in txs_in_block:
+            return "Double transaction inclusion"
+        # for every input ref in the tx
+        outputs = []
+        for input_ref in tx.input_refs:
+            input_tx_hash = input_ref.txid
+            input_index = input_ref.index
+
+            # each input_ref is valid (aka can be looked up in its holding transaction) [test_failed_input_lookup]
+            if input_tx_hash in txs_in_block:
+                candidate_tx = txs_in_block[input_tx_hash]
+            elif isinstance(input_tx_hash, bytes) and input_tx_hash in chain.all_transactions:
+                candidate_tx = chain.all_transactions[input_tx_hash]
+            else:
+                return "Required output not found"
+            if not input_index < len(candidate_tx.outputs):
+                return "Required output not found"
+            outputs.append(candidate_tx.outputs[input_index])
+
+            # no input_ref has been spent in a previous block on this chain [test_doublespent_input_same_chain]
+            if chain.chain_contains_any(parent_id, chain.blocks_spending(input_ref)):
+                return "Double-spent input"
+            # (or in this block; you will have to check this manually) [test_doublespent_input_same_block]
+            if input_ref in inputs_spent_in_block:
+                return "Double-spent input"
+            # each input_ref points to a transaction on the same blockchain as this block [test_input_txs_on_chain]
+            # (or in this block; you will have to check this manually) [test_input_txs_in_block]
+            if not (input_tx_hash in txs_in_block or chain.chain_contains_any(parent_id, chain.blocks_containing(input_tx_hash))):
+                return "Input transaction not found"
+            inputs_spent_in_block.add(input_ref)
+        return outputs
+
     # ( these just establish methods for subclasses to implement; no need to modify )
     @abstractmethod
     def get_weight(self):
@@ -1,14 +1,60 @@
 import config
+import contextlib
 from blockchain.chaindb.chain import Blockchain
-import ZODB, ZODB.FileStorage
+from blockchain.chaindb.storages import open_storage
+from blockchain import metrics
+import ZODB, ZODB.DemoStorage
 import transaction
 
 # Setup db and make module globals available
-storage = ZODB.FileStorage.FileStorage(config.DB_PATH)
+storage = open_storage()
 db = ZODB.DB(storage)
+db.setActivityMonitor(metrics.database_monitor) # counts the objects each connection loads
 connection = db.open()
 if not hasattr(connection.root, "blockchain"):
     connection.root.blockchain = Blockchain()
     transaction.commit()
 
 chain = connection.root.blockchain
+
+def compact(database=None):
+    """ Pack a database, discarding old object revisions and everything no longer reachable
+    (eg blocks and transactions dropped by Blockchain.prune_spent or Blockchain.finalize).
+
+    Args:
+        database (:obj:`ZODB.DB`, optional): Database to pack; defaults to the chain database.
+
+    Returns:
+        int, int: storage size in bytes before and after packing.
+    """
+    if database is None:
+        database = db
+    size_before = database.storage.getSize()
+    database.pack()
+    return size_before, database.storage.getSize()
+
+@contextlib.contextmanager
+def overlay():
+    """ Open a scratch copy of the chain database: a DemoStorage over the chain's storage, which keeps
+    every change made through it in memory and never writes to the base database. Within the block,
+    chain (and so block validation) refers to the scratch copy, so candidate blocks can be added and
+    checked with the usual Blockchain API; everything is discarded on exit.
+
+    Commit or abort pending changes to the chain before opening an overlay; the current transaction
+    is aborted on exit.
+
+    Yields:
+        (:obj:`Blockchain`): the scratch copy of the committed chain.
+    """
+    global chain
+    base_chain = chain
+    scratch_db = ZODB.DB(ZODB.DemoStorage.DemoStorage(base=storage, close_base_on_close=False))
+    scratch_connection = scratch_db.open()
+    chain = scratch_connection.root.blockchain
+    try:
+        yield chain
+    finally:
+        transaction.abort()
+        chain = base_chain
+        scratch_connection.close()
+        scratch_db.close()
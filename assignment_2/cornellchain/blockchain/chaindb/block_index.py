@@ -0,0 +1,286 @@
+import copy
+from array import array
+
+#: Largest fraction of BlockIndex.table slots in use before it is grown
+MAX_LOAD = 0.75
+
+#: Marks a cumulative weight too large for a signed 64-bit slot; the real value lives in BlockIndex.big_weights
+BIG_WEIGHT = -1
+
+def invert_lowest_one(n):
+    """ Clear the lowest set bit of n. """
+    return n & (n - 1)
+
+def skip_height(height):
+    """ Height of the ancestor that a block at the given height keeps a skip pointer to.
+    Same scheme as Bitcoin's CBlockIndex::pskip, so any ancestor is reachable in O(log n) hops.
+
+    Args:
+        height (int): Height of the block.
+
+    Returns:
+        int: Height of the skip target.
+    """
+    if height < 2:
+        return 0
+    if height & 1:
+        return invert_lowest_one(invert_lowest_one(height - 1)) + 1
+    return invert_lowest_one(height)
+
+class BlockIndex:
+
+    def __init__(self):
+        """ Compact in-memory index of every block header in the chain database.
+        Blocks are addressed by a dense integer id (their insertion order) and every field
+        lives in a typed array (4 bytes for ids, heights and target positions), so the index
+        costs about 75 bytes per block and fork choice never has to load a Block object.
+
+        Attributes:
+            hashes (bytearray): Raw 32-byte digests, block id i at offset 32 * i.
+            heights (:obj:`array` of int): Block heights.
+            parents (:obj:`array` of int): Id of each block's parent, -1 for genesis (or unknown parents).
+            skips (:obj:`array` of int): Id of an earlier ancestor (see skip_height), -1 if none.
+            timestamps (:obj:`array` of float): Block timestamps.
+            target_ids (:obj:`array` of int): Position of each block's target in targets.
+            targets (:obj:`list` of int): Distinct targets seen (targets exceed 64 bits, but rarely change).
+            target_positions (:obj:`dict` of (int to int)): Position of each distinct target in targets.
+            weights (:obj:`array` of int): Cumulative weight from genesis, or BIG_WEIGHT if it overflows.
+            big_weights (:obj:`dict` of (int to int)): Cumulative weights that overflow the weights array.
+            table (:obj:`array` of int): Open-addressing hash table of block ids, keyed by digest; kept between
+                half and three quarters full (see MAX_LOAD).
+            best (int): Id of the block with the most accumulated weight, -1 if empty.
+            main_chain (:obj:`array` of int): Maps each height to the id of the block at that height
+                on the chain ending in best.
+        """
+        self.hashes = bytearray()
+        self.heights = array('i')
+        self.parents = array('i')
+        self.skips = array('i')
+        self.timestamps = array('d')
+        self.target_ids = array('i')
+        self.targets = []
+        self.target_positions = {}
+        self.weights = array('q')
+        self.big_weights = {}
+        self.table = array('i', [-1]) * 1024
+        self.best = -1
+        self.main_chain = array('i')
+
+    def __len__(self):
+        return len(self.heights)
+
+    def copy(self):
+        """ Get an independent copy of the index, so one can change without affecting the other. """
+        index = BlockIndex.__new__(BlockIndex)
+        for name, value in self.__dict__.items():
+            index.__dict__[name] = copy.copy(value) # arrays, lists and dicts of numbers, so one level deep is enough
+        return index
+
+    def __contains__(self, digest):
+        return self.lookup(digest) is not None
+
+    def digest(self, block_id):
+        """ Get the raw digest of a block id. """
+        return bytes(self.hashes[32 * block_id:32 * block_id + 32])
+
+    def lookup(self, digest):
+        """ Get the id of a block from its raw digest.
+
+        Args:
+            digest (bytes): Raw 32-byte block hash.
+
+        Returns:
+            int: The block id, or None if the block is not indexed.
+        """
+        if digest is None or len(digest) != 32:
+            return None
+        size = len(self.table)
+        # digests are uniformly random, so their leading bytes make a fine table hash
+        slot = int.from_bytes(digest[:8], "little") % size
+        while True:
+            block_id = self.table[slot]
+            if block_id == -1:
+                return None
+            if self.hashes[32 * block_id:32 * block_id + 32] == digest:
+                return block_id
+            slot = (slot + 1) % size
+
+    def weight(self, block_id):
+        """ Get the total weight accumulated from genesis up to and including a block. """
+        weight = self.weights[block_id]
+        if weight == BIG_WEIGHT:
+            return self.big_weights[block_id]
+        return weight
+
+    def target(self, block_id):
+        """ Get the target of a block. """
+        return self.targets[self.target_ids[block_id]]
+
+    def add_block(self, block):
+        """ Index a block's header; see add. """
+        return self.add(block.digest, block.parent_digest, block.height, block.timestamp, block.target, block.get_weight())
+
+    def add(self, digest, parent_digest, height, timestamp, target, weight):
+        """ Add a block header to the index, updating the best tip.
+
+        Args:
+            digest (bytes): Raw hash of the block.
+            parent_digest (bytes): Raw hash of the parent (None for genesis).
+            height (int): Height of the block.
+            timestamp (float): Timestamp of the block.
+            target (int): Target of the block.
+            weight (int): Consensus weight of the block alone.
+
+        Returns:
+            int: The id assigned to the block.
+        """
+        block_id = self.lookup(digest)
+        if block_id is not None:
+            return block_id
+        block_id = len(self.heights)
+        parent = self.lookup(parent_digest)
+        if parent is None:
+            parent = -1
+
+        if not target in self.target_positions:
+            self.target_positions[target] = len(self.targets)
+            self.targets.append(target)
+        cumulative_weight = weight
+        if parent != -1:
+            cumulative_weight += self.weight(parent)
+        skip = self.ancestor(parent, skip_height(height))
+        if skip != -1 and self.heights[skip] != skip_height(height):
+            skip = -1 # only happens below blocks added without their parents
+
+        self.hashes += digest
+        self.heights.append(height)
+        self.parents.append(parent)
+        self.skips.append(skip)
+        self.timestamps.append(timestamp)
+        self.target_ids.append(self.target_positions[target])
+        if 0 <= cumulative_weight < 2 ** 63:
+            self.weights.append(cumulative_weight)
+        else:
+            self.weights.append(BIG_WEIGHT)
+            self.big_weights[block_id] = cumulative_weight
+
+        if len(self.heights) > MAX_LOAD * len(self.table):
+            self.resize_table(2 * len(self.heights)) # back to half full
+        else:
+            self.insert_into_table(block_id)
+        if self.is_heavier(block_id, self.best):
+            self.set_best(block_id)
+        return block_id
+
+    def insert_into_table(self, block_id):
+        size = len(self.table)
+        slot = int.from_bytes(self.hashes[32 * block_id:32 * block_id + 8], "little") % size
+        while self.table[slot] != -1:
+            slot = (slot + 1) % size
+        self.table[slot] = block_id
+
+    def resize_table(self, size):
+        self.table = array('i', [-1]) * size
+        for block_id in range(len(self.heights)):
+            self.insert_into_table(block_id)
+
+    def set_best(self, block_id):
+        """ Make a block the best tip, rewriting main_chain only from the fork point upward
+        (so extending the current tip costs O(1), and a reorg costs O(depth)).
+        """
+        new_branch = []
+        walk = block_id
+        while walk != -1 and not self.is_in_main_chain(walk):
+            new_branch.append(walk)
+            walk = self.parents[walk]
+        fork_height = self.heights[walk] if walk != -1 else -1
+        del self.main_chain[fork_height + 1:]
+        for branch_id in reversed(new_branch):
+            while len(self.main_chain) < self.heights[branch_id]:
+                self.main_chain.append(-1) # gap below a block added without its parents
+            self.main_chain.append(branch_id)
+        self.best = block_id
+
+    def is_in_main_chain(self, block_id):
+        """ Check in O(1) whether a block is on the chain ending in the best tip. """
+        height = self.heights[block_id]
+        return height < len(self.main_chain) and self.main_chain[height] == block_id
+
+    def is_heavier(self, block_id, other_id):
+        """ Fork choice: True if block_id should be preferred as tip over other_id.
+        Most total weight wins; ties go to the lower block, then to the newer one
+        (the order get_heaviest_chain_tip has always used).
+        """
+        if other_id == -1:
+            return True
+        weight, other_weight = self.weight(block_id), self.weight(other_id)
+        if weight != other_weight:
+            return weight > other_weight
+        return self.heights[block_id] <= self.heights[other_id]
+
+    def ancestor(self, block_id, height):
+        """ Get the ancestor of a block at a given height in O(log n), following skip pointers.
+
+        Args:
+            block_id (int): Block to start from.
+            height (int): Height of the desired ancestor.
+
+        Returns:
+            int: Id of the ancestor (block_id itself at its own height), -1 if there is none.
+        """
+        if block_id == -1 or height < 0 or height > self.heights[block_id]:
+            return -1
+        walk = block_id
+        walk_height = self.heights[walk]
+        while walk_height > height:
+            height_skip = skip_height(walk_height)
+            height_skip_prev = skip_height(walk_height - 1)
+            skip = self.skips[walk]
+            # only take the skip if the parent's skip wouldn't get us closer
+            if skip != -1 and (height_skip == height or (height_skip > height and
+                    not (height_skip_prev < height_skip - 2 and height_skip_prev >= height))):
+                walk = skip
+            else:
+                walk = self.parents[walk]
+            if walk == -1:
+                return -1
+            walk_height = self.heights[walk]
+        return walk if walk_height == height else -1
+
+    def is_ancestor(self, ancestor_id, block_id):
+        """ Check whether ancestor_id is on the chain ending in block_id (a block is its own ancestor).
+
+        O(1) when both blocks are on the main chain, O(log n) otherwise.
+        """
+        if ancestor_id == -1 or block_id == -1:
+            return False
+        if self.is_in_main_chain(block_id):
+            return self.is_in_main_chain(ancestor_id) and self.heights[ancestor_id] <= self.heights[block_id]
+        return self.ancestor(block_id, self.heights[ancestor_id]) == ancestor_id
+
+    def last_common_ancestor(self, block_id, other_id):
+        """ Get the highest block that is an ancestor of both blocks (the fork point), in O(log n).
+
+        Returns:
+            int: Id of the common ancestor, -1 if the blocks share none.
+        """
+        if block_id == -1 or other_id == -1:
+            return -1
+        height = min(self.heights[block_id], self.heights[other_id])
+        block_id = self.ancestor(block_id, height)
+        other_id = self.ancestor(other_id, height)
+        while block_id != other_id and block_id != -1 and other_id != -1:
+            skip, other_skip = self.skips[block_id], self.skips[other_id]
+            if skip != -1 and other_skip != -1 and skip != other_skip:
+                block_id, other_id = skip, other_skip
+            else:
+                block_id, other_id = self.parents[block_id], self.parents[other_id]
+        if block_id != other_id:
+            return -1
+        return block_id
+
+    def chain_ending_with(self, block_id):
+        """ Iterate over the ids of a block and all its ancestors, down to genesis. """
+        while block_id != -1:
+            yield block_id
+            block_id = self.parents[block_id]
@@ -0,0 +1,129 @@
+""" Streaming block files, for moving a chain between nodes block by block.
+
+    File layout: MAGIC, the block class name and a newline, then one record per block in
+    height order (so parents always come before their children):
+        height (4 bytes, big-endian), length (4 bytes, big-endian), block string (utf8, str(block))
+    Block strings are the p2p wire format, parsed back with string_to_block. Records are
+    written and read one at a time, so memory use does not depend on the chain length.
+"""
+import time
+import struct
+from blockchain.pow_block import PoWBlock
+from blockchain.poa_block import PoABlock
+from p2p.interfaces.block import string_to_block
+
+MAGIC = b"CORNELLCHAIN BLOCKS 1\n"
+RECORD_HEADER = struct.Struct(">II")
+#: Block classes an import can build from the name stored in the file
+BLOCK_CLASSES = {"PoWBlock": PoWBlock, "PoABlock": PoABlock}
+
+def release_memory(chain):
+    """ Let the database cache drop blocks that are no longer needed (no-op outside a database). """
+    if chain._p_jar is not None:
+        chain._p_jar.cacheGC()
+
+def export_blocks(chain, out_file, from_height=0, batch_size=1000):
+    """ Write every block with a body at or above a height to a block file.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain to export.
+        out_file (file): Binary file to write to.
+        from_height (int, optional): Lowest height to export.
+        batch_size (int, optional): Blocks between database cache cleanups.
+
+    Returns:
+        int, int, float: blocks written, bytes written and seconds taken.
+    """
+    start = time.perf_counter()
+    blocks = 0
+    block_class = None
+    size = 0
+    for height in chain.get_heights_with_blocks(from_height):
+        for digest in chain.chain[height]:
+            block = chain.blocks.get(digest)
+            if block is None:
+                continue # header only (below a snapshot)
+            if block_class is None:
+                block_class = type(block).__name__
+                size += out_file.write(MAGIC + block_class.encode("utf8") + b"\n")
+            data = str(block).encode("utf8")
+            size += out_file.write(RECORD_HEADER.pack(height, len(data)) + data)
+            blocks += 1
+            if blocks % batch_size == 0:
+                release_memory(chain)
+    if block_class is None:
+        size += out_file.write(MAGIC + b"\n") # no blocks
+    return blocks, size, time.perf_counter() - start
+
+def read_blocks(in_file, from_height=0, blockclass=None):
+    """ Parse a block file lazily, one block at a time.
+
+    Args:
+        in_file (file): Binary file to read from.
+        from_height (int, optional): Skip (without parsing) blocks below this height.
+        blockclass (:obj:`Block`, optional): Class to parse blocks as; defaults to the one named in the file.
+
+    Yields:
+        :obj:`Block`: each parsed block, in file order.
+
+    Raises:
+        ValueError: If the file is not a block file, is truncated or holds an unparseable block.
+    """
+    if in_file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a block file")
+    class_name = in_file.readline().strip().decode("utf8")
+    if blockclass is None:
+        if class_name and not class_name in BLOCK_CLASSES:
+            raise ValueError("unknown block class " + class_name)
+        blockclass = BLOCK_CLASSES.get(class_name, PoWBlock)
+    while True:
+        record_header = in_file.read(RECORD_HEADER.size)
+        if len(record_header) == 0:
+            return
+        if len(record_header) < RECORD_HEADER.size:
+            raise ValueError("truncated block file")
+        height, length = RECORD_HEADER.unpack(record_header)
+        if height < from_height:
+            in_file.seek(length, 1)
+            continue
+        data = in_file.read(length)
+        if len(data) < length:
+            raise ValueError("truncated block file")
+        block = string_to_block(data.decode("utf8"), blockclass)
+        if not block:
+            raise ValueError("unparseable block at height " + str(height))
+        yield block
+
+def import_blocks(chain, in_file, from_height=0, batch_size=1000, blockclass=None, save=True):
+    """ Add the blocks in a block file to a chain, through Blockchain.add_blocks in batches
+    (each committed on its own, so an interrupted import can resume from chain.max_height).
+
+    Args:
+        chain (:obj:`Blockchain`): Chain to add the blocks to.
+        in_file (file): Binary file to read from.
+        from_height (int, optional): Skip blocks below this height.
+        batch_size (int, optional): Blocks per add_blocks call (and commit).
+        blockclass (:obj:`Block`, optional): Class to parse blocks as; defaults to the one named in the file.
+        save (bool, optional): Whether to commit each batch to the database (defaults to True)
+
+    Returns:
+        int, int, int, float: blocks read, blocks added (invalid and known blocks are skipped),
+        bytes read and seconds taken.
+
+    Raises:
+        ValueError: If the file is not a block file, is truncated or holds an unparseable block
+            (batches before the error stay committed).
+    """
+    start = time.perf_counter()
+    start_position = in_file.tell()
+    read = added = 0
+    batch = []
+    for block in read_blocks(in_file, from_height, blockclass):
+        batch.append(block)
+        read += 1
+        if len(batch) == batch_size:
+            added += chain.add_blocks(batch, save=save)
+            batch = []
+            release_memory(chain)
+    added += chain.add_blocks(batch, save=save)
+    return read, added, in_file.tell() - start_position, time.perf_counter() - start
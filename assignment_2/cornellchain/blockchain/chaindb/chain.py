@@ -1,71 +1,737 @@
 import os
+import time
 import config
 import blockchain
-from blockchain.util import encode_as_str
+from blockchain.util import encode_as_str, hash_from_hex
+from blockchain.transaction import OutPoint
+from blockchain.chaindb.block_index import BlockIndex
+from blockchain import events, metrics
 import transaction, persistent
+from BTrees.IOBTree import IOBTree
+from BTrees.OOBTree import OOBTree
+
+#: Block indexes of chains stored in a database, by (storage name, object id of the chain): (serial of the chain
+#: object they reflect, the index). Reopening the database reloads blockchain.chaindb but not this module, so a
+#: chain reloaded unchanged since its index was last built or saved gets a copy rather than rebuilding it
+block_indexes = {}
 
 class Blockchain(persistent.Persistent):
 
     def __init__(self):
         """ Create a new Blockchain object; we store 1 globally in the database.
+        All indexes are keyed by raw 32-byte digests (see Block.digest and Transaction.txid);
+        the accessor methods below take and return hex strings for the UI and p2p layers.
 
         Attributes:
-            chain (:obj:`dict` of (int to (:obj:`list` of str))): Maps integer chain heights to list of block hashes at that height in the DB (as strings).
-            blocks (:obj:`dict` of (str to (:obj:`Block`))): Maps blockhashes to their corresponding Block objects in the DB.
-            blocks_spending_input (:obj:`dict` of (str to (:obj:`list` of str))): Maps input references as strings to all blocks in the DB that spent them as list of their hashes.
-            blocks_containing_tx (:obj:`dict` of (str to (:obj:`list` of str))): Maps transaction hashes to all blocks in the DB that spent them as list of their hashes.
-            all_transactions (:obj:`dict` of (str to :obj:`Transaction`)): Maps transaction hashes to their corresponding Transaction objects.
-        """
-        self.chain = {}
-        self.blocks = {}
-        self.blocks_spending_input = {}
-        self.blocks_containing_tx = {}
-        self.all_transactions = {}
+            chain (:obj:`IOBTree` of (int to (:obj:`tuple` of bytes))): Maps integer chain heights to the digests of blocks at that height in the DB, oldest first.
+                Kept sorted, so height ranges can be walked in either direction without copying or sorting.
+            max_height (int): Greatest height in chain, or -1 if the chain is empty.
+            blocks (:obj:`OOBTree` of (bytes to (:obj:`Block`))): Maps block digests to their corresponding Block objects in the DB.
+            blocks_spending_input (:obj:`OOBTree` of (:obj:`OutPoint` to (:obj:`list` of bytes))): Maps input references to all blocks in the DB that spent them as list of their digests
+                (compacted to the single digest once that block is finalized; read it through blocks_spending).
+            blocks_containing_tx (:obj:`OOBTree` of (bytes to (:obj:`list` of bytes))): Maps transaction ids to all blocks in the DB that spent them as list of their digests
+                (compacted to the single digest once that block is finalized; read it through blocks_containing).
+            all_transactions (:obj:`OOBTree` of (bytes to :obj:`Transaction`)): Maps transaction ids to their corresponding Transaction objects.
+                Like every index here, these are BTrees, so a commit only rewrites the buckets it changed rather than the whole index.
+            tip (bytes): Digest of the block the chain state below is connected up to (None before genesis).
+                Kept equal to the heaviest chain tip by update_tip.
+            utxos (:obj:`OOBTree` of (:obj:`OutPoint` to :obj:`TransactionOutput`)): Unspent outputs on the chain ending in tip.
+            undo (:obj:`OOBTree` of (bytes to (:obj:`tuple` of (:obj:`OutPoint`, :obj:`TransactionOutput`)))): Maps digests of
+                connected blocks to the outputs they spent, so they can be disconnected again on a reorg.
+            headers (:obj:`OOBTree` of (bytes to tuple)): Maps digests of blocks known only by their header (imported from
+                a snapshot, body not yet fetched) to (parent_digest, height, timestamp, target, weight).
+            snapshot_base (bytes): Digest of the tip of the snapshot the chain state was imported from (None if it was
+                built from genesis); only blocks descending from it can be added.
+            finalized (bytes): Digest of the highest finalized block (None if none is); only blocks descending from it
+                can be added, and every block that does not share its chain has been pruned (see finalize).
+            pruned_height (int): Height up to which fully spent transactions have been pruned from the best chain
+                (-1 if none have been; see prune_spent); only blocks whose chain shares the best block there can be added.
+            tx_locations (:obj:`OOBTree` of (bytes to (:obj:`tuple` of (bytes, int)))): Maps transaction ids to the
+                (digest, position in its transactions) of every block in the DB including them, for the explorer.
+            address_history (:obj:`OOBTree` of (tuple to tuple)): Explorer index of the outputs each address received
+                and spent, in every block in the DB. Keys are (address, -height, block digest, txid, output index, kind),
+                so one address's entries are adjacent and sorted newest first; kind is "received" (the output was created
+                in the block) or "spent" (the block spent it), and the value is (amount, id of the spending transaction
+                or None). Entries outlive transactions pruned by prune_spent, so an address's history stays complete.
+            address_spends (:obj:`OOBTree` of (bytes to (:obj:`tuple` of tuple))): Maps digests of blocks in the DB to the
+                keys of their "spent" entries in address_history, so the entries can be dropped with the block even after
+                the transactions it spends (and with them the receivers in the keys) were pruned.
+            user_utxos (:obj:`OOBTree` of ((str, :obj:`OutPoint`) to int)): Wallet index of utxos: maps (receiver, outpoint)
+                to the amount of each unspent output, so one user's outputs are adjacent and found with a range search.
+            balances (:obj:`OOBTree` of (str to int)): Total amount of each user's unspent outputs (see user_utxos);
+                users without any are left out. Both are kept in step with utxos by add_utxo and spend_utxo, through reorgs.
+        """
+        self.chain = IOBTree()
+        self.max_height = -1
+        self.blocks = OOBTree()
+        self.blocks_spending_input = OOBTree()
+        self.blocks_containing_tx = OOBTree()
+        self.all_transactions = OOBTree()
+        self.tip = None
+        self.utxos = OOBTree()
+        self.undo = OOBTree()
+        self.headers = OOBTree()
+        self.snapshot_base = None
+        self.finalized = None
+        self.pruned_height = -1
+        self.tx_locations = OOBTree()
+        self.address_history = OOBTree()
+        self.address_spends = OOBTree()
+        self.user_utxos = OOBTree()
+        self.balances = OOBTree()
+
+    @property
+    def block_index(self):
+        """ (:obj:`BlockIndex`): Compact header index over every block in the database.
+        It is a volatile attribute, so it is never written to the database; the first time it is needed after the
+        chain is loaded, it is copied from block_indexes if the chain has not changed since, else rebuilt from the
+        stored blocks.
+        """
+        index = getattr(self, "_v_block_index", None)
+        if index is not None:
+            return index
+        index = self.cached_block_index()
+        if index is not None:
+            self._v_block_index = index
+            return index
+        index = BlockIndex()
+        for digests in self.chain.values():
+            for digest in digests:
+                if digest in self.blocks:
+                    index.add_block(self.blocks[digest])
+                else:
+                    index.add(digest, *self.headers[digest])
+        self._v_block_index = index
+        self.save_block_index()
+        return index
+
+    def block_index_key(self):
+        """ Get the key of this chain in block_indexes, or None if it is not stored in a database. """
+        if self._p_jar is None or self._p_oid is None:
+            return None
+        return (self._p_jar.db().storage.getName(), self._p_oid)
+
+    def cached_block_index(self):
+        """ Get a copy of the index saved in block_indexes for this chain as it is stored now, or None if there is
+        none (or the chain has changes not committed yet). """
+        key = self.block_index_key()
+        if key is None or self._p_changed or not key in block_indexes:
+            return None
+        serial, index = block_indexes[key]
+        return index.copy() if serial == self._p_serial else None
+
+    def save_block_index(self):
+        """ Save a copy of the index in block_indexes, for the chain as it is stored now (call after committing);
+        does nothing if the chain has changes not committed yet. """
+        key = self.block_index_key()
+        index = getattr(self, "_v_block_index", None)
+        if key is not None and index is not None and not self._p_changed:
+            block_indexes[key] = (self._p_serial, index.copy())
 
     def add_block(self, block, save=True):
         """ Adds a block to the blockchain; the block must be valid according to all block rules.
 
         Args:
             block (:obj:`Block`): Block to save to the blockchain
-            save (bool, optional): Whether to commit changes to database (defaults to True)
+            save (bool, optional): Whether to commit changes to database and emit their events (defaults to True);
+                with False, they wait for a later commit()
 
         Returns:
             bool: True on success, False otherwise.
         """
-        if block.hash in self.blocks:
+        started = time.perf_counter()
+        digest = block.digest
+        if digest in self.blocks:
+            metrics.add_block_seconds.observe(time.perf_counter() - started, "known")
             return False
-        if not block.is_valid()[0]:
+        valid = block.is_valid()[0]
+        validated = time.perf_counter()
+        metrics.block_validation_seconds.observe(validated - started, "valid" if valid else "invalid")
+        if not valid:
+            metrics.add_block_seconds.observe(validated - started, "invalid")
             return False
-        if not block.height in self.chain:
-            self.chain[block.height] = []
-        if not block.hash in self.chain[block.height]:
-            # add newer blocks to front so they show up first in UI
-            self.chain[block.height] = [block.hash] + self.chain[block.height]
-        if not block.hash in self.blocks:
-            self.blocks[block.hash] = block
+        digest = block.digest # is_valid checked the hash, so this is now well-formed
+        index = self.block_index
+        self.add_to_height(digest, block.height)
+        self.store_body(block)
+        index.add_block(block)
+        old_tip = self.tip
+        disconnected, connected = self.update_tip()
+        old_finalized = self.finalized
+        pruned = self.update_finality()
+        if config.PRUNE_DEPTH and self.tip is not None:
+            self.prune_spent(index.heights[index.lookup(self.tip)] - config.PRUNE_DEPTH)
+        self._p_changed = True # Marked object as changed so changes get saved to ZODB.
+        self.queue_event("block-added", block_hash=block.hash, height=block.height)
+        if connected:
+            self.queue_event("tip-changed", old_tip=old_tip.hex() if old_tip is not None else None,
+                new_tip=self.tip.hex(), disconnected=disconnected, connected=connected)
+        if self.finalized != old_finalized:
+            self.queue_event("block-finalized", block_hash=self.finalized.hex(),
+                height=index.heights[index.lookup(self.finalized)], pruned=pruned)
+        if save:
+            self.commit()
+        metrics.add_block_seconds.observe(time.perf_counter() - started, "added")
+        return True
+
+    def add_blocks(self, blocks, save=True):
+        """ Add many blocks with a single commit (each must be valid when its turn comes,
+        so parents must come before their children).
+
+        Args:
+            blocks (iterable of :obj:`Block`): Blocks to add, in order.
+            save (bool, optional): Whether to commit changes to database and emit their events (defaults to True);
+                with False, they wait for a later commit()
+
+        Returns:
+            int: Number of blocks added (invalid and already known blocks are skipped).
+        """
+        added = 0
+        for block in blocks:
+            if self.add_block(block, save=False):
+                added += 1
+        if save:
+            self.commit()
+        return added
+
+    def queue_event(self, event, **data):
+        """ Queue a chain event to be emitted by the next commit (see commit), so listeners never see
+        changes that are not committed yet, or that are rolled back. """
+        pending = getattr(self, "_v_pending_events", None)
+        if pending is None:
+            pending = self._v_pending_events = []
+        pending.append((event, data))
+
+    def commit(self):
+        """ Commit the changes made with save=False, then emit the chain events they queued. If the commit fails,
+        the events are dropped with the changes. """
+        pending = getattr(self, "_v_pending_events", None) or []
+        self._v_pending_events = []
+        committing = time.perf_counter()
+        transaction.commit()
+        metrics.commit_seconds.observe(time.perf_counter() - committing)
+        self.save_block_index()
+        for event, data in pending:
+            events.emit(event, **data)
+
+    def add_to_height(self, digest, height):
+        """ Record a block digest in the height index. """
+        digests_at_height = self.chain.get(height, ())
+        if not digest in digests_at_height:
+            # a new tuple (rather than mutating in place) so the BTree bucket is marked changed
+            self.chain[height] = digests_at_height + (digest,)
+            self.max_height = max(self.max_height, height)
+
+    def store_body(self, block):
+        """ Store a block and index its transactions, spent inputs and the addresses they pay. """
+        digest = block.digest
+        if not digest in self.blocks:
+            self.blocks[digest] = block
+        for position, tx in enumerate(block.transactions):
+            self.all_transactions[tx.txid] = tx
+            add_digest(self.blocks_containing_tx, tx.txid, digest)
+            for input_ref in tx.input_refs:
+                if isinstance(input_ref.txid, bytes): # malformed references never resolve
+                    add_digest(self.blocks_spending_input, input_ref, digest)
+            locations = self.tx_locations.get(tx.txid, ())
+            if not (digest, position) in locations:
+                self.tx_locations[tx.txid] = locations + ((digest, position),)
+        spends = []
+        for key, value in self.address_entries(block): # after the loop, so spends within the block resolve
+            self.address_history[key] = value
+            if key[-1] == "spent":
+                spends.append(key)
+        if spends:
+            self.address_spends[digest] = tuple(spends)
+
+    def address_entries(self, block):
+        """ Yield the address_history entries of a block as (key, value) pairs: one for every output it creates, and
+        one for every output it spends whose transaction is in the DB (the receiver of an output is only known from it). """
         for tx in block.transactions:
-            self.all_transactions[tx.hash] = tx
-            if not tx.hash in self.blocks_containing_tx:
-                self.blocks_containing_tx[tx.hash] = []
-            self.blocks_containing_tx[tx.hash].append(block.hash)
+            for output_index, output in enumerate(tx.outputs):
+                yield (output.receiver, -block.height, block.digest, tx.txid, output_index, "received"), (output.amount, None)
             for input_ref in tx.input_refs:
-                if not input_ref in self.blocks_spending_input:
-                    self.blocks_spending_input[input_ref] = []
-                self.blocks_spending_input[input_ref].append(block.hash)
-        self._p_changed = True # Marked object as changed so changes get saved to ZODB.
+                spent_tx = self.all_transactions.get(input_ref.txid) if isinstance(input_ref.txid, bytes) else None
+                if spent_tx is None or not 0 <= input_ref.index < len(spent_tx.outputs):
+                    continue
+                output = spent_tx.outputs[input_ref.index]
+                yield (output.receiver, -block.height, block.digest, input_ref.txid, input_ref.index, "spent"), (output.amount, tx.txid)
+
+    def blocks_containing(self, txid):
+        """ Digests of every block in the DB that includes a transaction (used during validation).
+
+        Args:
+            txid (bytes): Raw id of the transaction.
+
+        Returns:
+            (sequence of bytes): digests of the blocks, empty if there are none.
+        """
+        if not isinstance(txid, bytes):
+            return () # malformed references never resolve
+        return digests_in(self.blocks_containing_tx.get(txid))
+
+    def blocks_spending(self, input_ref):
+        """ Digests of every block in the DB that spends an output (used during validation).
+
+        Args:
+            input_ref (:obj:`OutPoint`): Reference to the output.
+
+        Returns:
+            (sequence of bytes): digests of the blocks, empty if there are none.
+        """
+        if not isinstance(input_ref.txid, bytes):
+            return () # malformed references never resolve
+        return digests_in(self.blocks_spending_input.get(input_ref))
+
+    def add_header(self, digest, parent_digest, height, timestamp, target, weight):
+        """ Add a block known only by its header (see headers); used when importing a snapshot.
+        Does not validate the header or move the tip.
+
+        Args:
+            digest (bytes): Raw hash of the block.
+            parent_digest (bytes): Raw hash of the parent (None for genesis).
+            height (int): Height of the block.
+            timestamp (float): Timestamp of the block.
+            target (int): Target of the block.
+            weight (int): Consensus weight of the block alone.
+        """
+        if digest in self.blocks or digest in self.headers:
+            return
+        self.headers[digest] = (parent_digest, height, timestamp, target, weight)
+        self.add_to_height(digest, height)
+        self.block_index.add(digest, parent_digest, height, timestamp, target, weight)
+        self._p_changed = True # so a block index saved for the chain before is not reused
+
+    def add_body(self, block, save=True):
+        """ Fill in the body of a block known only by its header (historical blocks below a snapshot).
+        The body must hash to the stored header; the chain state (tip, utxos) already accounts for it.
+
+        Args:
+            block (:obj:`Block`): The full block.
+            save (bool, optional): Whether to commit changes to database and emit their events (defaults to True);
+                with False, they wait for a later commit()
+
+        Returns:
+            bool: True if the body was added, False if it was not needed (or was pruned) or does not match its header.
+        """
+        digest = block.digest
+        if not digest in self.headers or block.height <= self.pruned_height:
+            return False
+        if (block.parent_digest, block.height, block.timestamp, block.target, block.get_weight()) != self.headers[digest]:
+            return False
+        if block.hash != block.calculate_hash() or block.merkle != block.calculate_merkle_root():
+            return False
+        self.store_body(block)
+        del self.headers[digest]
+        self._p_changed = True
+        self.queue_event("body-added", block_hash=block.hash, height=block.height)
         if save:
-            transaction.commit() # If we're going to save the block, commit the transaction.
+            self.commit()
         return True
 
-    def get_heights_with_blocks(self):
-        """ Return all heights in the blockchain that contain blocks.
+    def update_finality(self):
+        """ Finalize the best-chain block config.FINALITY_DEPTH blocks below the tip, if that is above the
+        current finalized block (does nothing while FINALITY_DEPTH is 0). Never commits; add_block does.
+
+        Returns:
+            int: Number of blocks pruned.
+        """
+        if not config.FINALITY_DEPTH or self.tip is None:
+            return 0
+        index = self.block_index
+        tip_id = index.lookup(self.tip)
+        final_id = index.ancestor(tip_id, index.heights[tip_id] - config.FINALITY_DEPTH)
+        if final_id == -1:
+            return 0
+        return self.finalize(index.digest(final_id).hex(), save=False)
+
+    def finalize(self, block_hash, save=True):
+        """ Mark a best-chain block as final, whether by depth (update_finality) or by an external
+        agreement such as the byzantine_agreement output. Every block that is neither an ancestor nor a
+        descendant of it can never be on the best chain again, so it is pruned: its body and index entries
+        are dropped, and the index entries of the newly finalized blocks are compacted to single digests.
+        Only the heights above the previous finalized block are visited, so the stored blocks and indexes
+        stay bounded by the best chain plus the forks within the finality window.
+
+        Args:
+            block_hash (str): Hash of the block to finalize; it must be on the best chain.
+            save (bool, optional): Whether to commit changes to database (defaults to True)
+
+        Returns:
+            int: Number of blocks pruned (0 if the block is unknown, off the best chain, or not above the
+            current finalized block).
+        """
+        index = self.block_index
+        final_digest = hash_from_hex(block_hash)
+        final_id = index.lookup(final_digest)
+        if final_id is None or not index.is_in_main_chain(final_id):
+            return 0
+        final_height = index.heights[final_id]
+        old_height = -1
+        if self.finalized is not None:
+            old_height = index.heights[index.lookup(self.finalized)]
+            if final_height <= old_height:
+                return 0
+        pruned = 0
+        newly_final = []
+        for height in list(self.chain.keys(old_height + 1)):
+            digests = self.chain[height]
+            kept = []
+            for digest in digests:
+                block_id = index.lookup(digest)
+                if index.is_ancestor(block_id, final_id) or index.is_ancestor(final_id, block_id):
+                    kept.append(digest)
+                else:
+                    self.prune_block(digest)
+                    pruned += 1
+            if not kept:
+                del self.chain[height] # only a pruned branch reached this high
+            elif len(kept) < len(digests):
+                self.chain[height] = tuple(kept)
+            if height <= final_height:
+                newly_final.append(kept[0])
+        for digest in newly_final: # after pruning, so no conflicting block is left anywhere above
+            self.compact_block(digest)
+        self.max_height = self.chain.maxKey() if len(self.chain) else -1
+        self.finalized = final_digest
+        # pruned blocks stay in the in-memory index (they are harmless there, as nothing can build on them)
+        # until enough of them pile up to be worth a rebuild from the stored blocks
+        self._v_pruned = getattr(self, "_v_pruned", 0) + pruned
+        if self._v_pruned * 2 > len(index):
+            self._v_block_index = None
+            self._v_pruned = 0
+        self._p_changed = True
+        if save:
+            transaction.commit()
+        return pruned
+
+    def prune_block(self, digest):
+        """ Drop a block (or a header-only block) and its entries in the height-independent indexes. """
+        self.headers.pop(digest, None)
+        self.undo.pop(digest, None)
+        block = self.blocks.pop(digest, None)
+        if block is None:
+            return
+        for tx in block.transactions:
+            for output_index, output in enumerate(tx.outputs):
+                self.address_history.pop((output.receiver, -block.height, digest, tx.txid, output_index, "received"), None)
+        for key in self.address_spends.pop(digest, ()):
+            self.address_history.pop(key, None)
+        for tx in block.transactions:
+            locations = tuple(location for location in self.tx_locations.get(tx.txid, ()) if location[0] != digest)
+            if locations:
+                self.tx_locations[tx.txid] = locations
+            else:
+                self.tx_locations.pop(tx.txid, None)
+            remove_digest(self.blocks_containing_tx, tx.txid, digest)
+            if not tx.txid in self.blocks_containing_tx:
+                self.all_transactions.pop(tx.txid, None) # not included in any remaining block
+            for input_ref in tx.input_refs:
+                if isinstance(input_ref.txid, bytes): # (malformed references were never indexed)
+                    remove_digest(self.blocks_spending_input, input_ref, digest)
+
+    def compact_block(self, digest):
+        """ Store the index entries of a finalized block as its bare digest rather than a list
+        (once every conflicting block is pruned, it is the only block left in them). """
+        block = self.blocks.get(digest)
+        if block is None:
+            return
+        for tx in block.transactions:
+            if self.blocks_containing_tx.get(tx.txid) == [digest]:
+                self.blocks_containing_tx[tx.txid] = digest
+            for input_ref in tx.input_refs:
+                if self.blocks_spending(input_ref) == [digest]:
+                    self.blocks_spending_input[input_ref] = digest
+
+    def prune_spent(self, to_height):
+        """ Pruned-node mode: drop every best-chain transaction, up to a height, whose outputs have all been
+        spent at or below that height, along with its index entries; block bodies left with no transactions are
+        dropped to their header (see headers). The unspent outputs, headers and undo data above the height are
+        all a node needs to validate and reorg blocks whose chain shares the best block at that height, so
+        blocks forking lower are rejected from then on. Run on every block by add_block while
+        config.PRUNE_DEPTH is set; never commits. Pack the database (see chaindb.compact) to reclaim the space.
+
+        Args:
+            to_height (int): Highest height to prune up to.
+
+        Returns:
+            int: Number of transactions pruned.
+        """
+        index = self.block_index
+        to_height = min(to_height, len(index.main_chain) - 1)
+        pruned = 0
+        for height in range(self.pruned_height + 1, to_height + 1):
+            digest = index.digest(index.main_chain[height])
+            self.undo.pop(digest, None) # no reorg can reach this block any more
+            block = self.blocks.get(digest)
+            if block is None:
+                continue # header only (below a snapshot)
+            # this block may finish spending its own transactions or the ones it spends from
+            txids = [tx.txid for tx in block.transactions]
+            txids += [input_ref.txid for tx in block.transactions for input_ref in tx.input_refs]
+            for txid in txids:
+                if self.prune_transaction(txid, height):
+                    pruned += 1
+        if to_height > self.pruned_height:
+            self.pruned_height = to_height
+            self._p_changed = True
+        return pruned
+
+    def prune_transaction(self, txid, height):
+        """ Drop a best-chain transaction if every one of its outputs was spent on the best chain at or below height.
+
+        Returns:
+            bool: True if the transaction was pruned.
+        """
+        tx = self.all_transactions.get(txid)
+        if tx is None:
+            return False
+        index = self.block_index
+        spent = []
+        for output_index in range(len(tx.outputs)):
+            outpoint = OutPoint(txid, output_index)
+            if outpoint in self.utxos:
+                return False
+            for digest in self.blocks_spending(outpoint):
+                block_id = index.lookup(digest)
+                if index.is_in_main_chain(block_id) and index.heights[block_id] <= height:
+                    spent.append(outpoint)
+                    break
+            else:
+                return False # only spent above height, or off the best chain
+        containing = self.blocks_containing(txid)
+        del self.all_transactions[txid]
+        self.blocks_containing_tx.pop(txid, None)
+        self.tx_locations.pop(txid, None)
+        for outpoint in spent:
+            self.blocks_spending_input.pop(outpoint, None)
+        for digest in containing:
+            block_id = index.lookup(digest)
+            if not index.is_in_main_chain(block_id) or index.heights[block_id] > height:
+                continue # side blocks keep their bodies; they may still be needed by a reorg
+            block = self.blocks.get(digest)
+            if block is not None and not any(block_tx.txid in self.all_transactions for block_tx in block.transactions):
+                self.headers[digest] = (block.parent_digest, block.height, block.timestamp, block.target, block.get_weight())
+                del self.blocks[digest]
+        self._p_changed = True
+        return True
+
+    def update_tip(self):
+        """ Reorg engine: move the chain state (tip, utxos) onto the heaviest chain tip.
+        Finds the last common ancestor of the old and new tips through the block index,
+        disconnects blocks down to it using their undo data, then connects the new branch,
+        so the cost is proportional to the depth of the reorg, not the length of the chain.
+
+        Returns:
+            (:obj:`list` of str), (:obj:`list` of str): hashes of the blocks disconnected (newest first)
+            and connected (oldest first); both empty if the tip did not change.
+        """
+        index = self.block_index
+        if index.best == -1 or index.digest(index.best) == self.tip:
+            return [], []
+        old_id = index.lookup(self.tip)
+        if old_id is None:
+            old_id = -1
+        fork_id = index.last_common_ancestor(old_id, index.best)
+
+        disconnected = []
+        block_id = old_id
+        while block_id != fork_id:
+            digest = index.digest(block_id)
+            self.disconnect_block(self.blocks[digest])
+            disconnected.append(digest.hex())
+            block_id = index.parents[block_id]
+
+        new_branch = []
+        block_id = index.best
+        while block_id != fork_id:
+            new_branch.append(index.digest(block_id))
+            block_id = index.parents[block_id]
+        connected = []
+        for digest in reversed(new_branch):
+            self.connect_block(self.blocks[digest])
+            connected.append(digest.hex())
+        return disconnected, connected
+
+    def connect_block(self, block):
+        """ Apply a block on top of the current tip: spend its inputs, add its outputs, and record undo data.
+
+        Args:
+            block (:obj:`Block`): Block whose parent is the current tip.
+        """
+        spent = []
+        for tx in block.transactions:
+            for input_ref in tx.input_refs:
+                output = self.spend_utxo(input_ref)
+                if output is not None:
+                    spent.append((input_ref, output))
+            for output_index, output in enumerate(tx.outputs):
+                self.add_utxo(OutPoint(tx.txid, output_index), output)
+        digest = block.digest
+        self.undo[digest] = tuple(spent)
+        self.tip = digest
+
+    def disconnect_block(self, block):
+        """ Undo connect_block for the current tip, moving the tip back to its parent.
+
+        Args:
+            block (:obj:`Block`): The block at the current tip.
+        """
+        for tx in block.transactions:
+            for output_index in range(len(tx.outputs)):
+                self.spend_utxo(OutPoint(tx.txid, output_index))
+        txids_in_block = set(tx.txid for tx in block.transactions)
+        for input_ref, output in self.undo.pop(block.digest, ()):
+            if not input_ref.txid in txids_in_block: # outputs created and spent in this block stay gone
+                self.add_utxo(input_ref, output)
+        self.tip = block.parent_digest
+
+    def add_utxo(self, outpoint, output):
+        """ Record an unspent output in utxos and in its receiver's wallet (see user_utxos and balances).
+
+        Args:
+            outpoint (:obj:`OutPoint`): Reference to the output.
+            output (:obj:`TransactionOutput`): The output.
+        """
+        self.spend_utxo(outpoint) # a replaced output leaves its old receiver's wallet
+        self.utxos[outpoint] = output
+        self.user_utxos[(output.receiver, outpoint)] = output.amount
+        self.add_to_balance(output.receiver, output.amount)
+
+    def spend_utxo(self, outpoint):
+        """ Remove an output from utxos and from its receiver's wallet (see add_utxo).
+
+        Args:
+            outpoint (:obj:`OutPoint`): Reference to the output.
+
+        Returns:
+            (:obj:`TransactionOutput`): the output removed, or None if it was not unspent.
+        """
+        output = self.get_utxo(outpoint)
+        if output is None:
+            return None
+        del self.utxos[outpoint]
+        self.user_utxos.pop((output.receiver, outpoint), None)
+        self.add_to_balance(output.receiver, -output.amount)
+        return output
+
+    def add_to_balance(self, user, amount):
+        """ Change a user's entry in balances by amount, leaving the user out once it is 0. """
+        balance = self.balances.get(user, 0) + amount
+        if balance:
+            self.balances[user] = balance
+        else:
+            self.balances.pop(user, None)
+
+    def get_utxo(self, input_ref):
+        """ Look up an output that is unspent on the chain ending in tip.
+
+        Args:
+            input_ref (:obj:`OutPoint`): Reference to the output.
+
+        Returns:
+            (:obj:`TransactionOutput`): the unspent output, or None if it does not exist or was spent.
+        """
+        if not isinstance(input_ref.txid, bytes):
+            return None # malformed references never resolve
+        return self.utxos.get(input_ref)
+
+    def branch_utxo_changes(self, digest):
+        """ Work out how the unspent outputs at the end of another branch differ from those at the tip, by undoing
+        the tip's blocks down to the fork point (with their undo data) and applying the branch's blocks on top,
+        without touching utxos. Costs time proportional to the length of the two branches, not of the chain.
+
+        Args:
+            digest (bytes): Raw hash of the last block of the branch; its body and those of the blocks down to
+                the fork point must be stored.
+
+        Returns:
+            (:obj:`dict` of (:obj:`OutPoint` to :obj:`TransactionOutput`)): Outputs unspent at the end of the branch
+            but not at the tip, and None for outputs unspent at the tip but not at the end of the branch.
+        """
+        index = self.block_index
+        tip_id = index.lookup(self.tip)
+        branch_id = index.lookup(digest)
+        fork_id = index.last_common_ancestor(tip_id, branch_id) if tip_id is not None else -1
+        changes = {}
+        block_id = tip_id if tip_id is not None else -1
+        while block_id != fork_id: # newest first, as disconnect_block would
+            block = self.blocks[index.digest(block_id)]
+            txids_in_block = set()
+            for tx in block.transactions:
+                txids_in_block.add(tx.txid)
+                for output_index in range(len(tx.outputs)):
+                    changes[OutPoint(tx.txid, output_index)] = None
+            for input_ref, output in self.undo[block.digest]:
+                if not input_ref.txid in txids_in_block:
+                    changes[input_ref] = output
+            block_id = index.parents[block_id]
+        branch = []
+        block_id = branch_id
+        while block_id != fork_id:
+            branch.append(index.digest(block_id))
+            block_id = index.parents[block_id]
+        for branch_digest in reversed(branch): # oldest first, as connect_block would
+            for tx in self.blocks[branch_digest].transactions:
+                for input_ref in tx.input_refs:
+                    changes[input_ref] = None
+                for output_index, output in enumerate(tx.outputs):
+                    changes[OutPoint(tx.txid, output_index)] = output
+        return changes
+
+    def get_heights_with_blocks(self, min_height=None, max_height=None):
+        """ Return all heights in the blockchain that contain blocks, optionally limited to a range.
+
+        Args:
+            min_height (int, optional): Lowest height to include.
+            max_height (int, optional): Highest height to include.
+
+        Returns:
+            (iterable of int): Heights in the blockchain with blocks at that location, in increasing order
+            (a lazy view of the height index, not a copy).
+        """
+        return self.chain.keys(min_height, max_height)
+
+    def get_max_height(self):
+        """ Return the greatest height containing a block, or -1 if the blockchain is empty. """
+        return self.max_height
+
+    def iterate_heights_newest_first(self, max_height=None, min_height=None):
+        """ Iterate over heights containing blocks in decreasing order, without copying the height index.
+
+        Args:
+            max_height (int, optional): Highest height to include (defaults to the top of the chain).
+            min_height (int, optional): Lowest height to include (defaults to genesis).
+
+        Yields:
+            int: Heights with blocks, highest first.
+        """
+        height = self.max_height if max_height is None else min(max_height, self.max_height)
+        while height >= 0:
+            try:
+                height = self.chain.maxKey(height) # greatest height <= height
+            except ValueError:
+                return
+            if min_height is not None and height < min_height:
+                return
+            yield height
+            height -= 1
+
+    def get_blockhashes_in_range(self, min_height=None, max_height=None):
+        """ Return hashes of all blocks in a range of heights, newest first
+        (highest height first, and most recently added first within a height), as shown in the UI.
+
+        Args:
+            min_height (int, optional): Lowest height to include.
+            max_height (int, optional): Highest height to include.
 
         Returns:
-            (:obj:`list` of int): List of heights in the blockchain with blocks at that location.
+            (:obj:`list` of str): hashes of blocks in the range.
         """
-        all_heights = list(self.chain.keys())
-        all_heights.sort()
-        return all_heights
+        block_hashes = []
+        for height in self.iterate_heights_newest_first(max_height, min_height):
+            block_hashes += self.get_blockhashes_at_height(height)
+        return block_hashes
 
     def get_blockhashes_at_height(self, height):
         """ Return list of hashes of blocks at a particular height stored in the chain database.
@@ -74,9 +740,124 @@ class Blockchain(persistent.Persistent):
             height (int): Desired height to query.
 
         Returns:
-            (:obj:`list` of str): list of blockhashes at given height
+            (:obj:`list` of str): list of blockhashes at given height, most recently added first
+        """
+        return [digest.hex() for digest in reversed(self.chain[height])]
+
+    def get_block(self, block_hash):
+        """ Look up a block by its hex-encoded hash.
+
+        Args:
+            block_hash (str): Hash of the desired block.
+
+        Returns:
+            (:obj:`Block`): the block, or None if it is not in the database (or only its header is).
         """
-        return self.chain[height]
+        return self.blocks.get(hash_from_hex(block_hash))
+
+    def get_transaction(self, tx_hash):
+        """ Look up a transaction by its hex-encoded hash.
+
+        Args:
+            tx_hash (str): Hash of the desired transaction.
+
+        Returns:
+            (:obj:`Transaction`): the transaction, or None if it is not in the database.
+        """
+        return self.all_transactions.get(hash_from_hex(tx_hash))
+
+    def get_transaction_locations(self, tx_hash):
+        """ Find every block in the DB including a transaction, through tx_locations.
+
+        Args:
+            tx_hash (str): Hash of the transaction.
+
+        Returns:
+            (:obj:`list` of (str, int, int)): hash and height of each block, and the position of the transaction in it,
+            in the order the blocks were added; empty if there are none (or the transaction was pruned).
+        """
+        txid = hash_from_hex(tx_hash)
+        if txid is None:
+            return []
+        index = self.block_index
+        return [(digest.hex(), index.heights[index.lookup(digest)], position) for digest, position in self.tx_locations.get(txid, ())]
+
+    def get_address_history(self, address, max_height=None, count=20):
+        """ Page through the outputs an address received and spent (see address_history), newest first, whole
+        heights at a time until count entries are collected. Starts from a range search on the address, so the
+        cost does not depend on the size of the chain or of the address's older history.
+
+        Args:
+            address (str): The address (user name) to look up.
+            max_height (int, optional): Highest height to include (defaults to the top of the chain).
+            count (int, optional): Number of entries to collect (the last height on the page is never split).
+
+        Returns:
+            (:obj:`list` of tuple), int: entries as (height, block hash, tx hash, output index, kind, amount,
+            spending tx hash or None), and the height the next page starts at (None on the last page).
+        """
+        start = (address,) if max_height is None else (address, -max_height)
+        entries = []
+        for key, (amount, spending_txid) in self.address_history.items(start):
+            if key[0] != address:
+                break
+            height = -key[1]
+            if len(entries) >= count and height != entries[-1][0]:
+                return entries, height
+            entries.append((height, key[2].hex(), key[3].hex(), key[4], key[5], amount,
+                spending_txid.hex() if spending_txid is not None else None))
+        return entries, None
+
+    def get_balance(self, user):
+        """ Get the total amount of a user's unspent outputs on the best chain, in O(1) (see balances).
+
+        Args:
+            user (str): The user (receiver name) to look up.
+
+        Returns:
+            int: the balance, 0 for unknown users.
+        """
+        return self.balances.get(user, 0)
+
+    def get_unspent_outputs(self, user, count=None):
+        """ List a user's unspent outputs on the best chain, through a range search on user_utxos.
+
+        Args:
+            user (str): The user (receiver name) to look up.
+            count (int, optional): Most outputs to return (defaults to all of them).
+
+        Returns:
+            (:obj:`list` of (str, int)): "txhash:index" reference and amount of each output, ordered by reference.
+        """
+        outputs = []
+        for (receiver, outpoint), amount in self.user_utxos.items((user,)):
+            if receiver != user or (count is not None and len(outputs) >= count):
+                break
+            outputs.append((repr(outpoint), amount))
+        return outputs
+
+    def select_coins(self, user, amount):
+        """ Pick unspent outputs of a user to spend, first in reference order, until they add up to an amount.
+        The balance is checked first, so a user who cannot pay costs O(1); otherwise only the outputs picked are visited.
+
+        Args:
+            user (str): The user (receiver name) paying.
+            amount (int): Amount the outputs must add up to at least.
+
+        Returns:
+            (:obj:`list` of (str, int)): "txhash:index" reference and amount of each output picked (see
+            get_unspent_outputs), or None if the user's balance is below amount.
+        """
+        if self.get_balance(user) < amount:
+            return None
+        selected = []
+        total = 0
+        for (receiver, outpoint), output_amount in self.user_utxos.items((user,)):
+            if total >= amount:
+                break
+            selected.append((repr(outpoint), output_amount))
+            total += output_amount
+        return selected
 
     def get_chain_ending_with(self, block_hash):
         """ Return a list of blockhashes in the chain ending with the provided hash, following parent pointers until genesis
@@ -89,19 +870,75 @@ class Blockchain(persistent.Persistent):
         """
 
         # Solution for (1a)
-        if not block_hash in self.blocks:
+        return [digest.hex() for digest in self.get_digests_ending_with(hash_from_hex(block_hash))]
+
+    def get_digests_ending_with(self, digest):
+        """ Same as get_chain_ending_with, but on raw block digests (used during validation).
+
+        Args:
+            digest (bytes): Digest of highest block in desired chain.
+
+        Returns:
+            (:obj:`list` of bytes): digests of all blocks in the chain between desired block and genesis.
+        """
+        index = self.block_index
+        block_id = index.lookup(digest)
+        if block_id is None:
             return []
-        block_hashes = []
-        curr_block = self.blocks[block_hash]
-        while not curr_block.is_genesis:
-            block_hashes.append(curr_block.hash)
-            curr_block = self.blocks[curr_block.parent_hash]
-        block_hashes.append(curr_block.hash) # add genesis block too
-        return block_hashes
+        return [index.digest(ancestor_id) for ancestor_id in index.chain_ending_with(block_id)]
 
         # Placeholder for (1a)
         return [block_hash]
 
+    def chain_contains_any(self, block_id, digests):
+        """ Check whether any of the given blocks is on the chain ending in a block (used during validation).
+
+        Args:
+            block_id (int): Index id of the highest block in the chain to search.
+            digests (:obj:`list` of bytes): Digests of the blocks to look for.
+
+        Returns:
+            bool: True if at least one of the blocks is on the chain, False otherwise.
+        """
+        index = self.block_index
+        for digest in digests:
+            ancestor_id = index.lookup(digest)
+            if ancestor_id is not None and index.is_ancestor(ancestor_id, block_id):
+                return True
+        return False
+
+    def is_in_main_chain(self, block_hash):
+        """ Check in O(1) whether a block is on the chain ending in the heaviest chain tip.
+
+        Args:
+            block_hash (str): Hash of the block to check.
+
+        Returns:
+            bool: True iff the block is on the best chain.
+        """
+        index = self.block_index
+        block_id = index.lookup(hash_from_hex(block_hash))
+        return block_id is not None and index.is_in_main_chain(block_id)
+
+    def main_chain_range(self, min_height, max_height):
+        """ Return hashes of the best-chain blocks between two heights (inclusive), in O(k).
+
+        Args:
+            min_height (int): Lowest height to include.
+            max_height (int): Highest height to include.
+
+        Returns:
+            (:obj:`list` of str): best-chain block hashes in increasing height order.
+        """
+        index = self.block_index
+        block_ids = index.main_chain[max(min_height, 0):max(max_height + 1, 0)]
+        return [index.digest(block_id).hex() for block_id in block_ids if block_id != -1]
+
+    def get_main_chain_blockhash(self, height):
+        """ Return the hash of the best-chain block at a height in O(1), or None if the best chain is shorter. """
+        block_hashes = self.main_chain_range(height, height)
+        return block_hashes[0] if block_hashes else None
+
     def get_all_block_weights(self):
         """ Get total weight for every block in the blockchain database.
         (eg if a block is at height 3, and all blocks have weight 1, the block will have weight 4 across blocks 0,1,2,3)
@@ -109,15 +946,25 @@ class Blockchain(persistent.Persistent):
         Returns:
             (obj:`dict` of (str to int)): List mapping every blockhash to its total accumulated weight in the blockchain
         """
-        block_hashes_to_total_weights = {}
-        for height in self.get_heights_with_blocks():
-            for block_hash in self.get_blockhashes_at_height(height):
-                # dynamic programming; store map of blocks to weights and populate in increasing height order
-                block = self.blocks[block_hash]
-                block_hashes_to_total_weights[block_hash] = block.get_weight()
-                if not block.is_genesis:
-                    block_hashes_to_total_weights[block_hash] += block_hashes_to_total_weights[block.parent_hash]
-        return block_hashes_to_total_weights
+        # cumulative weights are maintained incrementally by the block index
+        index = self.block_index
+        return {index.digest(block_id).hex(): index.weight(block_id) for block_id in range(len(index))
+            if index.digest(block_id) in self.blocks or index.digest(block_id) in self.headers} # skip pruned blocks
+
+    def get_block_weight(self, block_hash):
+        """ Get the total weight of the chain ending in one block (see get_all_block_weights), in O(1).
+
+        Args:
+            block_hash (str): Hash of the block.
+
+        Returns:
+            int: the block's total accumulated weight, or None if the block is not in the database.
+        """
+        index = self.block_index
+        block_id = index.lookup(hash_from_hex(block_hash))
+        if block_id is None:
+            return None
+        return index.weight(block_id)
 
     def get_heaviest_chain_tip(self):
         """ Find the chain tip with the most accumulated total work.
@@ -127,17 +974,36 @@ class Blockchain(persistent.Persistent):
         return an int.
 
         Returns:
-            (:obj:`Block`): block with the maximum total weight in db.
+            (:obj:`Block`): block with the maximum total weight in db (None if only its header is known).
         """
 
-        block_hashes_to_total_weights = self.get_all_block_weights()
-        heaviest_block = None
-        for block_hash in block_hashes_to_total_weights:
-            block = self.blocks[block_hash]
-            weight_in_block = block_hashes_to_total_weights[block_hash]
-            if heaviest_block == None or weight_in_block > heaviest_weight:
-                heaviest_block = block
-                heaviest_weight = weight_in_block
+        index = self.block_index
+        if index.best == -1:
+            return None
+        return self.blocks.get(index.digest(index.best))
+
+def digests_in(entry):
+    """ Read a blocks_containing_tx or blocks_spending_input entry (a list, a single compacted digest, or None) as a sequence of digests. """
+    if entry is None:
+        return ()
+    if isinstance(entry, bytes):
+        return (entry,)
+    return entry
 
-        return heaviest_block
+def add_digest(mapping, key, digest):
+    """ Add a block digest to a blocks_containing_tx or blocks_spending_input entry. """
+    entry = mapping.get(key)
+    if entry is None:
+        mapping[key] = [digest]
+    elif isinstance(entry, bytes):
+        mapping[key] = [entry, digest]
+    else:
+        mapping[key] = entry + [digest] # a new list (rather than appending in place) so the BTree bucket is marked changed
 
+def remove_digest(mapping, key, digest):
+    """ Remove a block digest from a blocks_containing_tx or blocks_spending_input entry, dropping the entry once empty. """
+    entry = [digest_in for digest_in in digests_in(mapping.get(key)) if digest_in != digest]
+    if entry:
+        mapping[key] = entry
+    else:
+        mapping.pop(key, None)
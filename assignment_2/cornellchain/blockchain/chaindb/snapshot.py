@@ -0,0 +1,150 @@
+""" Chain state snapshots, for bootstrapping a node without replaying the block history.
+
+    A snapshot holds every block header in the index (with its cumulative weight), the
+    best chain tip, and the unspent outputs at that tip, so a node importing it can
+    validate new blocks on top of the tip straight away. Historical block bodies are
+    not included; they can be filled in later with Blockchain.add_body.
+
+    File layout: MAGIC, then a stream of pickled records, then the SHA256 of everything
+    before it. Records are written and read in batches of BATCH_SIZE, so neither export
+    nor import ever holds more than a batch beyond the chain itself:
+        ("tip", tip digest, header count, unspent output count)
+        ("headers", list of (digest, parent digest, height, timestamp, target, cumulative weight))
+        ("utxos", list of (txid, output index, sender, receiver, amount))
+    Records hold only builtin types, which are all the importer will unpickle.
+        ("end",)
+"""
+import pickle
+import hashlib
+import transaction
+from blockchain.transaction import OutPoint, TransactionOutput
+
+MAGIC = b"CORNELLCHAIN SNAPSHOT 1\n"
+BATCH_SIZE = 10000
+
+class HashingFile:
+    """ Wraps a binary file, hashing everything written to or read from it. """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.sha256.update(data)
+        return data
+
+    def readline(self):
+        data = self.file.readline()
+        self.sha256.update(data)
+        return data
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """ Refuses to rebuild any class, so a snapshot can only ever contain builtin types. """
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError("unexpected object in snapshot: " + module + "." + name)
+
+def batches(items):
+    """ Split an iterable into lists of at most BATCH_SIZE items, lazily. """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def export_snapshot(chain, out_file):
+    """ Write a snapshot of a chain at its current tip.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain to export; must have a tip.
+        out_file (file): Binary file to write to.
+
+    Raises:
+        ValueError: If the chain is empty.
+    """
+    if chain.tip is None:
+        raise ValueError("cannot snapshot an empty chain")
+    index = chain.block_index
+    out = HashingFile(out_file)
+    out.write(MAGIC)
+    pickle.dump(("tip", chain.tip, len(index), len(chain.utxos)), out, protocol=4)
+
+    def headers():
+        for block_id in range(len(index)):
+            parent_id = index.parents[block_id]
+            yield (index.digest(block_id), index.digest(parent_id) if parent_id != -1 else None, index.heights[block_id],
+                index.timestamps[block_id], index.target(block_id), index.weight(block_id))
+    for batch in batches(headers()):
+        pickle.dump(("headers", batch), out, protocol=4)
+    def utxos():
+        for outpoint, output in chain.utxos.items():
+            yield (outpoint.txid, outpoint.index, output.sender, output.receiver, output.amount)
+    for batch in batches(utxos()):
+        pickle.dump(("utxos", batch), out, protocol=4)
+    pickle.dump(("end",), out, protocol=4)
+    out_file.write(out.sha256.digest())
+
+def import_snapshot(chain, in_file):
+    """ Load a snapshot into an empty chain, making the snapshot tip its tip.
+    The transaction is saved at savepoints while loading (so memory stays flat for a chain
+    stored in the database) but never committed; commit after a successful import, and
+    abort the transaction if it raises.
+
+    Args:
+        chain (:obj:`Blockchain`): Empty chain to load into.
+        in_file (file): Binary file to read from.
+
+    Raises:
+        ValueError: If the chain is not empty, or the snapshot is corrupt or inconsistent.
+    """
+    if len(chain.chain) or len(chain.headers):
+        raise ValueError("can only import a snapshot into an empty chain")
+    source = HashingFile(in_file)
+    if source.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a snapshot file")
+    try:
+        record = SnapshotUnpickler(source).load() # one unpickler per record, as each was pickled separately
+        if record[0] != "tip":
+            raise ValueError("snapshot does not start with its tip")
+        tip, header_count, utxo_count = record[1:]
+        headers = utxos = 0
+        index = chain.block_index
+        while True:
+            record = SnapshotUnpickler(source).load()
+            if record[0] == "end":
+                break
+            if record[0] == "headers":
+                for digest, parent_digest, height, timestamp, target, cumulative_weight in record[1]:
+                    parent_id = index.lookup(parent_digest)
+                    weight = cumulative_weight - (index.weight(parent_id) if parent_id is not None else 0)
+                    chain.add_header(digest, parent_digest, height, timestamp, target, weight)
+                headers += len(record[1])
+            elif record[0] == "utxos":
+                for txid, output_index, sender, receiver, amount in record[1]:
+                    chain.add_utxo(OutPoint(txid, output_index), TransactionOutput(sender, receiver, amount))
+                utxos += len(record[1])
+            else:
+                raise ValueError("unknown snapshot record " + repr(record[0]))
+            transaction.savepoint(True)
+    except ValueError:
+        raise
+    except Exception as e: # anything from a damaged pickle stream
+        raise ValueError("corrupt snapshot: " + repr(e))
+    expected_digest = source.sha256.digest()
+    if in_file.read(32) != expected_digest:
+        raise ValueError("snapshot checksum mismatch")
+    if headers != header_count or utxos != utxo_count:
+        raise ValueError("snapshot is truncated")
+    if index.lookup(tip) is None or index.digest(index.best) != tip:
+        raise ValueError("snapshot tip is not the heaviest header")
+    chain.tip = tip
+    chain.snapshot_base = tip
+    chain._p_changed = True
@@ -0,0 +1,82 @@
+""" Storage backends for the chain database, chosen by config.DB_STORAGE or, when set, the
+    CORNELLCHAIN_STORAGE environment variable (eg CORNELLCHAIN_STORAGE=memory python3 -m unittest tests.validity):
+        "file": a ZODB FileStorage at config.DB_PATH (the default)
+        "memory": an in-memory MappingStorage; nothing touches the disk, and the chain lasts as long as the process
+        "zeo": a ZEO client of the server at config.ZEO_ADDRESS (or CORNELLCHAIN_ZEO, as host:port), so several
+            processes share one chain and see each other's commits; needs the ZEO package
+
+    This module is never reloaded along with blockchain.chaindb, so in-memory storages and ZEO clients live here
+    and survive the close-and-reload the web and p2p handlers do on every request (a ZEO client keeps its
+    connection and object cache, rather than reloading every object over the network per request).
+"""
+import os
+import config
+import ZODB.FileStorage
+import ZODB.MappingStorage
+try:
+    from ZEO.ClientStorage import ClientStorage
+except ImportError:
+    ClientStorage = None # only the "zeo" mode needs the ZEO package
+
+MODES = ("file", "memory", "zeo")
+
+#: In-memory storages opened so far, by database path (so each node id gets its own chain)
+memory_storages = {}
+
+#: ZEO clients opened so far, by server address
+zeo_storages = {}
+
+class MemoryStorage(ZODB.MappingStorage.MappingStorage):
+    """ MappingStorage that stays open when its database is closed, so a database can be reopened on it. """
+
+    def close(self):
+        pass # the data goes with the process, not with the database
+
+if ClientStorage is not None:
+    class SharedClientStorage(ClientStorage):
+        """ ZEO client that stays connected when its database is closed, so a database can be reopened on it. """
+
+        def close(self):
+            self._db = None # stop passing invalidations to the closed database; the next one registers itself
+
+def storage_mode():
+    """ Get the configured storage mode (see MODES).
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    mode = os.environ.get("CORNELLCHAIN_STORAGE") or config.DB_STORAGE
+    if not mode in MODES:
+        raise ValueError("unknown storage mode " + repr(mode) + "; expected one of " + ", ".join(MODES))
+    return mode
+
+def zeo_address():
+    """ Get the address of the ZEO server to use, as (host, port). """
+    address = os.environ.get("CORNELLCHAIN_ZEO")
+    if not address:
+        return tuple(config.ZEO_ADDRESS)
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+def open_storage():
+    """ Open the storage for config.DB_PATH in the configured mode (see storage_mode). """
+    mode = storage_mode()
+    if mode == "memory":
+        if not config.DB_PATH in memory_storages:
+            memory_storages[config.DB_PATH] = MemoryStorage(config.DB_PATH)
+        return memory_storages[config.DB_PATH]
+    if mode == "zeo":
+        if ClientStorage is None:
+            raise ImportError("the zeo storage mode needs the ZEO package")
+        address = zeo_address()
+        if not address in zeo_storages:
+            zeo_storages[address] = SharedClientStorage(address)
+        return zeo_storages[address]
+    return ZODB.FileStorage.FileStorage(config.DB_PATH)
+
+def last_transaction():
+    """ Get the id of the last transaction committed to the shared ZEO storage by any process, to tell when
+    another process changed the chain (None in other modes, where only this process writes the chain). """
+    if storage_mode() != "zeo" or not zeo_address() in zeo_storages:
+        return None
+    return zeo_storages[zeo_address()].lastTransaction()
@@ -0,0 +1,40 @@
+""" Minimal in-process publish/subscribe for chain events.
+
+    Listeners live in this module rather than on the Blockchain object, so they survive
+    the chain database being closed and reloaded.
+
+    Events emitted by Blockchain.add_block (once the block is committed, see Blockchain.commit):
+        "block-added": block_hash (str), height (int)
+        "tip-changed": old_tip (str or None), new_tip (str), disconnected (list of str), connected (list of str)
+        "block-finalized": block_hash (str), height (int), pruned (int)
+
+    Events emitted by Blockchain.add_body (once the body is committed):
+        "body-added": block_hash (str), height (int)
+
+    Events emitted by SimplePKIBA.run_protocol_loop:
+        "ba-round": sender (int), round (int), accepted (int; proposals accepted so far)
+        "ba-done": sender (int), output (str)
+
+    Events emitted by the webapp (webapp.app.check_storage), when another process committed to a shared chain storage:
+        "chain-changed": transaction (str; hex id of the last transaction)
+"""
+
+#: Maps event names to the list of callbacks subscribed to them
+listeners = {}
+
+def subscribe(event, callback):
+    """ Call callback(**data) every time event is emitted. """
+    listeners.setdefault(event, []).append(callback)
+
+def unsubscribe(event, callback):
+    """ Stop calling callback for event; does nothing if it was not subscribed. """
+    if callback in listeners.get(event, []):
+        listeners[event].remove(callback)
+
+def emit(event, **data):
+    """ Call every listener of an event; a failing listener is logged and never breaks the emitter. """
+    for callback in list(listeners.get(event, [])):
+        try:
+            callback(**data)
+        except Exception as e:
+            print("[events] Listener for", event, "failed:", e)
@@ -0,0 +1,314 @@
+""" In-process metrics registry, rendered in the Prometheus text format at /metrics by webapp.app.
+
+    Recording a value never takes a lock: every thread counts into its own shard (a plain dict reached
+    through a thread-local), and a scrape adds the shards up. The registry lock is only taken when a thread
+    records its first value, and by scrapes; shards of threads that have exited are folded into one then, so
+    short-lived threads (such as the one per sent p2p message) do not pile up. Gauges are set with a single
+    dict assignment, or read from a function at scrape time.
+
+    Each process has its own registry: when serving with workers (see webapp.server), the chain and p2p
+    metrics are those of the p2p writer process, on the node's receiving port.
+
+    Metrics:
+        cornellchain_block_validation_seconds{outcome}: Block.is_valid in Blockchain.add_block ("valid" or "invalid")
+        cornellchain_add_block_seconds{result}: Blockchain.add_block ("added", "known" or "invalid")
+        cornellchain_commit_seconds: chain database commits in Blockchain.add_block
+        cornellchain_db_object_loads_total, cornellchain_db_object_stores_total: chain database objects, counted as
+            each connection closes
+        cornellchain_p2p_messages_received_total{type}, cornellchain_p2p_messages_sent_total{type},
+        cornellchain_p2p_send_failures_total{type}, cornellchain_p2p_handle_seconds{type}: p2p messages
+        cornellchain_queue_depth{queue}: items waiting in in-process queues ("p2p-ingest", "push-events")
+        cornellchain_mining_hashes_total, cornellchain_mining_seconds_total, cornellchain_mining_hashrate: PoW mining
+        cornellchain_ba_rounds_total, cornellchain_ba_round, cornellchain_ba_accepted_proposals,
+        cornellchain_ba_completed_total: Byzantine agreement progress (from the "ba-round" and "ba-done" events)
+        cornellchain_signature_verifications_total{result}: signature checks ("valid" or "invalid")
+"""
+import bisect
+import threading
+from blockchain import events
+
+#: Default histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+class Registry:
+    """ A set of metrics, with the per-thread shards their values are recorded in.
+
+    Attributes:
+        metrics (:obj:`list` of metric): Registered metrics, in the order they are rendered.
+        lock (:obj:`threading.Lock`): Guards the shard list; never taken to record a value.
+        local (:obj:`threading.local`): Holds the calling thread's shard, as local.values.
+        shards (:obj:`list` of (:obj:`threading.Thread`, dict)): Every live thread that has recorded a value,
+            and its shard, which maps (metric name, label values) to a count (counters) or a list (histograms).
+        retired (dict): Values recorded by threads that have exited, in the same form as a shard.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+        self.retired = {}
+
+    def register(self, metric):
+        """ Add a metric to those rendered; returns it. """
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def values(self):
+        """ Get the calling thread's shard, creating it on its first use. """
+        try:
+            return self.local.values
+        except AttributeError:
+            values = {}
+            with self.lock:
+                self.retire_shards()
+                self.shards.append((threading.current_thread(), values))
+            self.local.values = values
+            return values
+
+    def retire_shards(self):
+        """ Fold the shards of threads that have exited into retired (with the lock held). """
+        live = []
+        for thread, values in self.shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                merge_values(self.retired, values)
+        self.shards = live
+
+    def collect(self):
+        """ Add up every shard.
+
+        Returns:
+            dict: the totals, in the same form as a shard.
+        """
+        with self.lock:
+            self.retire_shards()
+            totals = {}
+            merge_values(totals, self.retired)
+            for thread, values in self.shards:
+                merge_values(totals, values.copy()) # its thread may be adding keys while we read
+        return totals
+
+    def render(self):
+        """ Render every metric in the Prometheus text exposition format (version 0.0.4). """
+        totals = self.collect()
+        lines = []
+        for metric in list(self.metrics):
+            lines.append("# HELP " + metric.name + " " + metric.documentation)
+            lines.append("# TYPE " + metric.name + " " + metric.type)
+            lines += metric.render(totals)
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """ Forget every recorded value (for tests); gauges are left alone. """
+        with self.lock:
+            self.retired = {}
+            for thread, values in self.shards:
+                values.clear()
+
+def merge_values(totals, values):
+    """ Add the values of one shard into another. """
+    for key, value in values.items():
+        if isinstance(value, list):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(value)
+            else:
+                for position, count in enumerate(value):
+                    total[position] += count
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def format_labels(names, values, extra=""):
+    """ Format label names and values as {name="value",...} (empty without labels). """
+    pairs = [name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_number(value):
+    """ Format a sample value. """
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(value)
+
+class Counter:
+    """ A count that only goes up, optionally split by labels.
+
+    Attributes:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labels (tuple of str): Label names; inc takes a value for each, in order.
+        registry (:obj:`Registry`): Registry the counts are recorded in.
+        local (:obj:`threading.local`): The registry's local (see Registry), read directly on the hot path.
+    """
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.registry = registry or REGISTRY
+        self.local = self.registry.local
+        self.registry.register(self)
+
+    def inc(self, *label_values, amount=1):
+        """ Add amount (default 1) to the count for the given label values. """
+        try:
+            values = self.local.values
+        except AttributeError:
+            values = self.registry.values()
+        key = (self.name, label_values)
+        values[key] = values.get(key, 0) + amount
+
+    def render(self, totals):
+        """ Sample lines for the totals collected by the registry. """
+        samples = sorted((key[1], value) for key, value in totals.items() if key[0] == self.name)
+        if not samples and not self.labels:
+            samples = [((), 0)]
+        return [self.name + format_labels(self.labels, label_values) + " " + format_number(value)
+            for label_values, value in samples]
+
+class Histogram:
+    """ A distribution of observed values, counted in buckets, optionally split by labels.
+
+    Attributes:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labels (tuple of str): Label names; observe takes a value for each, in order, after the value.
+        buckets (tuple of float): Upper bounds of the buckets, ascending (a +Inf bucket is implied).
+        registry (:obj:`Registry`): Registry the counts are recorded in.
+        local (:obj:`threading.local`): The registry's local (see Registry), read directly on the hot path.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.registry = registry or REGISTRY
+        self.local = self.registry.local
+        self.registry.register(self)
+
+    def observe(self, value, *label_values):
+        """ Count a value in its bucket for the given label values. """
+        try:
+            values = self.local.values
+        except AttributeError:
+            values = self.registry.values()
+        key = (self.name, label_values)
+        counts = values.get(key)
+        if counts is None:
+            # one count per bucket (not cumulative), then +Inf, then the sum of the values
+            counts = values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self, totals):
+        """ Sample lines (buckets, sum and count) for the totals collected by the registry. """
+        lines = []
+        for label_values, counts in sorted((key[1], value) for key, value in totals.items() if key[0] == self.name):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(self.name + "_bucket" + format_labels(self.labels, label_values,
+                    'le="' + format_number(float(bound)) + '"') + " " + str(cumulative))
+            lines.append(self.name + "_sum" + format_labels(self.labels, label_values) + " " + format_number(counts[-1]))
+            lines.append(self.name + "_count" + format_labels(self.labels, label_values) + " " + str(cumulative))
+        return lines
+
+class Gauge:
+    """ A value that can go up and down, optionally split by labels; either set directly, or read from
+    a function at scrape time (see track).
+
+    Attributes:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labels (tuple of str): Label names.
+        values (dict): Maps label values to the last value set.
+        functions (dict): Maps label values to a function returning the current value.
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.functions = {}
+        (registry or REGISTRY).register(self) # values are set in place, so it needs no shards
+
+    def set(self, value, *label_values):
+        """ Set the value for the given label values. """
+        self.values[label_values] = value
+
+    def track(self, function, *label_values):
+        """ Read the value for the given label values from function() at every scrape (replacing any earlier one). """
+        self.functions[label_values] = function
+
+    def render(self, totals):
+        """ Sample lines for the values set and tracked (totals are not used). """
+        samples = dict(self.values)
+        for label_values, function in list(self.functions.items()):
+            try:
+                samples[label_values] = function()
+            except Exception as e:
+                print("[metrics] Gauge", self.name, "failed:", e)
+        if not samples and not self.labels:
+            samples[()] = 0
+        return [self.name + format_labels(self.labels, label_values) + " " + format_number(value)
+            for label_values, value in sorted(samples.items())]
+
+class DatabaseMonitor:
+    """ ZODB activity monitor counting the objects each closed connection loaded and stored
+    (see ZODB.DB.setActivityMonitor). """
+
+    def closedConnection(self, connection):
+        loads, stores = connection.getTransferCounts(True)
+        if loads:
+            db_object_loads.inc(amount=loads)
+        if stores:
+            db_object_stores.inc(amount=stores)
+
+#: The process's registry, holding every metric below
+REGISTRY = Registry()
+
+block_validation_seconds = Histogram("cornellchain_block_validation_seconds",
+    "Time to validate a block in add_block, by outcome.", ["outcome"])
+add_block_seconds = Histogram("cornellchain_add_block_seconds", "Time spent adding a block, by result.", ["result"])
+commit_seconds = Histogram("cornellchain_commit_seconds", "Time to commit a block to the chain database.")
+db_object_loads = Counter("cornellchain_db_object_loads_total", "Objects loaded from the chain database.")
+db_object_stores = Counter("cornellchain_db_object_stores_total", "Objects stored to the chain database.")
+p2p_messages_received = Counter("cornellchain_p2p_messages_received_total", "P2p messages handled, by type.", ["type"])
+p2p_messages_sent = Counter("cornellchain_p2p_messages_sent_total", "P2p messages sent, by type.", ["type"])
+p2p_send_failures = Counter("cornellchain_p2p_send_failures_total", "P2p messages that failed to send, by type.", ["type"])
+p2p_handle_seconds = Histogram("cornellchain_p2p_handle_seconds", "Time to handle a p2p message, by type.", ["type"])
+queue_depth = Gauge("cornellchain_queue_depth", "Items waiting in an in-process queue.", ["queue"])
+mining_hashes = Counter("cornellchain_mining_hashes_total", "Seals tried while mining PoW blocks.")
+mining_seconds = Counter("cornellchain_mining_seconds_total", "Time spent mining PoW blocks.")
+mining_hashrate = Gauge("cornellchain_mining_hashrate", "Seals tried per second while mining the last PoW block.")
+ba_rounds = Counter("cornellchain_ba_rounds_total", "Byzantine agreement rounds completed.")
+ba_round = Gauge("cornellchain_ba_round", "Last Byzantine agreement round completed.")
+ba_accepted_proposals = Gauge("cornellchain_ba_accepted_proposals", "Proposals accepted so far by Byzantine agreement.")
+ba_completed = Counter("cornellchain_ba_completed_total", "Byzantine agreement runs that produced an output.")
+signature_verifications = Counter("cornellchain_signature_verifications_total", "Signatures checked, by result.", ["result"])
+
+#: Database monitor for the chain database (see blockchain.chaindb)
+database_monitor = DatabaseMonitor()
+
+def record_ba_round(sender, round, accepted):
+    """ "ba-round" listener. """
+    ba_rounds.inc()
+    ba_round.set(round)
+    ba_accepted_proposals.set(accepted)
+
+def record_ba_done(sender, output):
+    """ "ba-done" listener. """
+    ba_completed.inc()
+
+events.subscribe("ba-round", record_ba_round)
+events.subscribe("ba-done", record_ba_done)
@@ -1,4 +1,6 @@
+import time
 import blockchain
+from blockchain import metrics
 from blockchain.block import Block
 from blockchain.util import nonempty_intersection
 
@@ -37,10 +39,16 @@ class PoWBlock(Block):
         """ PoW mining loop; attempts to seal a block with new seal data until the seal is valid
             (performing brute-force mining).  Terminates once block is valid.
         """
+        started = time.perf_counter()
         nonce = 0
         while not self.seal_is_valid():
             self.set_seal_data(nonce)
             nonce += 1
+        elapsed = time.perf_counter() - started
+        metrics.mining_hashes.inc(amount=nonce + 1)
+        metrics.mining_seconds.inc(amount=elapsed)
+        if elapsed > 0:
+            metrics.mining_hashrate.set((nonce + 1) / elapsed)
 
     def calculate_appropriate_target(self):
         """ For simplicity, we will just keep a constant target / difficulty
@@ -49,4 +57,5 @@ class PoWBlock(Block):
         between blocks  indicating mining is too slow or quick. """
         if self.parent_hash == "genesis":
             return int(2 ** 248)
-        return blockchain.chaindb.chain.blocks[self.parent_hash].target
+        index = blockchain.chaindb.chain.block_index
+        return index.target(index.lookup(self.parent_digest))
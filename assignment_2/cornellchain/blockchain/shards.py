@@ -0,0 +1,285 @@
+""" Resolving the inputs of blocks that extend the tip against the unspent outputs there,
+    either in process (resolve_from_utxos) or with the outputs sharded across worker processes.
+
+    Each worker holds the unspent outputs whose txid falls in its shard (first txid byte
+    modulo the number of shards), as of the tip the coordinator last synced to. Block.is_valid
+    resolves the inputs of blocks extending the current tip through the shards: every shard
+    gets its lookups at once, answers in parallel, and the block goes ahead only if all
+    shards found all of its inputs. Shards only ever follow the committed chain.tip; they
+    catch up lazily, replaying the blocks connected or disconnected since the last sync.
+
+    Enabled by config.VALIDATION_SHARDS.
+"""
+import multiprocessing
+import config
+from blockchain.transaction import OutPoint
+
+#: Coordinator for the shard workers; created on first use (see get_coordinator)
+coordinator = None
+
+def shard_of(txid, shards):
+    """ Get the shard holding the outputs of transaction txid (bytes), out of shards shards. """
+    return txid[0] % shards
+
+def run_shard(connection):
+    """ Worker loop: owns one shard of the unspent outputs and serves coordinator commands.
+
+    Commands are (name, data) tuples:
+        "load": data is the shard's full {OutPoint: TransactionOutput} dict
+        "apply": data is (list of OutPoints to remove, dict of outputs to add)
+        "lookup": data is a list of OutPoints; replies with the unspent output (or None) for each
+        "stop": exits the loop
+    """
+    utxos = {}
+    while True:
+        command, data = connection.recv()
+        if command == "load":
+            utxos = data
+        elif command == "apply":
+            removed, added = data
+            for outpoint in removed:
+                utxos.pop(outpoint, None)
+            utxos.update(added)
+        elif command == "lookup":
+            connection.send([utxos.get(outpoint) for outpoint in data])
+        elif command == "stop":
+            connection.close()
+            return
+
+def collect_inputs(transactions):
+    """ Resolve the same-block spends of a block extending the tip, and list the inputs left to look up.
+
+    Every input must be unspent at the tip or created earlier in the block; that single condition
+    covers output lookup, double spend, double inclusion and on-chain checks at once.
+
+    Args:
+        transactions (:obj:`list` of :obj:`Transaction`): The block's transactions.
+
+    Returns:
+        (:obj:`list` of :obj:`list` of :obj:`TransactionOutput`), (:obj:`list` of tuple): outputs spent by each
+        transaction, with None for those still to look up, and a (outputs list, position, OutPoint) entry
+        for each of them; or None, None if the block certainly fails (the caller reruns the full checks
+        for the exact error).
+    """
+    txs_in_block = {}
+    inputs_spent_in_block = set()
+    pending = []
+    spent_outputs = []
+    for tx in transactions:
+        if tx.txid in txs_in_block:
+            return None, None
+        outputs = []
+        for input_ref in tx.input_refs:
+            if input_ref in inputs_spent_in_block or not isinstance(input_ref.txid, bytes):
+                return None, None
+            inputs_spent_in_block.add(input_ref)
+            if input_ref.txid in txs_in_block:
+                candidate_tx = txs_in_block[input_ref.txid]
+                if not input_ref.index < len(candidate_tx.outputs):
+                    return None, None
+                outputs.append(candidate_tx.outputs[input_ref.index])
+            else:
+                pending.append((outputs, len(outputs), input_ref))
+                outputs.append(None)
+        spent_outputs.append(outputs)
+        txs_in_block[tx.txid] = tx
+    return spent_outputs, pending
+
+def resolve_from_utxos(chain, transactions, changes=None):
+    """ Resolve the inputs of a block extending chain.tip against chain.utxos, in process.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain whose unspent outputs to look in.
+        transactions (:obj:`list` of :obj:`Transaction`): The block's transactions.
+        changes (:obj:`dict`, optional): For a block on another branch, how the unspent outputs at its parent
+            differ from those at the tip (see Blockchain.branch_utxo_changes).
+
+    Returns:
+        (:obj:`list` of :obj:`list` of :obj:`TransactionOutput`): outputs spent by each transaction,
+        or None if any input is not unspent (see collect_inputs).
+    """
+    spent_outputs, pending = collect_inputs(transactions)
+    if spent_outputs is None:
+        return None
+    for outputs, position, input_ref in pending:
+        if changes is not None and input_ref in changes:
+            output = changes[input_ref]
+        else:
+            output = chain.utxos.get(input_ref)
+        if output is None:
+            return None
+        outputs[position] = output
+    return spent_outputs
+
+def block_delta(chain, block, connect):
+    """ Net change to the unspent outputs from connecting or disconnecting a block.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain holding the block's undo data (or, once it was disconnected there,
+            its input transactions).
+        block (:obj:`Block`): Block to connect or disconnect.
+        connect (bool): True to connect block on top of its parent, False to disconnect it.
+
+    Returns:
+        (:obj:`list` of :obj:`OutPoint`), (:obj:`dict` of (:obj:`OutPoint` to :obj:`TransactionOutput`)):
+        outputs to remove, then outputs to add; or None, None if the outputs a disconnected block spent
+        cannot be found (its undo data is gone and its input transactions are below a snapshot or pruned).
+    """
+    created = {}
+    spent = []
+    for tx in block.transactions:
+        spent.extend(tx.input_refs)
+        for output_index, output in enumerate(tx.outputs):
+            created[OutPoint(tx.txid, output_index)] = output
+    if connect:
+        for input_ref in spent:
+            created.pop(input_ref, None) # created and spent in this block
+        return spent, created
+    restored = {}
+    undo = chain.undo.get(block.digest)
+    if undo is not None:
+        for input_ref, output in undo:
+            if not input_ref in created:
+                restored[input_ref] = output
+        return list(created), restored
+    for input_ref in spent:
+        if input_ref in created:
+            continue
+        if not input_ref.txid in chain.all_transactions:
+            return None, None
+        restored[input_ref] = chain.all_transactions[input_ref.txid].outputs[input_ref.index]
+    return list(created), restored
+
+class ShardCoordinator:
+    """ Starts the shard workers, keeps them in step with a chain and merges their answers.
+
+    Attributes:
+        shards (int): Number of shards (and worker processes).
+        connections (:obj:`list` of :obj:`multiprocessing.connection.Connection`): Pipe to each worker.
+        workers (:obj:`list` of :obj:`multiprocessing.Process`): The worker processes.
+        tip (bytes): Digest of the tip the shards reflect (None until the first sync).
+    """
+
+    def __init__(self, shards):
+        """ Start shards worker processes, each with an empty shard. """
+        self.shards = shards
+        self.connections = []
+        self.workers = []
+        for shard in range(shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=run_shard, args=(worker_connection,), daemon=True)
+            worker.start()
+            self.connections.append(connection)
+            self.workers.append(worker)
+        self.tip = None
+
+    def stop(self):
+        """ Stop all workers. """
+        for connection in self.connections:
+            connection.send(("stop", None))
+        for worker in self.workers:
+            worker.join()
+
+    def send_split(self, command, removed, added):
+        """ Send each shard its part of a set of removed and added outputs. """
+        removed_by_shard = [[] for shard in range(self.shards)]
+        added_by_shard = [{} for shard in range(self.shards)]
+        for outpoint in removed:
+            if isinstance(outpoint.txid, bytes):
+                removed_by_shard[shard_of(outpoint.txid, self.shards)].append(outpoint)
+        for outpoint, output in added.items():
+            added_by_shard[shard_of(outpoint.txid, self.shards)][outpoint] = output
+        for shard, connection in enumerate(self.connections):
+            if command == "load":
+                connection.send(("load", added_by_shard[shard]))
+            else:
+                connection.send(("apply", (removed_by_shard[shard], added_by_shard[shard])))
+
+    def sync(self, chain):
+        """ Bring the shards to chain.tip, replaying the blocks between the tip they last saw and the new one.
+        The unspent outputs at a block only depend on the blocks leading to it, so this works across reloads
+        of the chain from the database; the shards are only reloaded from chain.utxos in full if the old tip
+        is not in chain or a disconnected block's spent outputs cannot be found. """
+        if chain.tip == self.tip:
+            return
+        deltas = self.deltas(chain)
+        if deltas is None:
+            self.send_split("load", [], dict(chain.utxos.items()))
+        else:
+            for removed, added in deltas:
+                self.send_split("apply", removed, added)
+        self.tip = chain.tip
+
+    def deltas(self, chain):
+        """ Get the changes (see block_delta) taking the unspent outputs at self.tip to those at chain.tip,
+        or None if they cannot be worked out. """
+        index = chain.block_index
+        old_id = index.lookup(self.tip)
+        new_id = index.lookup(chain.tip)
+        if old_id is None or new_id is None:
+            return None
+        fork_id = index.last_common_ancestor(old_id, new_id)
+        deltas = []
+        block_id = old_id
+        while block_id != fork_id:
+            block = chain.blocks.get(index.digest(block_id))
+            if block is None:
+                return None # header only
+            removed, added = block_delta(chain, block, False)
+            if removed is None:
+                return None
+            deltas.append((removed, added))
+            block_id = index.parents[block_id]
+        new_branch = []
+        block_id = new_id
+        while block_id != fork_id:
+            new_branch.append(index.digest(block_id))
+            block_id = index.parents[block_id]
+        for digest in reversed(new_branch):
+            block = chain.blocks.get(digest)
+            if block is None:
+                return None
+            deltas.append(block_delta(chain, block, True))
+        return deltas
+
+    def resolve(self, chain, transactions):
+        """ Resolve the inputs of a block extending chain.tip through the shards; every shard gets
+        its lookups at once and they answer in parallel.
+
+        Args:
+            chain (:obj:`Blockchain`): Chain the block extends (at its tip).
+            transactions (:obj:`list` of :obj:`Transaction`): The block's transactions.
+
+        Returns:
+            (:obj:`list` of :obj:`list` of :obj:`TransactionOutput`): outputs spent by each transaction,
+            or None if any input is not unspent (see collect_inputs).
+        """
+        self.sync(chain)
+        spent_outputs, pending = collect_inputs(transactions)
+        if spent_outputs is None:
+            return None
+        lookups = [[] for shard in range(self.shards)]
+        positions = [] # (shard, position in the shard's answer) for each pending input
+        for outputs, position, input_ref in pending:
+            shard = shard_of(input_ref.txid, self.shards)
+            positions.append((shard, len(lookups[shard])))
+            lookups[shard].append(input_ref)
+
+        for shard, connection in enumerate(self.connections):
+            connection.send(("lookup", lookups[shard]))
+        answers = [connection.recv() for connection in self.connections]
+        for (outputs, position, input_ref), (shard, answer_position) in zip(pending, positions):
+            output = answers[shard][answer_position]
+            if output is None:
+                return None
+            outputs[position] = output
+        return spent_outputs
+
+def get_coordinator():
+    """ Get the shard coordinator, (re)starting its workers if config.VALIDATION_SHARDS changed. """
+    global coordinator
+    if coordinator is None or coordinator.shards != config.VALIDATION_SHARDS:
+        if coordinator is not None:
+            coordinator.stop()
+        coordinator = ShardCoordinator(config.VALIDATION_SHARDS)
+    return coordinator
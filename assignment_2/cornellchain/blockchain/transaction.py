@@ -1,7 +1,76 @@
-from blockchain.util import encode_as_str, sha256_2_string
-import persistent
+from functools import total_ordering
+from blockchain.util import encode_as_str, sha256_2_bytes, hash_from_hex
 
-class TransactionOutput(persistent.Persistent):
+@total_ordering
+class OutPoint:
+    """ Immutable reference to a single output of a transaction, parsed once from its
+        "txhash:index" string form. """
+
+    __slots__ = ("txid", "index")
+
+    def __init__(self, txid, index):
+        """ Create a reference to output number index of transaction txid.
+
+        Args:
+            txid (bytes): Raw 32-byte hash of the transaction holding the output.
+                Malformed references keep their original text here instead, so the
+                spending transaction still hashes as it was sent; they never resolve.
+            index (int): Position of the output in that transaction's outputs.
+        """
+        object.__setattr__(self, "txid", txid)
+        object.__setattr__(self, "index", index)
+
+    @classmethod
+    def from_string(cls, input_ref):
+        """ Parse an input reference of the form "txhash:index".
+
+        Args:
+            input_ref (str): Hex transaction hash and output index separated by ":".
+
+        Returns:
+            :obj:`OutPoint`: The parsed reference.
+
+        Raises:
+            ValueError: If the output index is not an integer.
+        """
+        tx_hash, _, index = input_ref.partition(":")
+        txid = hash_from_hex(tx_hash)
+        return cls(tx_hash if txid is None else txid, int(index))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("OutPoint is immutable")
+
+    def __getstate__(self):
+        return (self.txid, self.index)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "txid", state[0])
+        object.__setattr__(self, "index", state[1])
+
+    def __eq__(self, other):
+        if not isinstance(other, OutPoint):
+            return NotImplemented
+        return self.txid == other.txid and self.index == other.index
+
+    def __hash__(self):
+        return hash((self.txid, self.index))
+
+    def __lt__(self, other):
+        """ Order by (txid, index), so outpoints can key a BTree (only well-formed ones are comparable). """
+        if not isinstance(other, OutPoint):
+            return NotImplemented
+        return (self.txid, self.index) < (other.txid, other.index)
+
+    def __repr__(self):
+        """ Gets the "txhash:index" string form of the reference (used in transaction headers). """
+        tx_hash = self.txid.hex() if isinstance(self.txid, bytes) else self.txid
+        return tx_hash + ":" + str(self.index)
+
+class TransactionOutput:
+    """ Immutable value type; outputs are pickled inline with their transaction
+        rather than stored as separate database objects. """
+
+    __slots__ = ("sender", "receiver", "amount")
 
     def __init__(self, sender, receiver, amount):
         """ Class representing a transaction output in the UTXO model.
@@ -11,35 +80,98 @@ class TransactionOutput(persistent.Persistent):
             receiver (str): Account receiving (and later potentially spending) the output.
             amount (int): Amount being transferred.
         """
-        self.sender = sender
-        self.receiver = receiver
-        self.amount = amount
+        object.__setattr__(self, "sender", sender)
+        object.__setattr__(self, "receiver", receiver)
+        object.__setattr__(self, "amount", amount)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TransactionOutput is immutable")
+
+    def __getstate__(self):
+        """ Compact pickle state: a plain (sender, receiver, amount) tuple. """
+        return (self.sender, self.receiver, self.amount)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "sender", state[0])
+        object.__setattr__(self, "receiver", state[1])
+        object.__setattr__(self, "amount", state[2])
+
+    def __eq__(self, other):
+        if not isinstance(other, TransactionOutput):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __hash__(self):
+        return hash(self.__getstate__())
 
     def __repr__(self):
         """ Gets unique string representation of an output. """
         return encode_as_str([self.sender, self.receiver, self.amount], sep="~")
 
-class Transaction(persistent.Persistent):
+class Transaction:
+    """ Immutable value type; transactions are pickled inline with the block containing them
+        rather than stored as separate database objects. """
+
+    __slots__ = ("input_refs", "outputs", "txid")
 
     def __init__(self, input_refs, outputs):
-        """ Class representing a transaction output in the UTXO model.
+        """ Class representing a transaction in the UTXO model.
 
         Args:
-            sender (str): Account sending (creating) the output.
-            receiver (str): Account receiving (and later potentially spending) the output.
-            amount (int): Amount being transferred.
+            input_refs (:obj:`list` of str or :obj:`OutPoint`): References to the outputs spent,
+                either parsed or as "txhash:index" strings.
+            outputs (:obj:`list` of :obj:`TransactionOutput`): Outputs created by the transaction.
+
+        Attributes:
+            input_refs (:obj:`tuple` of :obj:`OutPoint`): References to the outputs spent.
+            outputs (:obj:`tuple` of :obj:`TransactionOutput`): Outputs created by the transaction.
+            txid (bytes): Raw SHA256^2 hash of the transaction header (self.header()); used as its index key.
+        """
+        object.__setattr__(self, "input_refs",
+            tuple(OutPoint.from_string(ref) if isinstance(ref, str) else ref for ref in input_refs))
+        object.__setattr__(self, "outputs", tuple(outputs))
+        object.__setattr__(self, "txid", self.calculate_txid())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Transaction is immutable")
+
+    def __getstate__(self):
+        """ Compact pickle state: (input_refs, outputs, txid), so the hash is not recomputed on load. """
+        return (self.input_refs, self.outputs, self.txid)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "input_refs", state[0])
+        object.__setattr__(self, "outputs", state[1])
+        object.__setattr__(self, "txid", state[2])
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return self.txid == other.txid
+
+    def __hash__(self):
+        return hash(self.txid)
+
+    @property
+    def hash(self):
+        """ str: Hex-encoded SHA256^2 hash of the transaction header, as shown to users and sent over the wire. """
+        return self.txid.hex()
+
+    def calculate_txid(self):
+        """ Get the raw hash of the transaction header.
+
+        Returns:
+            bytes: SHA256^2 digest of the transaction header.
         """
-        self.input_refs = input_refs
-        self.outputs = outputs
-        self.hash = self.calculate_hash()
+        return sha256_2_bytes(str(self.header()))
 
     def calculate_hash(self):
-        """ Get the hash of the block header.
+        """ Get the hash of the transaction header.
 
         Returns:
-            str: SHA256^2 hash of the block header.
+            str: Hex-encoded SHA256^2 hash of the transaction header.
         """
-        return sha256_2_string(str(self.header()))
+        return self.calculate_txid().hex()
 
     def is_valid(self):
         """ Checks if a transaction is well-formed, returning True iff a transaction obeys syntactic rules. """
@@ -47,7 +179,7 @@ class Transaction(persistent.Persistent):
 
     def header(self):
         """ Get string encoding of a transaction's header. """
-        return encode_as_str([";".join(self.input_refs), ";".join([str(out) for out in self.outputs])], sep="-")
+        return encode_as_str([";".join([str(ref) for ref in self.input_refs]), ";".join([str(out) for out in self.outputs])], sep="-")
 
     def __repr__(self):
         """ Get unique string encoding of a transaction, including its hash (ID). """
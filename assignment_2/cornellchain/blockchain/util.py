@@ -1,6 +1,7 @@
 import binascii
 import ecdsa
 from ecdsa import SigningKey, VerifyingKey
+from blockchain import metrics
 
 def sha256_2_string(string_to_hash):
     """ Returns the SHA256^2 hash of a given string input
@@ -22,6 +23,38 @@ def sha256_2_string(string_to_hash):
     # Placeholder for (1a)
     return "deadbeef"
 
+def sha256_2_bytes(string_to_hash):
+    """ Returns the raw SHA256^2 digest of a given string input.
+
+    Args:
+        string_to_hash (str): Input string to hash twice
+
+    Returns:
+        bytes: 32-byte output of double-SHA256.
+    """
+    import hashlib
+    return hashlib.sha256(hashlib.sha256(string_to_hash.encode("utf8")).digest()).digest()
+
+def hash_from_hex(hex_hash):
+    """ Converts a hex-encoded SHA256^2 hash to the raw 32 bytes used as index keys.
+
+    Args:
+        hex_hash (str): 64-character lowercase hexadecimal hash.
+
+    Returns:
+        bytes: The raw digest, or None if hex_hash is not a well-formed hash.
+    """
+    if not isinstance(hex_hash, str) or len(hex_hash) != 64:
+        return None
+    try:
+        digest = bytes.fromhex(hex_hash)
+    except ValueError:
+        return None
+    if digest.hex() != hex_hash:
+        # only accept the canonical encoding, so bytes -> hex gives back the exact input
+        return None
+    return digest
+
 def encode_as_str(list_to_encode, sep = "|"):
     """ Encodes a list as a string with given separator.
 
@@ -83,8 +116,11 @@ def is_message_signed(message, hex_sig, public_key):
         signature = binascii.unhexlify(hex_sig)
         pk = VerifyingKey.from_string(binascii.unhexlify(public_key))
     except binascii.Error:
+        metrics.signature_verifications.inc("invalid")
         return False
     try:
-        return pk.verify(signature, message.encode("utf-8"))
+        signed = pk.verify(signature, message.encode("utf-8"))
     except ecdsa.keys.BadSignatureError:
-        return False
+        signed = False
+    metrics.signature_verifications.inc("valid" if signed else "invalid")
+    return signed
@@ -0,0 +1,39 @@
+import os
+import sys
+import config
+
+USAGE = "Usage: python3 blockfile.py [export|import] [block file] [node id, 1-6 (optional)] [from height (optional)]"
+
+def report(action, blocks, size, seconds):
+    print("%s %d blocks, %.1f MB in %.2fs: %.1f blocks/s, %.2f MB/s" % (action, blocks, size / 1e6, seconds,
+        blocks / seconds if seconds else 0, size / 1e6 / seconds if seconds else 0))
+
+if __name__ == '__main__':
+
+    # Validate arguments and show help if failed
+    if len(sys.argv) < 3 or not sys.argv[1] in ("export", "import"):
+        print(USAGE)
+        exit(1)
+    command, path = sys.argv[1], sys.argv[2]
+    if len(sys.argv) > 3 and sys.argv[3] != "0":
+        config.DB_PATH = "database" + os.sep + str(int(sys.argv[3])) + os.sep + "node.db"
+
+    from blockchain import chaindb
+    from blockchain.chaindb import blockfile
+    chain = chaindb.chain
+
+    if command == "export":
+        from_height = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+        with open(path, "wb") as out_file:
+            blocks, size, seconds = blockfile.export_blocks(chain, out_file, from_height)
+        report("Exported", blocks, size, seconds)
+    else:
+        # by default, resume after the blocks already imported (file order is height order,
+        # so every block below the highest stored height has been added already)
+        from_height = int(sys.argv[4]) if len(sys.argv) > 4 else max(chain.get_max_height(), 0)
+        with open(path, "rb") as in_file:
+            read, added, size, seconds = blockfile.import_blocks(chain, in_file, from_height)
+        report("Imported", read, size, seconds)
+        print("Added", added, "new blocks from height", from_height, "; best height now", chain.get_max_height())
+    chaindb.connection.close()
+    chaindb.db.close()
@@ -3,7 +3,7 @@ import config
 import json
 import random
 from p2p import synchrony, gossip
-from blockchain import util
+from blockchain import util, events
 from blockchain.util import run_async
 
 class SimplePKIBA:
@@ -137,5 +137,7 @@ class SimplePKIBA:
                 time.sleep(.2)
                 print("[byz-ag] waiting to send votes in round", self.curr_round_number)
             self.broadcast_votes_for(self.curr_round_number, round_votes)
+            events.emit("ba-round", sender=self.sender, round=self.curr_round_number, accepted=len(self.s_i))
 
         print("[byz-ag] done!  output", self.get_output())
+        events.emit("ba-done", sender=self.sender, output=str(self.get_output()))
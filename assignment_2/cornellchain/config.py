@@ -1,11 +1,67 @@
 # Default database path; can be changed
 DB_PATH = "database/blockchain.db"
+# database storage: "file" (at DB_PATH), "memory" (nothing on disk, lost on exit) or "zeo" (a client of the
+# ZEO server at ZEO_ADDRESS, so several processes can share one chain; run_node.py sets this up when serving with workers);
+# the CORNELLCHAIN_STORAGE environment variable overrides it (see blockchain/chaindb/storages.py)
+DB_STORAGE = "file"
+ZEO_ADDRESS = ("127.0.0.1", 9000)
 
 # don't change these; for PoA
 # (encoded as hex)
 AUTHORITY_SK = "404a28d57118d33f7c59146f512b725b5f1336843ba1c8fe"
 AUTHORITY_PK = "356c54fc3e57666eef27547ecf0257f8a27540ff7c145a2bcd8921d6e536f0208cbf98e220048d1e17e69dd587049e72"
 
+# worker processes for transaction checks in Block.is_valid; 0 checks in the calling process
+VALIDATION_PROCESSES = 0
+# blocks with fewer transactions than this are always checked in the calling process
+PARALLEL_VALIDATION_MIN_TXS = 100
+# worker processes holding the unspent outputs, sharded by txid, for resolving block inputs; 0 disables
+VALIDATION_SHARDS = 0
+
+# assume-valid checkpoints, as (height, block hash) pairs: blocks at these heights must have these hashes,
+# and blocks up to the highest checkpoint skip transaction checks (keeping merkle, hash, header and seal checks)
+CHECKPOINTS = []
+
+# blocks below the tip after which the best chain is final: forks off it are pruned and can no longer be added;
+# 0 disables (Blockchain.finalize can still be called directly, eg with a Byzantine agreement output)
+FINALITY_DEPTH = 0
+
+# pruned-node mode: transactions whose outputs were all spent at least this many blocks below the tip are dropped
+# (with block bodies left empty), keeping headers and unspent outputs; forks below that depth are rejected; 0 disables
+PRUNE_DEPTH = 0
+
+# historical block bodies to request from peers at a time, after importing a chain state snapshot
+BACKFILL_BATCH = 10
+# seconds to wait for a requested body before asking another peer for it
+BACKFILL_TIMEOUT = 30
+
+# blocks per page in the block explorer, by default and at most (the ?count= parameter picks within that)
+EXPLORER_PAGE_SIZE = 20
+EXPLORER_MAX_PAGE_SIZE = 500
+
+# limit on the total size (in characters) of rendered pages and API responses the webapp keeps in memory; 0 disables
+WEB_CACHE_SIZE = 32 * 1024 * 1024
+
+# events (at least 1) each server-sent events client (/events) can fall behind by before its oldest are dropped,
+# and seconds between keepalive comments on an idle event stream
+PUSH_BUFFER_SIZE = 100
+PUSH_KEEPALIVE = 15
+
+# production serving (python3 run_node.py [node id] [web workers] [threads]): the explorer and API are served by
+# worker processes on WEB_PORT_BASE + node id, p2p messages by a single writer process on the node's receiving port,
+# and the chain by a ZEO server on ZEO_PORT_BASE + node id; defaults for the number of workers and threads per worker
+WEB_PORT_BASE = 8000
+ZEO_PORT_BASE = 9000
+WEB_WORKERS = 4
+WEB_THREADS = 4
+# whether this process handles /p2pmessage (only the writer does, when serving with workers)
+P2P_WRITER = True
+# asynchronous serving (python3 run_node.py [node id] [web workers] [threads] asgi; see webapp/asgi.py): the gunicorn
+# worker class running the ASGI app ("uvicorn.workers.UvicornWorker" also works), and the number of p2p messages
+# that can wait for the writer before more are refused
+ASGI_WORKER_CLASS = "asgi"
+P2P_QUEUE_SIZE = 1000
+
 # full peer list; MUST include the trailing slash!
 # used in gossip, BA, consensus, etc.
 PEERS = {
@@ -1,5 +1,5 @@
 import config
-from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
 from blockchain.pow_block import PoWBlock
 from blockchain import chaindb
 import random
@@ -10,82 +10,108 @@ HEIGHT_TO_REACH = 100
 MAX_TXS_PER_BLOCK = 50
 FORK_PROBABILITY = .3
 
-# basic wallet functionality; track UTXOs for users
-user_utxos = {}
-for user in USERS:
-    user_utxos[user] = []
+def generate_chain(chain, height_to_reach=HEIGHT_TO_REACH, max_txs_per_block=MAX_TXS_PER_BLOCK,
+        fork_probability=FORK_PROBABILITY, broadcast=True):
+    """ Mine a random PoW chain with forks into the given blockchain.
 
-# insert genesis block; populate all users w huge balance
-outputs = []
-for user in USERS:
-    genesis_utxo = TransactionOutput("Genesis", user, 100000000)
-    outputs.append(genesis_utxo)
-genesis_tx = Transaction([], outputs)
-for user_num in range(len(USERS)):
-    user = USERS[user_num]
-    user_utxos[user].append((genesis_tx.hash + ":" + str(user_num), 100000000))
-genesis_block = PoWBlock(0, [genesis_tx], "genesis", is_genesis=True)
-chaindb.chain.add_block(genesis_block)
+    Args:
+        chain (:obj:`Blockchain`): Blockchain to add blocks to (should be the one in chaindb.chain, which mining reads targets from).
+        height_to_reach (int, optional): Height of the last block to mine.
+        max_txs_per_block (int, optional): Upper bound on random transactions per block (early blocks get 100 more).
+        fork_probability (float, optional): Chance that each block forks from a random previous block.
+        broadcast (bool, optional): Whether to gossip every block to peers.
 
-gossip.gossip_message("addblock", genesis_block)
+    Returns:
+        (:obj:`list` of :obj:`Block`): All blocks added, in the order they were added.
+    """
+    # insert genesis block; populate all users w huge balance
+    outputs = []
+    for user in USERS:
+        genesis_utxo = TransactionOutput("Genesis", user, 100000000)
+        outputs.append(genesis_utxo)
+    genesis_tx = Transaction([], outputs)
+    genesis_block = PoWBlock(0, [genesis_tx], "genesis", is_genesis=True)
+    chain.add_block(genesis_block)
+    added_blocks = [genesis_block]
 
-curr_height = 1
-parent = genesis_block
+    if broadcast:
+        gossip.gossip_message("addblock", genesis_block)
 
+    curr_height = 1
+    parent = genesis_block
 
-while curr_height <= HEIGHT_TO_REACH:
-    chain = chaindb.chain
-    txs = []
-    if random.random() < FORK_PROBABILITY:
-        if parent.parent_hash == "genesis":
-            continue
-        curr_height -= 1
-        new_parent_hash = random.choice(chain.chain[curr_height - 1]) # fork random previous block
-        parent = chain.blocks[new_parent_hash]
+    while curr_height <= height_to_reach:
+        txs = []
+        if random.random() < fork_probability:
+            if parent.parent_hash == "genesis":
+                continue
+            curr_height -= 1
+            new_parent_hash = random.choice(chain.get_blockhashes_at_height(curr_height - 1)) # fork random previous block
+            parent = chain.get_block(new_parent_hash)
 
-    eligible_parents = [chain.blocks[block_hash] for block_hash in chain.get_chain_ending_with(parent.hash)]
-    eligible_txs = []
-    for parent_candidate in eligible_parents:
-        eligible_txs += [tx.hash for tx in parent_candidate.transactions]
+        eligible_parents = [chain.get_block(block_hash) for block_hash in chain.get_chain_ending_with(parent.hash)]
+        eligible_txs = set()
+        for parent_candidate in eligible_parents:
+            eligible_txs.update([tx.hash for tx in parent_candidate.transactions])
+        eligible_hashes = set(parent_candidate.hash for parent_candidate in eligible_parents)
 
-    num_txs = int(random.random() * MAX_TXS_PER_BLOCK)
-    if curr_height < 10:
-        num_txs += 100 # seed early blocks with lots of txs to prevent duplicate hashes
-    for i in range(num_txs):
-        # choose a random sender and receiver
-        sender = random.choice(USERS)
-        receiver = random.choice(USERS)
-        if len(user_utxos[sender]) == 0:
-            continue
-        parent_utxo = random.choice(user_utxos[sender])
-        tries = 0
-        while not parent_utxo[0].split(":")[0] in eligible_txs:
+        # basic wallet functionality: start from the users' best-chain UTXOs in the node's wallet index,
+        # keep those also unspent on the parent's chain, and track the ones this block spends and creates
+        user_utxos = {}
+        for user in USERS:
+            user_utxos[user] = [utxo for utxo in chain.get_unspent_outputs(user)
+                if is_unspent_on(chain, utxo[0], eligible_txs, eligible_hashes)]
+
+        num_txs = int(random.random() * max_txs_per_block)
+        if curr_height < 10:
+            num_txs += 100 # seed early blocks with lots of txs to prevent duplicate hashes
+        for i in range(num_txs):
+            # choose a random sender and receiver
+            sender = random.choice(USERS)
+            receiver = random.choice(USERS)
+            if len(user_utxos[sender]) == 0:
+                continue
             parent_utxo = random.choice(user_utxos[sender])
-            tries += 1
-            if tries > 200000:
-                break
-        if tries > 200000:
-            break
-        user_utxos[sender].remove(parent_utxo)
-        amount_to_send = int(parent_utxo[1] * random.random())
-        change_amount = parent_utxo[1] - amount_to_send
-        sending_utxo = TransactionOutput(sender, receiver, amount_to_send)
-        change_utxo = TransactionOutput(sender, sender, change_amount)
-        tx = Transaction([parent_utxo[0]], [sending_utxo, change_utxo])
-        txs.append(tx)
-        eligible_txs.append(tx.hash)
-        user_utxos[receiver].append((tx.hash + ":0", amount_to_send))
-        user_utxos[sender].append((tx.hash + ":1", change_amount))
+            user_utxos[sender].remove(parent_utxo)
+            amount_to_send = int(parent_utxo[1] * random.random())
+            change_amount = parent_utxo[1] - amount_to_send
+            sending_utxo = TransactionOutput(sender, receiver, amount_to_send)
+            change_utxo = TransactionOutput(sender, sender, change_amount)
+            tx = Transaction([parent_utxo[0]], [sending_utxo, change_utxo])
+            txs.append(tx)
+            user_utxos[receiver].append((tx.hash + ":0", amount_to_send))
+            user_utxos[sender].append((tx.hash + ":1", change_amount))
+
+        block = PoWBlock(curr_height, txs, parent.hash)
+        block.mine()
+        out_status = chain.add_block(block)
+        if not out_status:
+            # block add failed; try again
+            continue
+        added_blocks.append(block)
+        if broadcast:
+            gossip.gossip_message("addblock", block)
+        print("Added block at height", curr_height)
+        print(block.hash)
+        curr_height += 1
+        parent = block
+    return added_blocks
+
+def is_unspent_on(chain, input_ref, eligible_txs, eligible_hashes):
+    """ Check whether a best-chain UTXO can also be spent by a block extending another chain.
+
+    Args:
+        chain (:obj:`Blockchain`): Blockchain the UTXO was read from.
+        input_ref (str): "txhash:index" reference to the output.
+        eligible_txs (:obj:`set` of str): Hashes of the transactions on the other chain.
+        eligible_hashes (:obj:`set` of str): Hashes of the blocks on the other chain.
 
-    block = PoWBlock(curr_height, txs, parent.hash)
-    block.mine()
-    out_status = chain.add_block(block)
-    if not out_status:
-        # block add failed; try again
-        continue
-    gossip.gossip_message("addblock", block)
-    print("Added block at height", curr_height)
-    print(block.hash)
-    curr_height += 1
-    parent = block
+    Returns:
+        bool: True if the output was created, and not spent, on the other chain.
+    """
+    if not input_ref.split(":")[0] in eligible_txs:
+        return False
+    return not any(digest.hex() in eligible_hashes for digest in chain.blocks_spending(OutPoint.from_string(input_ref)))
 
+if __name__ == '__main__':
+    generate_chain(chaindb.chain)
@@ -1,9 +1,15 @@
+import time
 import config
+import random
 import requests
 import importlib
 from p2p import synchrony
-from p2p.interfaces.block import string_to_block
+from p2p.interfaces.block import string_to_block, string_to_header
 from blockchain.util import run_async
+from blockchain import metrics
+
+#: Message types handle_message acts on; others are counted as "other" in the metrics
+MESSAGE_TYPES = ("addblock", "getblock", "blockbody", "synchrony-start", "ba-start", "ba-vote")
 
 @run_async
 def send_message(dest, type, message):
@@ -14,9 +20,12 @@ def send_message(dest, type, message):
             type (str): Type of message to process as; unknown types are ignored.
             message (str): Payload to deliver to destination to be processed based on type.
     """
+    metric_type = type if type in MESSAGE_TYPES else "other"
+    metrics.p2p_messages_sent.inc(metric_type)
     try:
         print(requests.post(dest + "p2pmessage/" + type + "/" + str(config.receiving_port), data=str(message), timeout=2).text)
     except Exception as e:
+        metrics.p2p_send_failures.inc(metric_type)
         print("[p2p error] Message failed to send to", dest)
         print(e)
 
@@ -31,6 +40,34 @@ def gossip_message(type, message):
 
     # (placeholder for 1)
 
+#: Maps digests of the block bodies requested by request_missing_bodies to when they were requested
+requested_bodies = {}
+
+def request_missing_bodies(chain, count=1):
+    """ Ask random peers for the bodies of up to count blocks known only by their header
+        (after a snapshot import); they arrive asynchronously as "blockbody" messages.
+        Bodies already requested are skipped until they arrive or config.BACKFILL_TIMEOUT passes,
+        so repeated calls spread over later gaps instead of asking for the same bodies again.
+
+        Args:
+            chain (:obj:`Blockchain`): Chain whose missing bodies to request.
+            count (int, optional): Maximum number of bodies to request.
+    """
+    if len(config.PEERS) == 0 or config.PRUNE_DEPTH:
+        return # pruned nodes keep only headers below the prune depth
+    now = time.monotonic()
+    for digest, requested in list(requested_bodies.items()):
+        if now - requested >= config.BACKFILL_TIMEOUT:
+            del requested_bodies[digest] # lost or ignored; ask again
+    for digest in chain.headers.keys():
+        if count <= 0:
+            break
+        if digest in requested_bodies:
+            continue
+        requested_bodies[digest] = now
+        send_message(random.choice(list(config.PEERS.values())), "getblock", digest.hex())
+        count -= 1
+
 def handle_message(type, message, sender):
     """ Used to handle an incoming message sent by another node (heh-heh-heyyyy!).
 
@@ -40,21 +77,61 @@ def handle_message(type, message, sender):
             sender (str): Sender of message (primarily used to find key in PKI).
     """
     print("SENDER", sender)
+    started = time.perf_counter()
+    metric_type = type if type in MESSAGE_TYPES else "other"
+    metrics.p2p_messages_received.inc(metric_type)
 
     if type == "addblock":
         # Add block to blockchain
+        from blockchain import chaindb
+        chaindb.connection.close()
+        chaindb.db.close()
+        importlib.reload(chaindb)
+        chain = chaindb.chain
+        # check the header first, so known or invalid blocks are dropped before their transactions are parsed
+        header = string_to_header(message)
+        if not header:
+            print("[p2p] Malformed block header")
+        elif not header.digest in chain.blocks:
+            header_valid, reason = header.validate_header()
+            if not header_valid:
+                print("[p2p] Block header rejected:", reason)
+            else:
+                block = string_to_block(message)
+                if block:
+                    print("[p2p] Blockhash imported", block.hash)
+                if block and chain.add_block(block):
+                    # if it's a valid block we haven't seen, retransmit
+                    gossip_message(type, message)
+        # new blocks show peers are live; use them to backfill history missing after a snapshot import
+        request_missing_bodies(chain, config.BACKFILL_BATCH)
+        chaindb.connection.close()
+        chaindb.db.close()
+
+    if type == "getblock":
+        # Send a peer the full block it asked for, if we have it
+        from blockchain import chaindb
+        chaindb.connection.close()
+        chaindb.db.close()
+        importlib.reload(chaindb)
+        block = chaindb.chain.get_block(message)
+        if block is not None:
+            send_message(sender, "blockbody", block)
+        chaindb.connection.close()
+        chaindb.db.close()
+
+    if type == "blockbody":
+        # Fill in a historical block body we asked for, then ask for the next one
         block = string_to_block(message)
         from blockchain import chaindb
         chaindb.connection.close()
         chaindb.db.close()
         importlib.reload(chaindb)
         chain = chaindb.chain
-        print(block)
-        print(block.is_valid())
-        if not block.hash in chain.blocks and block.is_valid():
-            # if it's a valid block we haven't seen, retransmit
-            chain.add_block(block)
-            gossip_message(type, message)
+        if block:
+            requested_bodies.pop(block.digest, None)
+        if block and chain.add_body(block):
+            request_missing_bodies(chain)
         chaindb.connection.close()
         chaindb.db.close()
 
@@ -79,3 +156,5 @@ def handle_message(type, message, sender):
         # Send confirmed vote to our BA protocol
         config.ba.process_vote(message)
 
+    metrics.p2p_handle_seconds.observe(time.perf_counter() - started, metric_type)
+
@@ -22,13 +22,7 @@ def string_to_block(blockstring, blockclass=PoWBlock):
         return False
     block = False
     try:
-        height = int(parsed_blockstring[0])
-        timestamp = float(parsed_blockstring[1])
-        target = int(parsed_blockstring[2])
-        parent_hash = parsed_blockstring[3]
-        is_genesis = parsed_blockstring[4] == "True"
-        merkle = parsed_blockstring[5]
-        seal_data = parsed_blockstring[6]
+        height, timestamp, target, parent_hash, is_genesis, merkle, seal_data = parse_header_fields(parsed_blockstring)
 
         # parse transactions using tx interface
         transaction_strings = remove_empties(parsed_blockstring[7].split("!"))
@@ -40,5 +34,50 @@ def string_to_block(blockstring, blockclass=PoWBlock):
             target=target, merkle=merkle, seal_data=seal_data)
     except:
         block = False
-    print("[p2p] Blockhash imported", block.hash)
     return block
+
+def parse_header_fields(parsed_blockstring):
+    """ Converts the first seven "`"-separated fields of a block string (its header) to their types.
+
+        Args:
+            parsed_blockstring (:obj:`list` of str): The block string split on "`".
+
+        Returns:
+            height, timestamp, target, parent_hash, is_genesis, merkle and seal_data, in that order.
+
+        Raises:
+            ValueError: If a numeric field does not parse.
+    """
+    height = int(parsed_blockstring[0])
+    timestamp = float(parsed_blockstring[1])
+    target = int(parsed_blockstring[2])
+    parent_hash = parsed_blockstring[3]
+    is_genesis = parsed_blockstring[4] == "True"
+    merkle = parsed_blockstring[5]
+    seal_data = int(parsed_blockstring[6])
+    return height, timestamp, target, parent_hash, is_genesis, merkle, seal_data
+
+def string_to_header(blockstring, blockclass=PoWBlock):
+    """ Takes a block header string (block.header()), or a full block string, as input and
+        deserializes only the header, into a block object with no transactions.
+        Its hash matches the full block's, so it can be checked with validate_header
+        before the transactions are parsed (or downloaded).
+
+        Args:
+            blockstring (str): String representing the block header or the full block.
+            blockclass (:obj:`Block`, optional): Class to use to parse the header.
+            Default is PoW block.
+
+        Returns:
+            Block object of type blockclass without transactions, False on failure.
+    """
+
+    parsed_blockstring = blockstring.split('`', 7) # leave the transactions unsplit
+    if not (len(parsed_blockstring) in (7, 8)):
+        return False
+    try:
+        height, timestamp, target, parent_hash, is_genesis, merkle, seal_data = parse_header_fields(parsed_blockstring)
+        return blockclass(height, [], parent_hash, is_genesis=is_genesis, timestamp=timestamp,
+            target=target, merkle=merkle, seal_data=seal_data)
+    except:
+        return False
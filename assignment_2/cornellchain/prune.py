@@ -0,0 +1,33 @@
+import os
+import sys
+import config
+
+USAGE = "Usage: python3 prune.py [prune depth] [node id, 1-6 (optional)]"
+
+if __name__ == '__main__':
+
+    # Validate arguments and show help if failed
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit() or int(sys.argv[1]) < 1:
+        print(USAGE)
+        exit(1)
+    depth = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        config.DB_PATH = "database" + os.sep + str(int(sys.argv[2])) + os.sep + "node.db"
+
+    import transaction
+    from blockchain import chaindb
+    chain = chaindb.chain
+
+    if chain.tip is None:
+        print("Nothing to prune in an empty chain")
+        exit(1)
+    tip_height = chain.block_index.heights[chain.block_index.lookup(chain.tip)]
+    pruned = chain.prune_spent(tip_height - depth)
+    transaction.commit()
+    print("Pruned", pruned, "spent transactions up to height", chain.pruned_height)
+    size_before, size_after = chaindb.compact()
+    print("Packed %s: %.2f MB -> %.2f MB (%.2f MB reclaimed)" % (config.DB_PATH, size_before / 1e6, size_after / 1e6,
+        (size_before - size_after) / 1e6))
+    print("Run nodes on this database with config.PRUNE_DEPTH =", depth, "to keep it pruned")
+    chaindb.connection.close()
+    chaindb.db.close()
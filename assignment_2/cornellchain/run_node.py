@@ -1,24 +1,21 @@
-import os
 import sys
+import config
 
 if __name__ == '__main__':
 
     # Validate arguments and show help if failed
     try:
-        int(sys.argv[1])
+        node_id = int(sys.argv[1].strip())
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        threads = int(sys.argv[3]) if len(sys.argv) > 3 else config.WEB_THREADS
+        asgi = len(sys.argv) > 4 and {"wsgi": False, "asgi": True}[sys.argv[4]]
     except:
-        print("Usage: python3 run_node.py [node id, 1-6]")
+        print("Usage: python3 run_node.py [node id, 1-6] [web workers] [threads per worker] [wsgi or asgi]")
+        print("(with web workers, serves for production: see webapp/server.py; without, runs the development server)")
         exit(1)
 
-    node_id = int(sys.argv[1].strip())
-    receiving_port = 5000 + node_id
-    if node_id != "0":
-        import config
-        # store node-specific values in config; should probably move these to a node class
-        config.DB_PATH = "database" + os.sep + str(node_id) + os.sep + "node.db"
-        config.node_id = node_id
-        config.receiving_port = receiving_port
-        del config.PEERS[node_id]
-
-    from webapp.app import app
-    app.run(port=config.receiving_port, debug=True)
+    from webapp import server
+    if workers is None:
+        server.serve_dev(node_id)
+    else:
+        server.serve_production(node_id, workers or config.WEB_WORKERS, threads, asgi)
@@ -0,0 +1,36 @@
+import os
+import sys
+import config
+
+USAGE = "Usage: python3 snapshot.py [export|import] [snapshot file] [node id, 1-6 (optional)]"
+
+if __name__ == '__main__':
+
+    # Validate arguments and show help if failed
+    if len(sys.argv) < 3 or not sys.argv[1] in ("export", "import"):
+        print(USAGE)
+        exit(1)
+    command, path = sys.argv[1], sys.argv[2]
+    if len(sys.argv) > 3:
+        config.DB_PATH = "database" + os.sep + str(int(sys.argv[3])) + os.sep + "node.db"
+
+    import transaction
+    from blockchain import chaindb
+    from blockchain.chaindb import snapshot
+
+    if command == "export":
+        with open(path, "wb") as out_file:
+            snapshot.export_snapshot(chaindb.chain, out_file)
+        print("Exported snapshot at tip", chaindb.chain.tip.hex(), "with", len(chaindb.chain.utxos), "unspent outputs to", path)
+    else:
+        try:
+            with open(path, "rb") as in_file:
+                snapshot.import_snapshot(chaindb.chain, in_file)
+        except ValueError as e:
+            transaction.abort()
+            print("Import failed:", e)
+            exit(1)
+        transaction.commit()
+        print("Imported snapshot at tip", chaindb.chain.tip.hex(), "into", config.DB_PATH)
+    chaindb.connection.close()
+    chaindb.db.close()
@@ -0,0 +1,108 @@
+import json
+import unittest
+from blockchain import chaindb
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import WebappTest
+from tests.validity import TestBlock
+from webapp import app as webapp, api
+
+class APITest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.block2 = TestBlock(2, [], self.block1.hash)
+        for block in [self.genesis, self.block1]:
+            self.assertTrue(chaindb.chain.add_block(block))
+        self.open_chain = webapp.open_chain
+
+    def tearDown(self):
+        webapp.open_chain = self.open_chain
+        super().tearDown()
+
+    def forbid_database(self):
+        """ Make any further database access fail the test. """
+        def open_chain():
+            self.fail("database opened")
+        webapp.open_chain = open_chain
+
+    def test_tip_revalidates_on_tip_change(self):
+        response = self.client.get("/api/tip")
+        self.assertEqual(response.get_json(), {"hash": self.block1.hash, "height": 1, "total_weight": 2})
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        etag = response.headers["ETag"]
+
+        self.forbid_database()
+        response = self.client.get("/api/tip", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        webapp.open_chain = self.open_chain
+
+        self.assertTrue(webapp.open_chain().add_block(self.block2)) # requests close the database after them
+        webapp.close_chain()
+        response = self.client.get("/api/tip", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["hash"], self.block2.hash)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_block_by_hash_is_immutable(self):
+        response = self.client.get("/api/blocks/" + self.block1.hash)
+        data = response.get_json()
+        self.assertEqual(data["height"], 1)
+        self.assertEqual(data["parent_hash"], self.genesis.hash)
+        self.assertEqual(data["transactions"], [{"hash": self.tx2.hash, "inputs": [self.tx1.hash + ":1"],
+            "outputs": [{"sender": "Alice", "receiver": "Carol", "amount": 10}]}])
+        self.assertTrue("immutable" in response.headers["Cache-Control"])
+        self.assertEqual(response.headers["ETag"], '"' + self.block1.hash + '"')
+
+        self.forbid_database()
+        response = self.client.get("/api/blocks/" + self.block1.hash, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        webapp.open_chain = self.open_chain
+
+        response = self.client.get("/api/blocks/" + "0" * 64)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse("ETag" in response.headers)
+
+    def test_height_transaction_and_range(self):
+        self.assertEqual(self.client.get("/api/heights/1").get_json()["hash"], self.block1.hash)
+        self.assertEqual(self.client.get("/api/heights/5").status_code, 404)
+        data = self.client.get("/api/transactions/" + self.tx2.hash).get_json()
+        self.assertEqual(data["block"], self.block1.hash)
+        self.assertEqual(self.client.get("/api/transactions/" + "0" * 64).status_code, 404)
+        data = self.client.get("/api/range?from=0&to=5").get_json()
+        self.assertEqual([block["hash"] for block in data["blocks"]], [self.genesis.hash, self.block1.hash])
+        self.assertEqual(data["blocks"][1]["transactions"], [self.tx2.hash])
+
+    def test_ndjson_export(self):
+        side = TestBlock(1, [], self.genesis.hash)
+        side.set_seal_data(5)
+        self.assertTrue(chaindb.chain.add_block(side))
+        response = self.client.get("/api/blocks.ndjson")
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["hash"] for line in lines], [self.genesis.hash, self.block1.hash, side.hash])
+        self.assertEqual(json.loads(lines[1])["transactions"][0]["hash"], self.tx2.hash)
+        lines = self.client.get("/api/blocks.ndjson?from=1&best=1").get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["hash"] for line in lines], [side.hash]) # equal weight, so the newest is best
+
+    def test_ndjson_export_releases_lock_between_batches(self):
+        self.assertTrue(chaindb.chain.add_block(self.block2))
+        old_batch, api.EXPORT_BATCH = api.EXPORT_BATCH, 1
+        try:
+            response = self.client.get("/api/blocks.ndjson")
+            hashes = []
+            for chunk in response.response:
+                self.assertFalse(webapp.chain_lock.locked()) # never held while the client reads
+                hashes += [json.loads(line)["hash"] for line in chunk.splitlines() if line]
+            response.close()
+        finally:
+            api.EXPORT_BATCH = old_batch
+        self.assertEqual(hashes, [self.genesis.hash, self.block1.hash, self.block2.hash])
+
+if __name__ == '__main__':
+    unittest.main()
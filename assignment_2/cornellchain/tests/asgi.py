@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import unittest
+import config
+from blockchain import chaindb, events
+from tests.fixtures import WebappTest
+from tests.validity import TestBlock
+from webapp import app as webapp, push
+from webapp.asgi import AsyncApp
+
+def request(application, method, path, body=b"", query_string=b""):
+    """ Make one HTTP request to an ASGI application; returns the status and body. """
+    scope = {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": [],
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 5000)}
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    async def send(message):
+        sent.append(message)
+    asyncio.run(application(scope, receive, send))
+    return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+class AsyncAppTest(unittest.TestCase):
+
+    def setUp(self):
+        self.application = AsyncApp(2, queue_size=1)
+        self.handled = []
+        self.handle_message = webapp.gossip.handle_message
+        webapp.gossip.handle_message = lambda type, message, sender: self.handled.append((type, message, sender))
+
+    def tearDown(self):
+        webapp.gossip.handle_message = self.handle_message
+        config.P2P_WRITER = True
+
+    def test_p2p_messages_queued_without_waiting(self):
+        with webapp.chain_lock: # eg while a block is being added
+            statuses = [request(self.application, "POST", "/p2pmessage/addblock/5002", b"block")[0] for i in range(3)]
+            self.assertEqual(self.handled, [])
+        self.assertEqual(statuses[0], 202)
+        self.assertTrue(503 in statuses) # the queue holds one message
+        self.application.p2p_queue.join()
+        self.assertEqual(self.handled[0], ("addblock", "block", "http://127.0.0.1:5002/"))
+
+        config.P2P_WRITER = False
+        self.assertEqual(request(self.application, "POST", "/p2pmessage/addblock/5002", b"block")[0], 421)
+
+    def test_event_stream_needs_no_thread(self):
+        async def stream():
+            scope = {"type": "http", "method": "GET", "path": "/events", "query_string": b"events=block-added", "headers": []}
+            disconnect = asyncio.Event()
+            sent = []
+            async def receive():
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+            async def send(message):
+                sent.append(message)
+            threads = threading.active_count()
+            task = asyncio.ensure_future(self.application(scope, receive, send))
+            while len(sent) < 2:
+                await asyncio.sleep(0.01)
+            self.assertEqual(len(push.broadcaster.clients), 1)
+            self.assertEqual(threading.active_count(), threads)
+            # published from another thread, as the chain does
+            await asyncio.get_running_loop().run_in_executor(None, lambda: events.emit("block-added", block_hash="a", height=0))
+            while len(sent) < 3:
+                await asyncio.sleep(0.01)
+            disconnect.set()
+            await task
+            return sent
+
+        sent = asyncio.run(stream())
+        self.assertEqual(sent[0]["headers"][0], (b"content-type", b"text/event-stream"))
+        self.assertEqual(sent[1]["body"], b"retry: 2000\n\n")
+        self.assertTrue(sent[2]["body"].startswith(b"id: ") and b"event: block-added" in sent[2]["body"])
+        self.assertEqual(len(push.broadcaster.clients), 0)
+
+class FlaskBridgeTest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(chaindb.chain.add_block(self.genesis))
+        self.application = AsyncApp(2)
+
+    def test_pages_and_api(self):
+        status, body = request(self.application, "GET", "/", query_string=b"count=5")
+        self.assertEqual(status, 200)
+        self.assertTrue(self.genesis.hash in body.decode())
+        status, body = request(self.application, "GET", "/api/heights/0")
+        self.assertEqual(status, 200)
+        self.assertTrue(self.genesis.hash in body.decode())
+        self.assertEqual(request(self.application, "GET", "/api/heights/5")[0], 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import random
+from blockchain.chaindb.block_index import BlockIndex, MAX_LOAD
+from blockchain.util import sha256_2_bytes
+
+def digest(name):
+    return sha256_2_bytes(str(name))
+
+class BlockIndexTest(unittest.TestCase):
+
+    def build_chain(self, index, parent, start_height, length, name, weight=1):
+        """ Add length blocks on top of parent; returns their ids in height order. """
+        ids = []
+        for height in range(start_height, start_height + length):
+            block_id = index.add(digest((name, height)), parent, height, height, 2 ** 250, weight)
+            parent = digest((name, height))
+            ids.append(block_id)
+        return ids
+
+    def test_lookup_and_weights(self):
+        index = BlockIndex()
+        ids = self.build_chain(index, None, 0, 3000, "main", weight=4)
+        self.assertEqual(len(index), 3000)
+        self.assertTrue(3000 <= MAX_LOAD * len(index.table) <= 2 * 3000) # table grew, but no more than needed
+        for height in [0, 1, 1023, 2999]:
+            self.assertEqual(index.lookup(digest(("main", height))), ids[height])
+            self.assertEqual(index.digest(ids[height]), digest(("main", height)))
+            self.assertEqual(index.weight(ids[height]), 4 * (height + 1))
+        self.assertIsNone(index.lookup(digest("nope")))
+        self.assertIsNone(index.lookup(None))
+        self.assertEqual(index.targets, [2 ** 250])
+        self.assertEqual(index.best, ids[-1])
+
+    def test_big_weights(self):
+        index = BlockIndex()
+        ids = self.build_chain(index, None, 0, 3, "big", weight=2 ** 256)
+        self.assertEqual(index.weight(ids[2]), 3 * 2 ** 256)
+        self.assertEqual(index.best, ids[2])
+
+    def test_ancestor(self):
+        index = BlockIndex()
+        ids = self.build_chain(index, None, 0, 1000, "main")
+        rng = random.Random(1)
+        for i in range(300):
+            height = rng.randrange(1000)
+            target = rng.randrange(height + 1)
+            self.assertEqual(index.ancestor(ids[height], target), ids[target])
+        self.assertEqual(index.ancestor(ids[5], 6), -1)
+        self.assertEqual(list(index.chain_ending_with(ids[3])), [ids[3], ids[2], ids[1], ids[0]])
+
+    def test_fork_choice_and_common_ancestor(self):
+        index = BlockIndex()
+        main = self.build_chain(index, None, 0, 500, "main")
+        fork = self.build_chain(index, digest(("main", 300)), 301, 150, "fork")
+        self.assertEqual(index.best, main[-1])
+        self.assertEqual(index.last_common_ancestor(main[-1], fork[-1]), main[300])
+        self.assertEqual(index.last_common_ancestor(fork[-1], main[100]), main[100])
+        # fork catches up with, then overtakes, the main chain
+        fork += self.build_chain(index, digest(("fork", 450)), 451, 49, "fork")
+        self.assertEqual(index.heights[fork[-1]], 499)
+        self.assertEqual(index.best, fork[-1]) # equal weight and height: newest wins
+        main += self.build_chain(index, digest(("main", 499)), 500, 1, "main")
+        self.assertEqual(index.best, main[-1])
+        index.add(digest("tip"), digest(("fork", 499)), 500, 500, 2 ** 250, 2)
+        self.assertEqual(index.best, index.lookup(digest("tip")))
+
+    def test_main_chain(self):
+        index = BlockIndex()
+        main = self.build_chain(index, None, 0, 100, "main")
+        self.assertEqual(list(index.main_chain), main)
+        fork = self.build_chain(index, digest(("main", 60)), 61, 38, "fork")
+        self.assertEqual(list(index.main_chain), main) # fork is lighter
+        self.assertFalse(index.is_in_main_chain(fork[0]))
+        fork += self.build_chain(index, digest(("fork", 98)), 99, 2, "fork")
+        self.assertEqual(list(index.main_chain), main[:61] + fork)
+        self.assertTrue(index.is_in_main_chain(main[60]))
+        self.assertFalse(index.is_in_main_chain(main[61]))
+        self.assertTrue(index.is_in_main_chain(fork[-1]))
+
+    def test_is_ancestor(self):
+        index = BlockIndex()
+        main = self.build_chain(index, None, 0, 200, "main")
+        fork = self.build_chain(index, digest(("main", 120)), 121, 30, "fork")
+        self.assertTrue(index.is_ancestor(main[50], main[-1]))
+        self.assertTrue(index.is_ancestor(main[50], main[50]))
+        self.assertFalse(index.is_ancestor(main[51], main[50]))
+        self.assertTrue(index.is_ancestor(main[120], fork[-1]))
+        self.assertFalse(index.is_ancestor(main[121], fork[-1]))
+        self.assertFalse(index.is_ancestor(fork[0], main[-1]))
+        self.assertFalse(index.is_ancestor(-1, main[-1]))
+
+    def test_ties_prefer_newest_block(self):
+        index = BlockIndex()
+        genesis = index.add(digest("genesis"), None, 0, 0, 2 ** 250, 1)
+        first = index.add(digest("first"), digest("genesis"), 1, 1, 2 ** 250, 1)
+        self.assertEqual(index.best, first)
+        second = index.add(digest("second"), digest("genesis"), 1, 1, 2 ** 250, 1)
+        self.assertEqual(index.best, second)
+        # a zero-weight child does not beat its (lower) parent
+        index.add(digest("child"), digest("second"), 2, 2, 2 ** 250, 0)
+        self.assertEqual(index.best, second)
+
+if __name__ == '__main__':
+    unittest.main()
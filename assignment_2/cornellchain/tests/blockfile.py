@@ -0,0 +1,64 @@
+import io
+import unittest
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.chaindb.blockfile import export_blocks, import_blocks, read_blocks
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import ShadowChainTest
+from tests.validity import TestBlock
+
+class BlockFileTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        tx2 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        tx3 = Transaction([tx2.hash + ":1"], [TransactionOutput("Alice", "Carol", 6)])
+        self.blocks = [TestBlock(0, [tx1], "genesis", is_genesis=True)]
+        self.blocks.append(TestBlock(1, [tx2, tx3], self.blocks[0].hash))
+        side = TestBlock(1, [], self.blocks[0].hash)
+        side.set_seal_data(5)
+        self.blocks.append(side)
+        for height in range(2, 6):
+            self.blocks.append(TestBlock(height, [], self.blocks[-2 if height == 2 else -1].hash))
+        self.assertEqual(self.test_chain.add_blocks(self.blocks, save=False), len(self.blocks))
+
+    def export(self, from_height=0):
+        out_file = io.BytesIO()
+        blocks, size, seconds = export_blocks(self.test_chain, out_file, from_height)
+        self.assertEqual(size, len(out_file.getvalue()))
+        return out_file.getvalue()
+
+    def fresh_chain(self):
+        chain = Blockchain()
+        chaindb.chain = chain
+        return chain
+
+    def test_round_trip(self):
+        data = self.export()
+        self.assertEqual([block.hash for block in read_blocks(io.BytesIO(data), blockclass=TestBlock)],
+            [block.hash for block in self.blocks])
+        chain = self.fresh_chain()
+        read, added, size, seconds = import_blocks(chain, io.BytesIO(data), batch_size=3, blockclass=TestBlock, save=False)
+        self.assertEqual((read, added, size), (len(self.blocks), len(self.blocks), len(data)))
+        self.assertEqual(chain.tip, self.test_chain.tip)
+        self.assertEqual(dict(chain.utxos.items()), dict(self.test_chain.utxos.items()))
+        self.assertEqual(chain.get_all_block_weights(), self.test_chain.get_all_block_weights())
+
+    def test_resume(self):
+        data = self.export()
+        chain = self.fresh_chain()
+        self.assertEqual(chain.add_blocks(self.blocks[:4], save=False), 4) # interrupted at height 2
+        read, added, size, seconds = import_blocks(chain, io.BytesIO(data), from_height=chain.get_max_height(), blockclass=TestBlock, save=False)
+        self.assertEqual((read, added), (4, 3))
+        self.assertEqual(chain.tip, self.test_chain.tip)
+        self.assertEqual(len(list(read_blocks(io.BytesIO(self.export(from_height=3)), blockclass=TestBlock))), 3)
+
+    def test_rejects_bad_files(self):
+        data = self.export()
+        for bad_data in [data[:-3], data[:len(data) // 2], b"not a block file"]:
+            with self.assertRaises(ValueError):
+                import_blocks(self.fresh_chain(), io.BytesIO(bad_data), blockclass=TestBlock, save=False)
+
+if __name__ == '__main__':
+    unittest.main()
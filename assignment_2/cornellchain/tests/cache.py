@@ -0,0 +1,75 @@
+import unittest
+from blockchain import chaindb
+from tests.fixtures import WebappTest
+from tests.validity import TestBlock
+from webapp import app as webapp
+from webapp.cache import ResponseCache, cache
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        responses = ResponseCache(10)
+        responses.put("/a", "aaaa")
+        responses.put("/b", "bbbb")
+        self.assertEqual(responses.get("/a"), ("aaaa", 200)) # /b is now least recently used
+        responses.put("/c", "cccc")
+        self.assertIsNone(responses.get("/b"))
+        self.assertEqual(responses.get("/a"), ("aaaa", 200))
+        self.assertEqual(responses.get("/c"), ("cccc", 200))
+        self.assertEqual(responses.size, 8)
+        self.assertEqual((responses.hits, responses.misses), (3, 1))
+
+    def test_size_limit(self):
+        responses = ResponseCache(10)
+        responses.put("/big", "x" * 11)
+        self.assertIsNone(responses.get("/big"))
+        responses.put("/a", "aaaa")
+        responses.put("/a", "aaaaaa") # replacing an entry updates the size
+        self.assertEqual(responses.size, 6)
+        responses.clear()
+        self.assertEqual((len(responses.entries), responses.size), (0, 0))
+        self.assertIsNone(ResponseCache(0).put("/a", "a")) # a 0 limit disables the cache
+
+class WebappCacheTest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [], self.genesis.hash)
+        self.assertTrue(chaindb.chain.add_block(self.genesis))
+        self.open_chain = webapp.open_chain
+
+    def tearDown(self):
+        webapp.open_chain = self.open_chain
+        super().tearDown()
+
+    def test_repeated_views_skip_database(self):
+        for path in ["/", "/best?count=5", "/api/tip"]:
+            first = self.client.get(path).get_data(as_text=True)
+            def open_chain():
+                self.fail("database opened")
+            webapp.open_chain = open_chain
+            self.assertEqual(self.client.get(path).get_data(as_text=True), first)
+            webapp.open_chain = self.open_chain
+
+    def test_new_block_invalidates(self):
+        self.assertFalse(self.block1.hash in self.client.get("/").get_data(as_text=True))
+        self.assertTrue(webapp.open_chain().add_block(self.block1)) # requests close the database after them
+        webapp.close_chain()
+        self.assertTrue(self.block1.hash in self.client.get("/").get_data(as_text=True))
+
+    def test_block_added_while_building_not_cached(self):
+        def open_chain():
+            chain = self.open_chain()
+            cache.clear() # as a block-added event would, while the response is being built
+            return chain
+        webapp.open_chain = open_chain
+        self.client.get("/api/tip")
+        self.assertFalse("/api/tip?" in cache.entries)
+
+    def test_errors_not_cached(self):
+        self.assertEqual(self.client.get("/block/" + self.block1.hash).status_code, 404)
+        self.assertFalse("/block/" + self.block1.hash + "?" in cache.entries)
+
+if __name__ == '__main__':
+    unittest.main()
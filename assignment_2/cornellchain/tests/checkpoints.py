@@ -0,0 +1,66 @@
+import unittest
+import config
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import ShadowChainTest
+from tests.validity import TestBlock
+
+class CheckpointTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.old_checkpoints = config.CHECKPOINTS
+
+    def tearDown(self):
+        config.CHECKPOINTS = self.old_checkpoints
+        super().tearDown()
+
+    def add_header(self, block):
+        """ Make a block known by its header only, as after a snapshot import. """
+        self.test_chain.add_header(block.digest, block.parent_digest, block.height, block.timestamp, block.target, block.get_weight())
+
+    def test_assume_valid_below_checkpoint(self):
+        bad_tx = Transaction(["0" * 64 + ":0"], [TransactionOutput("Alice", "Bob", 1)]) # spends nothing
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        block1 = TestBlock(1, [bad_tx], genesis.hash)
+        block2 = TestBlock(2, [], block1.hash)
+        self.assertEqual(block1.is_valid(), (False, "Nonexistent parent"))
+        self.assertTrue(self.test_chain.add_block(genesis))
+        self.assertEqual(block1.is_valid(), (False, "Required output not found"))
+
+        config.CHECKPOINTS = [(2, block2.hash)]
+        self.assertFalse(block1.is_assumed_valid()) # the checkpoint is not known yet
+        self.assertEqual(block1.is_valid(), (False, "Required output not found"))
+        self.add_header(block1)
+        self.add_header(block2)
+        self.assertTrue(block1.is_assumed_valid())
+        self.assertEqual(block1.is_valid(), (True, "All checks passed")) # transaction checks skipped
+        # header checks still apply at and below the checkpoint
+        other_block2 = TestBlock(2, [], block1.hash)
+        other_block2.set_seal_data(5)
+        self.assertEqual(other_block2.is_valid(), (False, "Checkpoint mismatch"))
+        bad_merkle = TestBlock(2, [], block1.hash)
+        bad_merkle.merkle = "fff"
+        self.assertEqual(bad_merkle.is_valid(), (False, "Merkle root failed to match"))
+
+        # full validation resumes above the checkpoint
+        block3 = TestBlock(3, [bad_tx], block2.hash)
+        self.assertFalse(block3.is_assumed_valid())
+
+    def test_off_checkpoint_fork_is_validated(self):
+        bad_tx = Transaction(["0" * 64 + ":0"], [TransactionOutput("Alice", "Bob", 1)]) # spends nothing
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        block1 = TestBlock(1, [], genesis.hash)
+        block2 = TestBlock(2, [], block1.hash)
+        for block in [genesis, block1, block2]:
+            self.assertTrue(self.test_chain.add_block(block))
+        config.CHECKPOINTS = [(2, block2.hash)]
+        self.assertTrue(block1.is_assumed_valid())
+        # a fork below the checkpoint that does not lead to it gets no pass, though it is below its height
+        fork1 = TestBlock(1, [bad_tx], genesis.hash)
+        fork1.set_seal_data(5)
+        self.assertFalse(fork1.is_assumed_valid())
+        self.assertEqual(fork1.is_valid(), (False, "Required output not found"))
+        self.assertFalse(self.test_chain.add_block(fork1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import config
+from blockchain import chaindb
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import WebappTest
+from tests.validity import TestBlock
+
+class ExplorerTest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.old_page_size = config.EXPLORER_PAGE_SIZE
+        config.EXPLORER_PAGE_SIZE = 20
+
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10)])
+        self.blocks = [TestBlock(0, [self.tx1], "genesis", is_genesis=True)]
+        for height in range(1, 26):
+            self.blocks.append(TestBlock(height, [], self.blocks[-1].hash))
+        self.side = TestBlock(24, [], self.blocks[23].hash)
+        self.side.set_seal_data(5)
+        for block in self.blocks + [self.side]:
+            self.assertTrue(chaindb.chain.add_block(block))
+
+    def tearDown(self):
+        config.EXPLORER_PAGE_SIZE = self.old_page_size
+        super().tearDown()
+
+    def test_full_chain_pages(self):
+        response = self.client.get("/")
+        self.assertTrue(response.is_streamed)
+        page = response.get_data(as_text=True)
+        # whole heights from the top until 20 blocks are shown: 25, both blocks at 24, then 23 down to 7
+        self.assertEqual(page.count("Block ID"), 20)
+        self.assertTrue(self.side.hash in page)
+        self.assertFalse(self.blocks[6].hash + "</pre>:" in page) # (its hash still shows as the parent of block 7)
+        self.assertTrue("?height=6&count=20" in page)
+        self.assertTrue("Loading transactions..." in page)
+        self.assertFalse("TX " + self.tx1.hash in page) # transactions are loaded separately
+
+        page = self.client.get("/?height=6").get_data(as_text=True)
+        self.assertEqual(page.count("Block ID"), 7)
+        self.assertTrue(self.blocks[0].hash in page)
+        self.assertFalse("Older" in page)
+
+    def test_best_chain_pages(self):
+        page = self.client.get("/best?count=5").get_data(as_text=True)
+        self.assertEqual(page.count("Block ID"), 5)
+        self.assertTrue(self.blocks[21].hash in page)
+        self.assertFalse(self.side.hash in page)
+        self.assertTrue("/best?height=20&count=5" in page)
+        # weights are shown for the blocks on the page
+        self.assertTrue("1 25" in self.client.get("/best?height=24&count=1").get_data(as_text=True))
+
+    def test_block_detail(self):
+        response = self.client.get("/block/" + self.blocks[0].hash)
+        self.assertEqual(response.status_code, 200)
+        # stored blocks were validated when added, so the page only says whether the block is on the best chain
+        self.assertTrue("Best chain</b>: True" in response.get_data(as_text=True))
+        self.assertFalse("Valid" in response.get_data(as_text=True))
+        response = self.client.get("/block/" + self.blocks[0].hash + "/transactions")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("TX " + self.tx1.hash in response.get_data(as_text=True))
+        self.assertEqual(self.client.get("/block/" + "0" * 64).status_code, 404)
+        self.assertEqual(self.client.get("/block/nonsense/transactions").status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
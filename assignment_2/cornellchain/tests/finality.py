@@ -0,0 +1,113 @@
+import unittest
+import config
+from blockchain import events
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+from tests.fixtures import ShadowChainTest
+
+class TestBlock(PoWBlock):
+    """ We want to test PoW blocks without mining, so override seal check """
+
+    def seal_is_valid(self):
+        return True
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+class FinalityTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.old_depth = config.FINALITY_DEPTH
+        self.finalized = []
+        events.subscribe("block-finalized", self.record_finalized)
+
+    def tearDown(self):
+        events.unsubscribe("block-finalized", self.record_finalized)
+        config.FINALITY_DEPTH = self.old_depth
+        super().tearDown()
+
+    def record_finalized(self, block_hash, height, pruned):
+        self.finalized.append((block_hash, height, pruned))
+
+    def build_forked_chain(self):
+        """ genesis - block1 - block2 - block3 on the best chain, with a side block at height 1
+        that includes the same transaction as block1 and one of its own. """
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.tx3 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Dave", 10)]) # conflicts with tx2
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.side = TestBlock(1, [self.tx3], self.genesis.hash)
+        self.side.set_seal_data(5)
+        self.block2 = TestBlock(2, [], self.block1.hash)
+        self.block3 = TestBlock(3, [], self.block2.hash)
+        for block in [self.genesis, self.block1, self.side, self.block2, self.block3]:
+            self.assertTrue(self.test_chain.add_block(block))
+
+    def test_disabled_keeps_forks(self):
+        config.FINALITY_DEPTH = 0
+        self.build_forked_chain()
+        self.assertIsNone(self.test_chain.finalized)
+        self.assertEqual(self.test_chain.get_block(self.side.hash), self.side)
+        self.assertEqual(self.finalized, [])
+
+    def test_depth_prunes_side_branches(self):
+        config.FINALITY_DEPTH = 2
+        self.build_forked_chain()
+        self.assertEqual(self.test_chain.finalized, self.block1.digest)
+        self.assertEqual(self.finalized[-1], (self.block1.hash, 1, 1))
+        self.assertIsNone(self.test_chain.get_block(self.side.hash))
+        self.assertEqual(self.test_chain.get_blockhashes_at_height(1), [self.block1.hash])
+        self.assertIsNone(self.test_chain.get_transaction(self.tx3.hash))
+        self.assertEqual(self.test_chain.get_transaction(self.tx2.hash), self.tx2)
+        self.assertFalse(self.side.hash in self.test_chain.get_all_block_weights())
+
+        # finalized entries are compacted to a single digest
+        self.assertEqual(self.test_chain.blocks_containing_tx[self.tx2.txid], self.block1.digest)
+        self.assertEqual(self.test_chain.blocks_spending_input[OutPoint(self.tx1.txid, 1)], self.block1.digest)
+        self.assertEqual(self.test_chain.blocks_containing(self.tx2.txid), (self.block1.digest,))
+        self.assertFalse(self.tx3.txid in self.test_chain.blocks_containing_tx)
+
+        # compacted entries still catch double spends and double inclusions
+        block4 = TestBlock(4, [self.tx2], self.block3.hash)
+        self.assertEqual(block4.is_valid(), (False, "Double transaction inclusion"))
+        block4 = TestBlock(4, [self.tx3], self.block3.hash)
+        self.assertEqual(block4.is_valid(), (False, "Double-spent input"))
+
+    def test_forks_below_finalized_rejected(self):
+        config.FINALITY_DEPTH = 2
+        self.build_forked_chain()
+        fork = TestBlock(1, [], self.genesis.hash)
+        fork.set_seal_data(7)
+        self.assertEqual(fork.is_valid(), (False, "Forks below finalized block"))
+        self.assertFalse(self.test_chain.add_block(fork))
+        # forks above the finalized block are still accepted, and pruned once they fall behind
+        fork = TestBlock(3, [], self.block2.hash)
+        fork.set_seal_data(7)
+        self.assertTrue(self.test_chain.add_block(fork))
+        block4 = TestBlock(4, [], self.block3.hash)
+        self.assertTrue(self.test_chain.add_block(block4))
+        block5 = TestBlock(5, [], block4.hash)
+        self.assertTrue(self.test_chain.add_block(block5))
+        self.assertEqual(self.test_chain.finalized, self.block3.digest)
+        self.assertIsNone(self.test_chain.get_block(fork.hash))
+        self.assertEqual(self.test_chain.get_blockhashes_at_height(3), [self.block3.hash])
+
+    def test_explicit_finalize(self):
+        config.FINALITY_DEPTH = 0
+        self.build_forked_chain()
+        self.assertEqual(self.test_chain.finalize(self.side.hash, save=False), 0) # not on the best chain
+        self.assertIsNone(self.test_chain.finalized)
+        self.assertEqual(self.test_chain.finalize(self.block2.hash, save=False), 1)
+        self.assertEqual(self.test_chain.finalized, self.block2.digest)
+        self.assertEqual(self.test_chain.finalize(self.block1.hash, save=False), 0) # below the finalized block
+        self.assertEqual(self.test_chain.finalized, self.block2.digest)
+        self.assertIsNone(self.test_chain.get_block(self.side.hash))
+        # the rebuilt block index only holds the remaining blocks
+        self.test_chain._v_block_index = None
+        self.assertEqual(len(self.test_chain.block_index), 4)
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip(), self.block3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import importlib
+import tempfile
+import unittest
+import config
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain, storages
+
+class ShadowChainTest(unittest.TestCase):
+    """ Runs each test against a fresh Blockchain, self.test_chain, that is not stored in any database. """
+
+    def setUp(self):
+        self.test_chain = Blockchain()
+        self.old_chain = chaindb.chain # PoW chains need to look up difficulty in the db, so shadow the global DB blockchain w our test chain
+        chaindb.chain = self.test_chain
+
+    def tearDown(self):
+        chaindb.chain = self.old_chain # restore original chain
+
+class MemoryChainTest(unittest.TestCase):
+    """ Runs each test with chaindb serving a fresh in-memory database, which (unlike a shadow chain) survives
+    the close-and-reload the web and p2p handlers do on every request. """
+
+    def setUp(self):
+        # reloading chaindb replaces its globals, so keep the originals to put back
+        self.old_globals = (chaindb.storage, chaindb.db, chaindb.connection, chaindb.chain)
+        self.old_storage_config = (config.DB_STORAGE, config.DB_PATH)
+        config.DB_STORAGE = "memory"
+        config.DB_PATH = os.path.join(tempfile.mkdtemp(), "chain.db")
+        importlib.reload(chaindb)
+
+    def tearDown(self):
+        storages.memory_storages.pop(config.DB_PATH, None)
+        os.rmdir(os.path.dirname(config.DB_PATH)) # still empty
+        config.DB_STORAGE, config.DB_PATH = self.old_storage_config
+        chaindb.storage, chaindb.db, chaindb.connection, chaindb.chain = self.old_globals
+
+class WebappTest(MemoryChainTest):
+    """ A MemoryChainTest that also starts and ends with the webapp's response cache and tip empty,
+    so pages cached by one test are not served in the next. """
+
+    def setUp(self):
+        from webapp import app as webapp, api
+        super().setUp()
+        webapp.cache.clear()
+        api.tip_hash = None
+        self.client = webapp.app.test_client()
+
+    def tearDown(self):
+        from webapp import app as webapp, api
+        webapp.cache.clear()
+        api.tip_hash = None
+        super().tearDown()
@@ -62,6 +62,49 @@ class GetChainTest(unittest.TestCase):
         self.assertEqual(self.test_chain.get_chain_ending_with(block3.hash), [block3.hash, block.hash])
         self.assertEqual(self.test_chain.get_chain_ending_with(block4.hash), [block4.hash, block2.hash, block.hash])
 
+    def test_height_index(self):
+        self.assertEqual(self.test_chain.get_max_height(), -1)
+        self.assertEqual(list(self.test_chain.iterate_heights_newest_first()), [])
+        block = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(block))
+        block2 = TestBlock(1, [], block.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        block3 = TestBlock(1, [], block.hash)
+        block3.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(block3))
+        block4 = TestBlock(2, [], block2.hash)
+        self.assertTrue(self.test_chain.add_block(block4))
+        self.assertEqual(self.test_chain.get_max_height(), 2)
+        self.assertEqual(list(self.test_chain.get_heights_with_blocks()), [0, 1, 2])
+        self.assertEqual(list(self.test_chain.get_heights_with_blocks(1, 1)), [1])
+        self.assertEqual(list(self.test_chain.iterate_heights_newest_first()), [2, 1, 0])
+        self.assertEqual(list(self.test_chain.iterate_heights_newest_first(1)), [1, 0])
+        self.assertEqual(self.test_chain.get_blockhashes_at_height(1), [block3.hash, block2.hash])
+        self.assertEqual(self.test_chain.get_blockhashes_in_range(), [block4.hash, block3.hash, block2.hash, block.hash])
+        self.assertEqual(self.test_chain.get_blockhashes_in_range(1, 1), [block3.hash, block2.hash])
+        self.assertEqual(self.test_chain.get_blockhashes_in_range(0, 0), [block.hash])
+
+    def test_main_chain(self):
+        block = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(block))
+        block2 = TestBlock(1, [], block.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        block3 = TestBlock(1, [], block.hash)
+        block3.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(block3))
+        self.assertTrue(self.test_chain.is_in_main_chain(block3.hash)) # newest block wins ties
+        self.assertFalse(self.test_chain.is_in_main_chain(block2.hash))
+        block4 = TestBlock(2, [], block2.hash)
+        self.assertTrue(self.test_chain.add_block(block4))
+        self.assertTrue(self.test_chain.is_in_main_chain(block2.hash))
+        self.assertFalse(self.test_chain.is_in_main_chain(block3.hash))
+        self.assertFalse(self.test_chain.is_in_main_chain("test"))
+        self.assertEqual(self.test_chain.main_chain_range(0, 2), [block.hash, block2.hash, block4.hash])
+        self.assertEqual(self.test_chain.main_chain_range(1, 5), [block2.hash, block4.hash])
+        self.assertEqual(self.test_chain.get_main_chain_blockhash(2), block4.hash)
+        self.assertEqual(self.test_chain.get_main_chain_blockhash(3), None)
+        self.assertEqual(self.test_chain.main_chain_range(0, 2)[::-1], self.test_chain.get_chain_ending_with(block4.hash))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from blockchain.transaction import Transaction, TransactionOutput
+from p2p.interfaces.block import string_to_block, string_to_header
+from tests.fixtures import ShadowChainTest
+from tests.validity import TestBlock, EvilBlock
+
+class HeaderTest(ShadowChainTest):
+
+    def test_header_round_trip(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        block = TestBlock(0, [tx1], "genesis", is_genesis=True)
+        for blockstring in [str(block), block.header()]:
+            header = string_to_header(blockstring, TestBlock)
+            self.assertEqual(header.hash, block.hash)
+            self.assertEqual(header.merkle, block.merkle)
+            self.assertEqual(header.transactions, [])
+            self.assertEqual(header.validate_header(), (True, "Header checks passed"))
+        self.assertEqual(string_to_block(str(block), TestBlock).hash, block.hash)
+        self.assertFalse(string_to_header("1`2`3"))
+        self.assertFalse(string_to_header("x`2`3`genesis`True`merkle`0"))
+
+    def test_validate_header(self):
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis))
+        tx1 = Transaction(["nonexistent:0"], [TransactionOutput("Alice", "Bob", 1)])
+        block = TestBlock(1, [tx1], genesis.hash)
+        header = string_to_header(block.header(), TestBlock)
+        # headers carry no transactions, so only the full block check catches this one
+        self.assertEqual(header.validate_header(), (True, "Header checks passed"))
+        self.assertEqual(block.is_valid(), (False, "Required output not found"))
+
+        self.assertEqual(string_to_header(TestBlock(1, [], genesis.hash[:-1]).header(), TestBlock).validate_header(), (False, "Nonexistent parent"))
+        self.assertEqual(string_to_header(TestBlock(2, [], genesis.hash).header(), TestBlock).validate_header(), (False, "Invalid height"))
+        self.assertEqual(string_to_header(EvilBlock(1, [], genesis.hash).header(), EvilBlock).validate_header(), (False, "Invalid seal"))
+        header.hash = "fff"
+        self.assertEqual(header.validate_header(), (False, "Hash failed to match"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import threading
+import unittest
+import config
+from blockchain import chaindb, metrics, util
+from blockchain.metrics import Registry, Counter, Histogram, Gauge
+from p2p import gossip
+from tests.fixtures import ShadowChainTest, WebappTest
+from tests.validity import TestBlock
+
+def sample(text, name):
+    """ Value of the sample line starting with name in a rendered registry (0 if there is none). """
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split(" ")[-1])
+    return 0
+
+class RegistryTest(unittest.TestCase):
+
+    def test_counter_across_threads(self):
+        registry = Registry()
+        messages = Counter("messages_total", "Messages.", ["type"], registry=registry)
+        plain = Counter("plain_total", "Unlabelled.", registry=registry)
+        self.assertTrue("plain_total 0\n" in registry.render()) # shown before it is ever incremented
+        def count():
+            for i in range(1000):
+                messages.inc("a")
+        threads = [threading.Thread(target=count) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        messages.inc("b", amount=2)
+        text = registry.render()
+        self.assertEqual(sample(text, 'messages_total{type="a"}'), 4000)
+        self.assertEqual(sample(text, 'messages_total{type="b"}'), 2)
+        self.assertTrue("# TYPE messages_total counter" in text)
+        self.assertEqual(len(registry.shards), 1) # the exited threads' shards were folded away
+        self.assertEqual(sample(registry.render(), 'messages_total{type="a"}'), 4000)
+
+    def test_histogram(self):
+        registry = Registry()
+        latency = Histogram("latency_seconds", "Latency.", ["outcome"], buckets=(.1, 1), registry=registry)
+        for value in [.05, .1, .5, 3]:
+            latency.observe(value, "ok")
+        text = registry.render()
+        self.assertEqual(sample(text, 'latency_seconds_bucket{outcome="ok",le="0.1"}'), 2)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{outcome="ok",le="1.0"}'), 3)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{outcome="ok",le="+Inf"}'), 4)
+        self.assertEqual(sample(text, 'latency_seconds_count{outcome="ok"}'), 4)
+        self.assertAlmostEqual(sample(text, 'latency_seconds_sum{outcome="ok"}'), 3.65)
+
+    def test_gauge(self):
+        registry = Registry()
+        depth = Gauge("depth", "Depth.", ["queue"], registry=registry)
+        depth.set(3, "a")
+        depth.track(lambda: 5, "b")
+        depth.track(lambda: 1 / 0, "c") # a failing function is skipped
+        text = registry.render()
+        self.assertEqual((sample(text, 'depth{queue="a"}'), sample(text, 'depth{queue="b"}')), (3, 5))
+        self.assertFalse('queue="c"' in text)
+
+    def test_label_escaping(self):
+        registry = Registry()
+        Counter("odd_total", "Odd labels.", ["name"], registry=registry).inc('say "hi"\n')
+        self.assertTrue('odd_total{name="say \\"hi\\"\\n"} 1' in registry.render())
+
+class InstrumentationTest(ShadowChainTest):
+
+    def test_add_block(self):
+        before = metrics.REGISTRY.render()
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis, save=False))
+        self.assertFalse(self.test_chain.add_block(genesis, save=False))
+        self.assertFalse(self.test_chain.add_block(TestBlock(1, [], "0" * 64), save=False))
+        after = metrics.REGISTRY.render()
+        for name, added in [('cornellchain_block_validation_seconds_count{outcome="valid"}', 1),
+                ('cornellchain_block_validation_seconds_count{outcome="invalid"}', 1),
+                ('cornellchain_add_block_seconds_count{result="added"}', 1),
+                ('cornellchain_add_block_seconds_count{result="known"}', 1),
+                ('cornellchain_add_block_seconds_count{result="invalid"}', 1)]:
+            self.assertEqual(sample(after, name) - sample(before, name), added, name)
+
+    def test_messages_and_signatures(self):
+        before = metrics.REGISTRY.render()
+        gossip.handle_message("nonsense", "", "http://127.0.0.1:1/")
+        signature = util.sign_message("hello", config.SECRET_KEYS[1])
+        self.assertTrue(util.is_message_signed("hello", signature, config.PUBLIC_KEYS[1]))
+        self.assertFalse(util.is_message_signed("goodbye", signature, config.PUBLIC_KEYS[1]))
+        after = metrics.REGISTRY.render()
+        for name in ['cornellchain_p2p_messages_received_total{type="other"}', 'cornellchain_p2p_handle_seconds_count{type="other"}',
+                'cornellchain_signature_verifications_total{result="valid"}', 'cornellchain_signature_verifications_total{result="invalid"}']:
+            self.assertEqual(sample(after, name) - sample(before, name), 1, name)
+
+    def test_ba_events(self):
+        metrics.events.emit("ba-round", sender=0, round=3, accepted=2)
+        text = metrics.REGISTRY.render()
+        self.assertEqual((sample(text, "cornellchain_ba_round"), sample(text, "cornellchain_ba_accepted_proposals")), (3, 2))
+
+class MetricsPageTest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.assertTrue(chaindb.chain.add_block(TestBlock(0, [], "genesis", is_genesis=True)))
+
+    def test_metrics_page(self):
+        loads = sample(self.client.get("/metrics").get_data(as_text=True), "cornellchain_db_object_loads_total")
+        self.client.get("/") # reopens the database and reads the chain
+        response = self.client.get("/metrics")
+        self.assertEqual(response.mimetype, "text/plain")
+        text = response.get_data(as_text=True)
+        self.assertGreater(sample(text, "cornellchain_db_object_loads_total"), loads)
+        self.assertTrue('cornellchain_queue_depth{queue="push-events"} 0' in text)
+        self.assertTrue("# TYPE cornellchain_commit_seconds histogram" in text)
+
+if __name__ == '__main__':
+    unittest.main()
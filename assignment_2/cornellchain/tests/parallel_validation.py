@@ -0,0 +1,44 @@
+import unittest
+import config
+from blockchain import block
+from blockchain.transaction import Transaction, TransactionOutput
+from tests import validity
+
+class ParallelValidityTest(validity.ValidityTest):
+    """ Rerun every validity test with transaction checks on a process pool. """
+
+    @classmethod
+    def tearDownClass(cls):
+        if block.validation_pool is not None:
+            block.validation_pool.terminate()
+            block.validation_pool = None
+
+    def setUp(self):
+        super().setUp()
+        self.old_settings = (config.VALIDATION_PROCESSES, config.PARALLEL_VALIDATION_MIN_TXS)
+        config.VALIDATION_PROCESSES = 2
+        config.PARALLEL_VALIDATION_MIN_TXS = 0
+
+    def tearDown(self):
+        config.VALIDATION_PROCESSES, config.PARALLEL_VALIDATION_MIN_TXS = self.old_settings
+        super().tearDown()
+
+    def test_intra_block_order(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Alice", 10)])
+        tx2 = Transaction([tx1.hash + ":0"], [TransactionOutput("Alice", "Bob", 10)])
+        tx3 = Transaction([tx2.hash + ":0"], [TransactionOutput("Bob", "Carol", 10)])
+        tx4 = Transaction([tx2.hash + ":0"], [TransactionOutput("Bob", "Carol", 11)])
+
+        genesis = validity.TestBlock(0, [tx1], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis))
+        self.assertTrue(validity.TestBlock(1, [tx2, tx3], genesis.hash).is_valid()[0])
+        # outputs may only be spent by later transactions in the block
+        self.assertEqual(validity.TestBlock(1, [tx3, tx2], genesis.hash).is_valid(), (False, "Required output not found"))
+        # the first failing transaction is reported, whichever check it fails
+        self.assertEqual(validity.TestBlock(1, [tx2, tx4, tx3], genesis.hash).is_valid(), (False, "Creating money"))
+        # ... but malformed transactions always come first
+        bad_tx = validity.BadTX([tx1.hash + ":0"], [TransactionOutput("Alice", "Bob", 1)])
+        self.assertEqual(validity.TestBlock(1, [tx3, tx2, bad_tx], genesis.hash).is_valid(), (False, "Malformed transaction included"))
+
+if __name__ == '__main__':
+    unittest.main()
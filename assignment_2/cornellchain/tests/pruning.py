@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+import config
+import transaction
+import ZODB, ZODB.FileStorage
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+from tests.fixtures import ShadowChainTest
+from tests.validity import TestBlock
+
+class PruningTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.old_depth = config.PRUNE_DEPTH
+
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        self.tx3 = Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Carol", 10)]) # tx1 is now fully spent
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.block2 = TestBlock(2, [self.tx3], self.block1.hash)
+        self.block3 = TestBlock(3, [], self.block2.hash)
+        self.block4 = TestBlock(4, [], self.block3.hash)
+
+    def tearDown(self):
+        config.PRUNE_DEPTH = self.old_depth
+        super().tearDown()
+
+    def add_blocks(self, chain):
+        for block in [self.genesis, self.block1, self.block2, self.block3, self.block4]:
+            self.assertTrue(chain.add_block(block))
+
+    def test_disabled_keeps_everything(self):
+        config.PRUNE_DEPTH = 0
+        self.add_blocks(self.test_chain)
+        self.assertEqual(self.test_chain.pruned_height, -1)
+        self.assertEqual(self.test_chain.get_transaction(self.tx1.hash), self.tx1)
+        self.assertEqual(self.test_chain.get_block(self.genesis.hash), self.genesis)
+
+    def test_prunes_fully_spent_transactions(self):
+        config.PRUNE_DEPTH = 2
+        self.add_blocks(self.test_chain)
+        self.assertEqual(self.test_chain.pruned_height, 2)
+        # tx1 is spent at heights 1 and 2, so it goes, along with the (now empty) genesis body
+        self.assertIsNone(self.test_chain.get_transaction(self.tx1.hash))
+        self.assertFalse(self.tx1.txid in self.test_chain.blocks_containing_tx)
+        self.assertFalse(OutPoint(self.tx1.txid, 0) in self.test_chain.blocks_spending_input)
+        self.assertIsNone(self.test_chain.get_block(self.genesis.hash))
+        self.assertEqual(self.test_chain.headers[self.genesis.digest],
+            (None, 0, self.genesis.timestamp, self.genesis.target, self.genesis.get_weight()))
+        self.assertFalse(self.genesis.digest in self.test_chain.undo)
+        # transactions with unspent outputs stay
+        self.assertEqual(self.test_chain.get_block(self.block1.hash), self.block1)
+        self.assertEqual(self.test_chain.get_transaction(self.tx2.hash), self.tx2)
+        self.assertEqual(self.test_chain.get_transaction(self.tx3.hash), self.tx3)
+        self.assertEqual(set(self.test_chain.utxos.keys()), set([OutPoint(self.tx2.txid, 0), OutPoint(self.tx2.txid, 1), OutPoint(self.tx3.txid, 0)]))
+        # the body of a pruned block is never filled back in
+        self.assertFalse(self.test_chain.add_body(self.genesis, save=False))
+
+        # spending the rest of tx2 prunes it (and block1's body) once the spend is deep enough
+        tx4 = Transaction([self.tx2.hash + ":0"], [TransactionOutput("Bob", "Dave", 4)])
+        tx5 = Transaction([self.tx2.hash + ":1"], [TransactionOutput("Alice", "Dave", 6)])
+        block5 = TestBlock(5, [tx4, tx5], self.block4.hash)
+        self.assertTrue(self.test_chain.add_block(block5))
+        self.assertEqual(self.test_chain.get_transaction(self.tx2.hash), self.tx2)
+        block6 = TestBlock(6, [], block5.hash)
+        self.assertTrue(self.test_chain.add_block(block6))
+        block7 = TestBlock(7, [], block6.hash)
+        self.assertTrue(self.test_chain.add_block(block7))
+        self.assertIsNone(self.test_chain.get_transaction(self.tx2.hash))
+        self.assertIsNone(self.test_chain.get_block(self.block1.hash))
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip(), block7)
+
+    def test_pruned_blocks_still_reject_spends(self):
+        config.PRUNE_DEPTH = 2
+        self.add_blocks(self.test_chain)
+        block5 = TestBlock(5, [Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Dave", 10)])], self.block4.hash)
+        self.assertFalse(block5.is_valid()[0])
+        # forks below the pruned height are rejected; forks above it are fine
+        fork = TestBlock(2, [], self.block1.hash)
+        fork.set_seal_data(5)
+        self.assertEqual(fork.is_valid(), (False, "Forks below pruned blocks"))
+        fork = TestBlock(3, [], self.block2.hash)
+        fork.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(fork))
+
+    def test_compact_reclaims_space(self):
+        config.PRUNE_DEPTH = 0
+        path = tempfile.mkdtemp()
+        try:
+            db = ZODB.DB(ZODB.FileStorage.FileStorage(os.path.join(path, "prune.db")))
+            connection = db.open()
+            connection.root.blockchain = Blockchain()
+            chain = connection.root.blockchain
+            chaindb.chain = chain
+            transaction.commit()
+            self.add_blocks(chain)
+            self.assertEqual(chain.prune_spent(2), 1)
+            transaction.commit()
+            size_before, size_after = chaindb.compact(db)
+            self.assertLess(size_after, size_before)
+            self.assertEqual(size_after, db.storage.getSize())
+            connection.close()
+            db.close()
+        finally:
+            shutil.rmtree(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+from blockchain import events
+from webapp import app as webapp, push
+from webapp.push import Broadcaster
+
+class BroadcasterTest(unittest.TestCase):
+
+    def test_fan_out(self):
+        broadcaster = Broadcaster(10)
+        first, second = broadcaster.subscribe(), broadcaster.subscribe(["tip-changed"])
+        broadcaster.publish("block-added", {"height": 1})
+        broadcaster.publish("tip-changed", {"new_tip": "a"})
+        self.assertEqual(broadcaster.wait(first, 0), ([(1, "block-added", {"height": 1}), (2, "tip-changed", {"new_tip": "a"})], 0))
+        self.assertEqual(broadcaster.wait(second, 0), ([(2, "tip-changed", {"new_tip": "a"})], 0))
+        self.assertEqual(broadcaster.wait(first, 0), ([], 0)) # waiting takes the events
+
+        broadcaster.unsubscribe(second)
+        broadcaster.unsubscribe(second) # (no error the second time)
+        broadcaster.publish("tip-changed", {"new_tip": "b"})
+        self.assertEqual(broadcaster.wait(second, 0), ([], 0))
+        self.assertEqual(len(broadcaster.wait(first, 0)[0]), 1)
+
+    def test_slow_client_drops_oldest(self):
+        broadcaster = Broadcaster(3)
+        client = broadcaster.subscribe()
+        for height in range(5):
+            broadcaster.publish("block-added", {"height": height})
+        pending, dropped = broadcaster.wait(client, 0)
+        self.assertEqual([data["height"] for _, _, data in pending], [2, 3, 4])
+        self.assertEqual(dropped, 2)
+        self.assertEqual(broadcaster.wait(client, 0), ([], 0))
+
+    def test_buffer_must_hold_an_event(self):
+        self.assertRaises(ValueError, Broadcaster, 0)
+
+class EventStreamTest(unittest.TestCase):
+
+    def test_stream_chain_and_ba_events(self):
+        client = webapp.app.test_client()
+        response = client.get("/events?events=block-added,ba-round", buffered=False)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        frames = iter(response.response)
+        self.assertEqual(next(frames), b"retry: 2000\n\n") # subscribed by now
+        self.assertEqual(len(push.broadcaster.clients), 1)
+
+        events.emit("block-finalized", block_hash="a", height=0, pruned=0) # not asked for
+        events.emit("block-added", block_hash="a", height=0)
+        lines = next(frames).decode().splitlines()
+        self.assertEqual(lines[1:3], ["event: block-added", "data: " + json.dumps({"block_hash": "a", "height": 0})])
+        events.emit("ba-round", sender=0, round=1, accepted=2)
+        lines = next(frames).decode().splitlines()
+        self.assertEqual(lines[1], "event: ba-round")
+        self.assertEqual(json.loads(lines[2][len("data: "):]), {"sender": 0, "round": 1, "accepted": 2})
+
+        response.close()
+        self.assertEqual(len(push.broadcaster.clients), 0)
+
+if __name__ == '__main__':
+    unittest.main()
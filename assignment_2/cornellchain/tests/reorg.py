@@ -0,0 +1,103 @@
+import unittest
+from unittest import mock
+from blockchain import events
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+from tests.fixtures import ShadowChainTest
+
+class TestBlock(PoWBlock):
+    """ We want to test PoW blocks without mining, so override seal check """
+
+    def seal_is_valid(self):
+        return True
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+class ReorgTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tip_changes = []
+        events.subscribe("tip-changed", self.record_tip_change)
+
+    def tearDown(self):
+        events.unsubscribe("tip-changed", self.record_tip_change)
+        super().tearDown()
+
+    def record_tip_change(self, old_tip, new_tip, disconnected, connected):
+        self.tip_changes.append((old_tip, new_tip, disconnected, connected))
+
+    def test_reorg_moves_utxos(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        tx2 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        tx3 = Transaction([tx2.hash + ":1"], [TransactionOutput("Alice", "Carol", 6)])
+        tx4 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)]) # conflicts with tx2
+
+        genesis = TestBlock(0, [tx1], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis))
+        self.assertEqual(self.test_chain.tip, genesis.digest)
+        self.assertEqual(self.tip_changes, [(None, genesis.hash, [], [genesis.hash])])
+        self.assertEqual(self.test_chain.get_utxo(OutPoint(tx1.txid, 1)), TransactionOutput("Alice", "Alice", 10))
+
+        block1 = TestBlock(1, [tx2, tx3], genesis.hash) # spends an output created in the same block
+        self.assertTrue(self.test_chain.add_block(block1))
+        self.assertIsNone(self.test_chain.get_utxo(OutPoint(tx1.txid, 1)))
+        self.assertIsNone(self.test_chain.get_utxo(OutPoint(tx2.txid, 1)))
+        self.assertEqual(self.test_chain.get_utxo(OutPoint(tx3.txid, 0)), TransactionOutput("Alice", "Carol", 6))
+        self.assertEqual(set(self.test_chain.utxos.keys()), set([OutPoint(tx1.txid, 0), OutPoint(tx2.txid, 0), OutPoint(tx3.txid, 0)]))
+
+        # competing branch; equal weight, so the newest block becomes the tip
+        block1b = TestBlock(1, [tx4], genesis.hash)
+        block1b.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(block1b))
+        self.assertEqual(self.test_chain.tip, block1b.digest)
+        self.assertEqual(self.tip_changes[-1], (block1.hash, block1b.hash, [block1.hash], [block1b.hash]))
+        self.assertEqual(set(self.test_chain.utxos.keys()), set([OutPoint(tx1.txid, 0), OutPoint(tx4.txid, 0)]))
+        self.assertFalse(block1.digest in self.test_chain.undo)
+
+        # original branch grows heavier; reorg back
+        block2 = TestBlock(2, [], block1.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        self.assertEqual(self.test_chain.tip, block2.digest)
+        self.assertEqual(self.tip_changes[-1], (block1b.hash, block2.hash, [block1b.hash], [block1.hash, block2.hash]))
+        self.assertEqual(set(self.test_chain.utxos.keys()), set([OutPoint(tx1.txid, 0), OutPoint(tx2.txid, 0), OutPoint(tx3.txid, 0)]))
+        self.assertEqual(self.test_chain.tip, self.test_chain.get_heaviest_chain_tip().digest)
+
+    def test_events_wait_for_commit(self):
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        block1 = TestBlock(1, [], genesis.hash)
+        block2 = TestBlock(2, [], block1.hash)
+        self.assertTrue(self.test_chain.add_block(genesis, save=False))
+        self.assertEqual(self.tip_changes, [])
+        self.test_chain.commit()
+        self.assertEqual(len(self.tip_changes), 1)
+
+        seen_at_commit = []
+        with mock.patch("transaction.commit", side_effect=lambda: seen_at_commit.append(len(self.tip_changes))):
+            self.assertEqual(self.test_chain.add_blocks([block1, block2]), 2)
+        self.assertEqual(seen_at_commit, [1]) # one commit, before either tip change was announced
+        self.assertEqual(len(self.tip_changes), 3)
+
+        with mock.patch("transaction.commit", side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self.test_chain.add_block, TestBlock(3, [], block2.hash))
+        self.test_chain.commit()
+        self.assertEqual(len(self.tip_changes), 3) # the failed commit dropped its events
+
+    def test_side_block_does_not_move_tip(self):
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis))
+        block1 = TestBlock(1, [], genesis.hash)
+        self.assertTrue(self.test_chain.add_block(block1))
+        block2 = TestBlock(2, [], block1.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        changes = len(self.tip_changes)
+        side = TestBlock(1, [], genesis.hash)
+        side.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(side))
+        self.assertEqual(len(self.tip_changes), changes)
+        self.assertEqual(self.test_chain.tip, block2.digest)
+        self.assertEqual(self.test_chain.update_tip(), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
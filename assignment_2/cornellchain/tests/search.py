@@ -0,0 +1,139 @@
+import unittest
+import config
+from blockchain import chaindb
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import ShadowChainTest, WebappTest
+from tests.validity import TestBlock
+from webapp import app as webapp, api
+
+class SearchIndexTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.old_config = (config.PRUNE_DEPTH, config.FINALITY_DEPTH)
+        config.PRUNE_DEPTH = config.FINALITY_DEPTH = 0
+
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.tx3 = Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Carol", 10)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.block2 = TestBlock(2, [self.tx3], self.block1.hash)
+        for block in [self.genesis, self.block1, self.block2]:
+            self.assertTrue(self.test_chain.add_block(block))
+
+    def tearDown(self):
+        config.PRUNE_DEPTH, config.FINALITY_DEPTH = self.old_config
+        super().tearDown()
+
+    def test_transaction_locations(self):
+        self.assertEqual(self.test_chain.get_transaction_locations(self.tx2.hash), [(self.block1.hash, 1, 0)])
+        # the same transaction in a competing block is found in both
+        fork = TestBlock(1, [self.tx2], self.genesis.hash)
+        fork.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(fork))
+        self.assertEqual(self.test_chain.get_transaction_locations(self.tx2.hash), [(self.block1.hash, 1, 0), (fork.hash, 1, 0)])
+        tx4 = Transaction([self.tx2.hash + ":0"], [TransactionOutput("Carol", "Dave", 10)])
+        tx5 = Transaction([self.tx3.hash + ":0"], [TransactionOutput("Carol", "Dave", 10)])
+        block3 = TestBlock(3, [tx4, tx5], self.block2.hash)
+        self.assertTrue(self.test_chain.add_block(block3))
+        self.assertEqual(self.test_chain.get_transaction_locations(tx5.hash), [(block3.hash, 3, 1)])
+        self.assertEqual(self.test_chain.get_transaction_locations("0" * 64), [])
+        self.assertEqual(self.test_chain.get_transaction_locations("nonsense"), [])
+
+    def test_address_history(self):
+        entries, next_height = self.test_chain.get_address_history("Alice")
+        self.assertEqual(entries, [
+            (1, self.block1.hash, self.tx1.hash, 1, "spent", 10, self.tx2.hash),
+            (0, self.genesis.hash, self.tx1.hash, 1, "received", 10, None)])
+        self.assertIsNone(next_height)
+        entries, next_height = self.test_chain.get_address_history("Carol")
+        self.assertEqual([(entry[0], entry[2], entry[4]) for entry in entries], [(2, self.tx3.hash, "received"), (1, self.tx2.hash, "received")])
+        self.assertEqual(self.test_chain.get_address_history("Nobody"), ([], None))
+        self.assertEqual(self.test_chain.get_address_history("Ali"), ([], None)) # a prefix of a name is a different address
+
+    def test_address_history_pages(self):
+        # whole heights at a time: Bob spends at 2 and received at 0
+        entries, next_height = self.test_chain.get_address_history("Bob", count=1)
+        self.assertEqual([entry[:5] for entry in entries], [(2, self.block2.hash, self.tx1.hash, 0, "spent")])
+        self.assertEqual(next_height, 0)
+        entries, next_height = self.test_chain.get_address_history("Bob", max_height=next_height, count=1)
+        self.assertEqual([entry[:5] for entry in entries], [(0, self.genesis.hash, self.tx1.hash, 0, "received")])
+        self.assertIsNone(next_height)
+        entries, next_height = self.test_chain.get_address_history("Alice", max_height=1, count=1)
+        self.assertEqual((len(entries), next_height), (1, 0))
+
+    def test_pruned_fork_leaves_index(self):
+        fork = TestBlock(2, [Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Dave", 10)])], self.block1.hash)
+        self.assertTrue(self.test_chain.add_block(fork))
+        self.assertEqual(len(self.test_chain.get_address_history("Bob")[0]), 3) # spent in both blocks at height 2
+        self.assertEqual(len(self.test_chain.get_address_history("Dave")[0]), 1)
+        # finalizing the other block at height 2 drops the fork and its entries
+        self.assertTrue(self.test_chain.add_block(TestBlock(3, [], self.block2.hash)))
+        self.assertEqual(self.test_chain.finalize(self.block2.hash, save=False), 1)
+        self.assertEqual(self.test_chain.get_address_history("Dave"), ([], None))
+        self.assertEqual([entry[1] for entry in self.test_chain.get_address_history("Bob")[0]], [self.block2.hash, self.genesis.hash])
+        self.assertEqual(self.test_chain.get_transaction_locations(fork.transactions[0].hash), [])
+
+    def test_pruned_fork_leaves_index_after_pruning_spends(self):
+        fork = TestBlock(2, [Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Dave", 10)])], self.block1.hash)
+        self.assertTrue(self.test_chain.add_block(fork))
+        self.assertTrue(self.test_chain.add_block(TestBlock(3, [], self.block2.hash)))
+        self.assertEqual(self.test_chain.prune_spent(2), 1) # drops tx1, which the fork spends
+        self.assertEqual(self.test_chain.finalize(self.block2.hash, save=False), 1)
+        self.assertEqual([entry[1] for entry in self.test_chain.get_address_history("Bob")[0]], [self.block2.hash, self.genesis.hash])
+        self.assertEqual(self.test_chain.get_address_history("Dave"), ([], None))
+
+    def test_pruned_transaction_keeps_history(self):
+        self.assertEqual(self.test_chain.prune_spent(2), 1) # tx1 is fully spent by height 2
+        self.assertEqual(self.test_chain.get_transaction_locations(self.tx1.hash), [])
+        entries = self.test_chain.get_address_history("Bob")[0]
+        self.assertEqual([entry[4] for entry in entries], ["spent", "received"])
+
+class SearchPagesTest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        for block in [self.genesis, self.block1]:
+            self.assertTrue(chaindb.chain.add_block(block))
+
+    def test_transaction_page(self):
+        page = self.client.get("/tx/" + self.tx1.hash).get_data(as_text=True)
+        self.assertTrue('<a href="/block/' + self.genesis.hash + '">' in page)
+        self.assertTrue('<a href="/address/Bob">Bob</a>' in page)
+        self.assertTrue("spent in <a href=\"/block/" + self.block1.hash in page) # output 1
+        self.assertEqual(self.client.get("/tx/" + "0" * 64).status_code, 404)
+
+    def test_address_page(self):
+        page = self.client.get("/address/Alice?count=1").get_data(as_text=True)
+        self.assertTrue(self.tx2.hash[:16] in page) # spent at height 1
+        self.assertTrue("?height=0&count=1" in page)
+        page = self.client.get("/address/Alice?height=0").get_data(as_text=True)
+        self.assertTrue("received" in page and not "spent" in page)
+        self.assertTrue("no outputs" in self.client.get("/address/Nobody").get_data(as_text=True))
+
+        self.assertTrue(webapp.open_chain().add_block(TestBlock(2, [Transaction([self.tx1.hash + ":0"],
+            [TransactionOutput("Bob", "Alice", 10)])], self.block1.hash))) # requests close the database after them
+        webapp.close_chain()
+        self.assertTrue("?height=1&count=1" in self.client.get("/address/Alice?count=1").get_data(as_text=True))
+
+    def test_search_redirects(self):
+        for query, target in [(self.block1.hash, "/block/"), (self.tx2.hash, "/tx/"), ("Carol", "/address/")]:
+            response = self.client.get("/search?q=" + query)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response.headers["Location"].endswith(target + query))
+
+    def test_api(self):
+        data = self.client.get("/api/transactions/" + self.tx2.hash).get_json()
+        self.assertEqual(data["locations"], [{"block": self.block1.hash, "height": 1, "position": 0, "best_chain": True}])
+        data = self.client.get("/api/addresses/Carol").get_json()
+        self.assertEqual(data["entries"], [{"height": 1, "block": self.block1.hash, "best_chain": True, "tx": self.tx2.hash,
+            "output_index": 0, "kind": "received", "amount": 10, "spending_tx": None}])
+        self.assertIsNone(data["next_height"])
+
+if __name__ == '__main__':
+    unittest.main()
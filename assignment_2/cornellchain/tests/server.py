@@ -0,0 +1,65 @@
+import os
+import unittest
+import config
+from blockchain import events
+from blockchain.chaindb import storages
+from webapp import app as webapp, api
+from webapp.cache import cache
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = webapp.app.test_client()
+        self.last_transaction = storages.last_transaction
+        self.old_environment = os.environ.pop("CORNELLCHAIN_ZEO", None)
+
+    def tearDown(self):
+        storages.last_transaction = self.last_transaction
+        webapp.seen_transaction = None
+        config.P2P_WRITER = True
+        api.tip_hash = None
+        cache.clear()
+        if self.old_environment is not None:
+            os.environ["CORNELLCHAIN_ZEO"] = self.old_environment
+
+    def test_only_writer_takes_p2p_messages(self):
+        config.P2P_WRITER = False
+        response = self.client.post("/p2pmessage/nonsense/5001", data="x")
+        self.assertEqual(response.status_code, 421)
+        self.assertTrue(str(config.receiving_port) in response.get_data(as_text=True))
+
+    def test_commits_by_other_processes_drop_cache(self):
+        seen = []
+        def listener(transaction):
+            seen.append(transaction)
+        events.subscribe("chain-changed", listener)
+        try:
+            storages.last_transaction = lambda: b"\x00" * 7 + b"\x01" # as when serving over ZEO
+            cache.put("/page", "old")
+            api.tip_hash = "a"
+            self.client.get("/api/nonsense")
+            self.assertEqual(seen, ["0000000000000001"])
+            self.assertIsNone(cache.get("/page"))
+            self.assertIsNone(api.tip_hash) # reread on next use
+
+            cache.put("/page", "new")
+            self.client.get("/api/nonsense") # nothing committed since
+            self.assertEqual(len(seen), 1)
+            self.assertEqual(cache.get("/page"), ("new", 200))
+
+            storages.last_transaction = lambda: None # as on a fresh store
+            self.assertEqual(self.client.get("/api/nonsense").status_code, 404)
+            self.assertEqual(len(seen), 1)
+        finally:
+            events.unsubscribe("chain-changed", listener)
+
+    def test_zeo_address(self):
+        self.assertEqual(storages.zeo_address(), tuple(config.ZEO_ADDRESS))
+        os.environ["CORNELLCHAIN_ZEO"] = "localhost:9123"
+        try:
+            self.assertEqual(storages.zeo_address(), ("localhost", 9123))
+        finally:
+            del os.environ["CORNELLCHAIN_ZEO"]
+
+if __name__ == '__main__':
+    unittest.main()
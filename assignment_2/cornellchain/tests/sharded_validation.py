@@ -0,0 +1,68 @@
+import unittest
+import config
+from blockchain import shards
+from blockchain.transaction import Transaction, TransactionOutput
+from tests import validity
+
+class ShardedValidityTest(validity.ValidityTest):
+    """ Rerun every validity test with inputs resolved through sharded chain state. """
+
+    @classmethod
+    def tearDownClass(cls):
+        if shards.coordinator is not None:
+            shards.coordinator.stop()
+            shards.coordinator = None
+
+    def setUp(self):
+        super().setUp()
+        self.old_shards = config.VALIDATION_SHARDS
+        config.VALIDATION_SHARDS = 3
+
+    def tearDown(self):
+        config.VALIDATION_SHARDS = self.old_shards
+        super().tearDown()
+
+    def test_shards_follow_reorgs(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        tx2 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        tx3 = Transaction([tx2.hash + ":1"], [TransactionOutput("Alice", "Carol", 6)])
+        tx4 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)]) # conflicts with tx2
+        spend_tx3 = Transaction([tx3.hash + ":0"], [TransactionOutput("Carol", "Bob", 6)])
+        spend_tx4 = Transaction([tx4.hash + ":0"], [TransactionOutput("Carol", "Bob", 10)])
+
+        genesis = validity.TestBlock(0, [tx1], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis))
+        block1 = validity.TestBlock(1, [tx2, tx3], genesis.hash)
+        self.assertTrue(self.test_chain.add_block(block1))
+        self.assertTrue(validity.TestBlock(2, [spend_tx3], block1.hash).is_valid()[0])
+        self.assertEqual(shards.coordinator.tip, block1.digest)
+
+        block1b = validity.TestBlock(1, [tx4], genesis.hash)
+        block1b.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(block1b)) # equal weight; newest becomes the tip
+        self.assertEqual(validity.TestBlock(2, [spend_tx3], block1b.hash).is_valid(), (False, "Input transaction not found"))
+        self.assertTrue(validity.TestBlock(2, [spend_tx4], block1b.hash).is_valid()[0])
+        self.assertEqual(shards.coordinator.tip, block1b.digest)
+
+        block2 = validity.TestBlock(2, [], block1.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        self.assertTrue(validity.TestBlock(3, [spend_tx3], block2.hash).is_valid()[0])
+        self.assertEqual(validity.TestBlock(3, [spend_tx4], block2.hash).is_valid(), (False, "Input transaction not found"))
+        self.assertEqual(shards.coordinator.tip, block2.digest)
+
+        # after the chain is reloaded, the shards catch up from the tip they saw rather than reloading
+        commands = []
+        send_split = shards.coordinator.send_split
+        shards.coordinator.send_split = lambda command, *args: commands.append(command) or send_split(command, *args)
+        try:
+            block3 = validity.TestBlock(3, [spend_tx3], block2.hash)
+            self.assertTrue(self.test_chain.add_block(block3))
+            del self.test_chain._v_block_index # rebuilt, as on every reload
+            self.assertTrue(validity.TestBlock(4, [], block3.hash).is_valid()[0])
+        finally:
+            del shards.coordinator.send_split
+        self.assertEqual(commands, ["apply"])
+        self.assertEqual(shards.coordinator.tip, block3.digest)
+
+if __name__ == '__main__':
+    unittest.main()
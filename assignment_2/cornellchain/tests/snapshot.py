@@ -0,0 +1,120 @@
+import io
+import unittest
+from unittest import mock
+import config
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.chaindb.snapshot import export_snapshot, import_snapshot
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+from p2p import gossip
+from tests.fixtures import ShadowChainTest
+from tests.validity import TestBlock
+
+class SnapshotTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.side1 = TestBlock(1, [], self.genesis.hash)
+        self.side1.set_seal_data(5)
+        self.block2 = TestBlock(2, [], self.block1.hash)
+        for block in [self.genesis, self.block1, self.side1, self.block2]:
+            self.assertTrue(self.test_chain.add_block(block))
+
+    def export(self):
+        out_file = io.BytesIO()
+        export_snapshot(self.test_chain, out_file)
+        return out_file.getvalue()
+
+    def load(self, data):
+        chain = Blockchain()
+        chaindb.chain = chain
+        import_snapshot(chain, io.BytesIO(data))
+        return chain
+
+    def test_round_trip(self):
+        chain = self.load(self.export())
+        self.assertEqual(chain.tip, self.block2.digest)
+        self.assertEqual(dict(chain.utxos.items()), dict(self.test_chain.utxos.items()))
+        self.assertEqual(chain.get_all_block_weights(), self.test_chain.get_all_block_weights())
+        self.assertEqual(chain.main_chain_range(0, 2), self.test_chain.main_chain_range(0, 2))
+        self.assertEqual(sorted(chain.get_blockhashes_at_height(1)), sorted(self.test_chain.get_blockhashes_at_height(1)))
+        self.assertIsNone(chain.get_block(self.block1.hash))
+        # the index is rebuilt from the stored headers after a reload
+        del chain._v_block_index
+        self.assertEqual(chain.get_heaviest_chain_tip(), None) # no body for the tip yet
+        self.assertEqual(chain.block_index.digest(chain.block_index.best), self.block2.digest)
+
+    def test_validates_new_blocks(self):
+        chain = self.load(self.export())
+        tx3 = Transaction([self.tx2.hash + ":1"], [TransactionOutput("Alice", "Carol", 6)])
+        block3 = TestBlock(3, [tx3], self.block2.hash)
+        self.assertTrue(chain.add_block(block3))
+        self.assertEqual(chain.tip, block3.digest)
+        self.assertEqual(TestBlock(2, [], self.side1.hash).is_valid(), (False, "Forks below snapshot"))
+
+    def test_validates_side_branches(self):
+        chain = self.load(self.export())
+        tx3 = Transaction([self.tx2.hash + ":1"], [TransactionOutput("Alice", "Carol", 6)])
+        block3 = TestBlock(3, [tx3], self.block2.hash)
+        block4 = TestBlock(4, [], block3.hash)
+        for block in [block3, block4]:
+            self.assertTrue(chain.add_block(block))
+        # forks below the tip spend outputs from before the snapshot, whose transactions the chain never saw
+        tx4 = Transaction([self.tx2.hash + ":0"], [TransactionOutput("Bob", "Carol", 4)])
+        fork4 = TestBlock(4, [tx4], block3.hash)
+        fork4.set_seal_data(5)
+        self.assertEqual(fork4.is_valid(), (True, "All checks passed"))
+        fork3 = TestBlock(3, [tx3], self.block2.hash) # tx3 is only spent on the other branch
+        fork3.set_seal_data(5)
+        self.assertEqual(fork3.is_valid(), (True, "All checks passed"))
+        self.assertTrue(chain.add_block(fork3))
+        double_spend = TestBlock(4, [Transaction([self.tx2.hash + ":1"], [TransactionOutput("Alice", "Bob", 6)])], fork3.hash)
+        self.assertFalse(double_spend.is_valid()[0])
+        fork4_on_fork = TestBlock(4, [tx4], fork3.hash)
+        self.assertTrue(chain.add_block(fork4_on_fork))
+        fork5 = TestBlock(5, [], fork4_on_fork.hash)
+        self.assertTrue(chain.add_block(fork5))
+        self.assertEqual(chain.tip, fork5.digest) # reorged past the old tip
+        self.assertIsNone(chain.get_utxo(OutPoint(self.tx2.txid, 0)))
+        self.assertEqual(chain.get_utxo(OutPoint(tx4.txid, 0)).receiver, "Carol")
+
+    def test_backfill_bodies(self):
+        chain = self.load(self.export())
+        self.assertEqual(len(chain.headers), 4)
+        wrong_body = TestBlock(1, [self.tx2, Transaction([], [TransactionOutput("Alice", "Bob", 1)])], self.genesis.hash)
+        self.assertFalse(chain.add_body(wrong_body, save=False))
+        for block in [self.genesis, self.block1, self.side1, self.block2]:
+            self.assertTrue(chain.add_body(block, save=False))
+        self.assertFalse(chain.add_body(self.block1, save=False))
+        self.assertEqual(len(chain.headers), 0)
+        self.assertEqual(chain.get_block(self.block1.hash).transactions, [self.tx2])
+        self.assertEqual(chain.get_transaction(self.tx2.hash), self.tx2)
+
+    def test_backfill_requests_each_body_once(self):
+        chain = self.load(self.export())
+        sent = []
+        with mock.patch.object(gossip, "send_message", lambda dest, type, message: sent.append(message)), \
+                mock.patch.object(gossip, "requested_bodies", {}), mock.patch.object(config, "PEERS", {1: "http://peer/"}):
+            gossip.request_missing_bodies(chain, 3)
+            gossip.request_missing_bodies(chain, 3) # as on the next gossiped block
+            self.assertEqual(sorted(sent), sorted(digest.hex() for digest in chain.headers.keys()))
+            with mock.patch.object(config, "BACKFILL_TIMEOUT", 0):
+                gossip.request_missing_bodies(chain, 3) # unanswered requests are retried
+            self.assertEqual(len(sent), 7)
+
+    def test_rejects_bad_snapshots(self):
+        data = self.export()
+        corrupt = bytearray(data)
+        corrupt[len(corrupt) // 2] ^= 1
+        for bad_data in [bytes(corrupt), data[:-40], data[:-1], b"not a snapshot"]:
+            with self.assertRaises(ValueError):
+                self.load(bad_data)
+        with self.assertRaises(ValueError):
+            import_snapshot(self.test_chain, io.BytesIO(data)) # not empty
+
+if __name__ == '__main__':
+    unittest.main()
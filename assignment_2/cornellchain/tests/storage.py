@@ -0,0 +1,84 @@
+import os
+import importlib
+import unittest
+import config
+from blockchain import chaindb
+from blockchain.chaindb import storages
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import MemoryChainTest
+from tests.validity import TestBlock
+
+class StorageTest(MemoryChainTest):
+
+    def setUp(self):
+        self.old_environment = os.environ.pop("CORNELLCHAIN_STORAGE", None) # before the reload, so it serves memory
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+
+    def tearDown(self):
+        super().tearDown()
+        if self.old_environment is not None:
+            os.environ["CORNELLCHAIN_STORAGE"] = self.old_environment
+
+    def reload(self):
+        chaindb.connection.close()
+        chaindb.db.close()
+        importlib.reload(chaindb)
+
+    def test_memory_storage_survives_reload(self):
+        self.assertIsInstance(chaindb.storage, storages.MemoryStorage)
+        self.assertTrue(chaindb.chain.add_block(self.genesis))
+        self.assertTrue(chaindb.chain.add_block(self.block1))
+        self.reload()
+        self.assertEqual(chaindb.chain.get_block(self.block1.hash).hash, self.block1.hash)
+        self.assertEqual(chaindb.chain.tip, self.block1.digest)
+        self.assertFalse(os.path.exists(config.DB_PATH))
+
+    def test_block_index_survives_reload(self):
+        self.assertTrue(chaindb.chain.add_block(self.genesis))
+        self.assertTrue(chaindb.chain.add_block(self.block1))
+        self.reload()
+        index = chaindb.chain.block_index
+        self.assertEqual(index.digest(index.best), self.block1.digest)
+        # copied from the index saved at the last commit, without loading a single block
+        self.assertIsNone(chaindb.chain.blocks[self.genesis.digest]._p_changed) # still a ghost
+        side = TestBlock(1, [], self.genesis.hash)
+        side.set_seal_data(5)
+        self.assertTrue(chaindb.chain.add_block(side))
+        self.reload()
+        self.assertTrue(side.digest in chaindb.chain.block_index)
+        # a chain changed since its index was saved rebuilds it
+        chaindb.chain._p_changed = True
+        del chaindb.chain._v_block_index
+        self.assertTrue(side.digest in chaindb.chain.block_index)
+        self.assertFalse(chaindb.chain.blocks[self.genesis.digest]._p_changed is None)
+
+    def test_environment_overrides_config(self):
+        os.environ["CORNELLCHAIN_STORAGE"] = "memory"
+        config.DB_STORAGE = "file"
+        try:
+            self.assertEqual(storages.storage_mode(), "memory")
+            os.environ["CORNELLCHAIN_STORAGE"] = "tape"
+            self.assertRaises(ValueError, storages.storage_mode)
+        finally:
+            del os.environ["CORNELLCHAIN_STORAGE"]
+
+    def test_overlay_discards_changes(self):
+        base_chain = chaindb.chain
+        self.assertTrue(base_chain.add_block(self.genesis))
+        with chaindb.overlay() as scratch:
+            self.assertIs(chaindb.chain, scratch)
+            self.assertEqual(scratch.get_block(self.genesis.hash).hash, self.genesis.hash)
+            self.assertTrue(scratch.add_block(self.block1)) # committed, but only to the scratch copy
+            self.assertEqual(scratch.tip, self.block1.digest)
+        self.assertIs(chaindb.chain, base_chain)
+        self.assertIsNone(base_chain.get_block(self.block1.hash))
+        self.reload()
+        self.assertIsNone(chaindb.chain.get_block(self.block1.hash))
+        self.assertEqual(chaindb.chain.tip, self.genesis.digest)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import pickle
+from blockchain.transaction import Transaction, TransactionOutput, OutPoint
+
+class TransactionTest(unittest.TestCase):
+
+    def test_outpoint_parsing(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        ref = OutPoint.from_string(tx1.hash + ":1")
+        self.assertEqual(ref.txid, tx1.txid)
+        self.assertEqual(len(ref.txid), 32)
+        self.assertEqual(ref.index, 1)
+        self.assertEqual(str(ref), tx1.hash + ":1")
+        self.assertEqual(ref, OutPoint(tx1.txid, 1))
+        # malformed hashes are kept as text so the spending transaction hashes as sent
+        ref = OutPoint.from_string("fakehash:2")
+        self.assertEqual(ref.txid, "fakehash")
+        self.assertEqual(str(ref), "fakehash:2")
+        self.assertEqual(str(OutPoint.from_string(tx1.hash.upper() + ":0")), tx1.hash.upper() + ":0")
+
+    def test_parsed_refs_hash_like_strings(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        tx2 = Transaction([tx1.hash + ":0"], [TransactionOutput("Bob", "Carol", 1)])
+        tx3 = Transaction([OutPoint(tx1.txid, 0)], [TransactionOutput("Bob", "Carol", 1)])
+        self.assertEqual(tx2.hash, tx3.hash)
+        self.assertEqual(tx2.txid.hex(), tx2.hash)
+        self.assertEqual(tx2.header(), tx1.hash + ":0-Bob~Carol~1")
+
+    def test_immutable(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1)])
+        with self.assertRaises(AttributeError):
+            tx1.outputs = ()
+        with self.assertRaises(AttributeError):
+            tx1.outputs[0].amount = 5
+        with self.assertRaises(AttributeError):
+            OutPoint(tx1.txid, 0).index = 1
+
+    def test_pickle_roundtrip(self):
+        tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        tx2 = Transaction([tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 1)])
+        copy = pickle.loads(pickle.dumps(tx2, 3))
+        self.assertEqual(copy, tx2)
+        self.assertEqual(str(copy), str(tx2))
+        self.assertEqual(copy.input_refs, tx2.input_refs)
+        self.assertEqual(copy.outputs, tx2.outputs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import unittest
+from blockchain import chaindb
+from blockchain.chaindb import Blockchain
+from blockchain.chaindb.snapshot import export_snapshot, import_snapshot
+from blockchain.transaction import Transaction, TransactionOutput
+from tests.fixtures import ShadowChainTest, WebappTest
+from tests.validity import TestBlock
+from webapp import app as webapp, api
+
+class WalletIndexTest(ShadowChainTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.block1 = TestBlock(1, [self.tx2], self.genesis.hash)
+        for block in [self.genesis, self.block1]:
+            self.assertTrue(self.test_chain.add_block(block))
+
+    def balances(self, chain):
+        return {user: chain.get_balance(user) for user in ["Alice", "Bob", "Carol"]}
+
+    def test_balances_and_outputs(self):
+        self.assertEqual(self.balances(self.test_chain), {"Alice": 6, "Bob": 14, "Carol": 0})
+        self.assertEqual(sorted(self.test_chain.get_unspent_outputs("Bob")), sorted([(self.tx1.hash + ":0", 10), (self.tx2.hash + ":0", 4)]))
+        self.assertEqual(len(self.test_chain.get_unspent_outputs("Bob", count=1)), 1)
+        self.assertEqual(self.test_chain.get_unspent_outputs("Al"), [])
+
+    def test_select_coins(self):
+        selected = self.test_chain.select_coins("Bob", 12)
+        self.assertEqual(sorted(selected), sorted(self.test_chain.get_unspent_outputs("Bob")))
+        self.assertEqual(len(self.test_chain.select_coins("Bob", 1)), 1)
+        self.assertIsNone(self.test_chain.select_coins("Bob", 15))
+        self.assertEqual(self.test_chain.select_coins("Carol", 0), [])
+
+    def test_reorg_moves_balances(self):
+        tx3 = Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Carol", 10)])
+        fork1 = TestBlock(1, [tx3], self.genesis.hash)
+        fork1.set_seal_data(5)
+        self.assertTrue(self.test_chain.add_block(fork1)) # equal weight, so the newest is best
+        self.assertEqual(self.test_chain.tip, fork1.digest)
+        self.assertEqual(self.balances(self.test_chain), {"Alice": 10, "Bob": 0, "Carol": 10})
+        self.assertFalse("Bob" in self.test_chain.balances) # spent users are dropped
+        self.assertEqual(self.test_chain.get_unspent_outputs("Alice"), [(self.tx1.hash + ":1", 10)])
+
+        block2 = TestBlock(2, [], self.block1.hash)
+        self.assertTrue(self.test_chain.add_block(block2))
+        self.assertEqual(self.balances(self.test_chain), {"Alice": 6, "Bob": 14, "Carol": 0})
+        self.assertEqual(self.test_chain.get_unspent_outputs("Carol"), [])
+        self.assertEqual(len(self.test_chain.user_utxos), len(self.test_chain.utxos))
+
+    def test_snapshot_import_fills_wallets(self):
+        out_file = io.BytesIO()
+        export_snapshot(self.test_chain, out_file)
+        chain = Blockchain()
+        chaindb.chain = chain
+        import_snapshot(chain, io.BytesIO(out_file.getvalue()))
+        self.assertEqual(self.balances(chain), self.balances(self.test_chain))
+        self.assertEqual(chain.get_unspent_outputs("Bob"), self.test_chain.get_unspent_outputs("Bob"))
+
+class WalletAPITest(WebappTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 10), TransactionOutput("Alice", "Alice", 10)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.assertTrue(chaindb.chain.add_block(self.genesis))
+
+    def test_wallet(self):
+        data = self.client.get("/api/wallets/Bob").get_json()
+        self.assertEqual(data, {"user": "Bob", "balance": 10, "more": False, "unspent": [{"input_ref": self.tx1.hash + ":0", "amount": 10}]})
+        self.assertEqual(self.client.get("/api/wallets/Bob?amount=5").get_json()["unspent"], data["unspent"])
+        response = self.client.get("/api/wallets/Bob?amount=11")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["balance"], 10)
+
+        tx2 = Transaction([self.tx1.hash + ":0"], [TransactionOutput("Bob", "Bob", 4), TransactionOutput("Bob", "Carol", 6)])
+        self.assertTrue(webapp.open_chain().add_block(TestBlock(1, [tx2], self.genesis.hash))) # requests close the database after them
+        webapp.close_chain()
+        data = self.client.get("/api/wallets/Carol?count=1").get_json()
+        self.assertEqual((data["balance"], data["more"]), (6, False))
+        self.assertTrue("Balance (best chain)</b>: 4" in self.client.get("/address/Bob").get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
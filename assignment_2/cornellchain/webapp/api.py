@@ -0,0 +1,255 @@
+""" JSON API for tools and dashboards, mounted under /api by webapp.app.
+
+    Every response carries a strong ETag, and a request whose If-None-Match matches it gets an
+    empty 304 before the database is opened:
+        - blocks by hash never change, so their ETag is the block hash and they may be cached for a year
+          (a reverse proxy in front of the node can serve them indefinitely);
+        - everything else depends only on the best chain, so its ETag is derived from the best tip, which
+          this module tracks from "tip-changed" events rather than reading it from the database (and rereads
+          after a "chain-changed" event, when another process changed a shared chain); side-chain blocks listed by
+          the transaction and address endpoints only show up on revalidation once the tip next moves.
+    Bodies of successful responses are kept in the webapp's response cache (see webapp.cache).
+
+    Endpoints:
+        /api/tip: the best tip
+        /api/blocks/<block hash>: a block, with its transactions
+        /api/heights/<height>: the best-chain block at a height, with its transactions
+        /api/transactions/<tx hash>: a transaction, the best-chain block including it (if any), and every block including it
+        /api/addresses/<address>?height=<height>&count=<n>: a page of the outputs an address received and spent, newest first
+        /api/wallets/<user>?count=<n>: a user's best-chain balance and (up to n of) their unspent outputs
+        /api/wallets/<user>?amount=<amount>: the balance, and unspent outputs covering an amount (409 if the balance is too low)
+        /api/range?from=<height>&to=<height>: summaries of the best-chain blocks between two heights (inclusive)
+        /api/blocks.ndjson?from=<height>&to=<height>&best=<0 or 1>: every block with a body (or only best-chain
+            ones) between two heights, as newline-delimited JSON, streamed lazily from the database (not tagged or cached)
+"""
+import json
+import config
+from flask import Blueprint, Response, request, jsonify, make_response, stream_with_context
+from blockchain import events
+from webapp.cache import cache
+
+api = Blueprint("api", __name__)
+
+#: Cache-Control for responses that can never change, and for those that change with the best tip
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+#: Blocks read by /api/blocks.ndjson each time it opens the database
+EXPORT_BATCH = 1000
+
+#: Hash of the best tip (None until first read from the database), kept current by record_tip
+tip_hash = None
+
+def record_tip(old_tip, new_tip, disconnected, connected):
+    """ "tip-changed" listener keeping tip_hash current. """
+    global tip_hash
+    tip_hash = new_tip
+
+def forget_tip(transaction):
+    """ "chain-changed" listener making get_tip_hash reread the tip. """
+    global tip_hash
+    tip_hash = None
+
+events.subscribe("tip-changed", record_tip)
+events.subscribe("chain-changed", forget_tip)
+
+def get_tip_hash():
+    """ Get the best tip hash, reading it from the database only the first time (None for an empty chain). """
+    global tip_hash
+    if tip_hash is None:
+        from webapp.app import open_chain, close_chain
+        chain = open_chain()
+        try:
+            tip_hash = chain.tip.hex() if chain.tip is not None else None
+        finally:
+            close_chain()
+    return tip_hash
+
+def conditional(etag, cache_control, build_response):
+    """ Answer a GET with an ETag: 304 if the client already has it, otherwise build the response.
+
+    Args:
+        etag (str): Strong entity tag for the response (unquoted).
+        cache_control (str): Cache-Control header for the response.
+        build_response (function): Called with the open chain to build the body; returns (data, status).
+
+    Returns:
+        (:obj:`flask.Response`): the response.
+    """
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        key = request.full_path
+        entry = cache.get(key)
+        if entry is None:
+            from webapp.app import open_chain, close_chain
+            generation = cache.generation
+            chain = open_chain()
+            try:
+                data, status = build_response(chain)
+            finally:
+                close_chain()
+            entry = (jsonify(data).get_data(as_text=True), status)
+            if status == 200:
+                cache.put(key, entry[0], status, generation)
+        response = make_response(entry)
+        response.mimetype = "application/json"
+        if entry[1] != 200:
+            return response # errors are neither tagged nor cached
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def tip_etag(*parts):
+    """ ETag for a response determined by the best tip (and the request parts given). """
+    return "-".join([get_tip_hash() or "empty"] + [str(part) for part in parts])
+
+def tx_json(tx):
+    """ JSON form of a transaction. """
+    return {"hash": tx.hash, "inputs": [repr(input_ref) for input_ref in tx.input_refs],
+        "outputs": [{"sender": output.sender, "receiver": output.receiver, "amount": output.amount} for output in tx.outputs]}
+
+def block_json(chain, block, transactions=True):
+    """ JSON form of a block; only fields that never change for a given block hash. """
+    data = {"hash": block.hash, "height": block.height, "parent_hash": block.parent_hash, "is_genesis": block.is_genesis,
+        "timestamp": block.timestamp, "merkle": block.merkle, "target": str(block.target), "seal_data": block.seal_data,
+        "weight": block.get_weight(), "total_weight": chain.get_block_weight(block.hash)}
+    if transactions:
+        data["transactions"] = [tx_json(tx) for tx in block.transactions]
+    else:
+        data["transactions"] = [tx.hash for tx in block.transactions]
+    return data
+
+def not_found(what):
+    """ Body and status for a missing resource. """
+    return {"error": what + " not found"}, 404
+
+@api.route("/tip")
+def tip():
+    def build(chain):
+        if chain.tip is None:
+            return not_found("tip")
+        block_hash = chain.tip.hex()
+        block_id = chain.block_index.lookup(chain.tip)
+        return {"hash": block_hash, "height": chain.block_index.heights[block_id],
+            "total_weight": chain.get_block_weight(block_hash)}, 200
+    return conditional(tip_etag("tip"), REVALIDATE, build)
+
+@api.route("/blocks/<string:block_hash>")
+def block_by_hash(block_hash):
+    def build(chain):
+        block = chain.get_block(block_hash)
+        if block is None:
+            return not_found("block body")
+        return block_json(chain, block), 200
+    return conditional(block_hash, IMMUTABLE, build)
+
+@api.route("/heights/<int:height>")
+def block_by_height(height):
+    def build(chain):
+        block_hash = chain.get_main_chain_blockhash(height)
+        block = chain.get_block(block_hash) if block_hash is not None else None
+        if block is None:
+            return not_found("best-chain block body")
+        return block_json(chain, block), 200
+    return conditional(tip_etag("height", height), REVALIDATE, build)
+
+@api.route("/transactions/<string:tx_hash>")
+def transaction_by_hash(tx_hash):
+    def build(chain):
+        tx = chain.get_transaction(tx_hash)
+        if tx is None:
+            return not_found("transaction")
+        data = tx_json(tx)
+        data["block"] = None
+        data["locations"] = []
+        for block_hash, height, position in chain.get_transaction_locations(tx_hash):
+            in_main_chain = chain.is_in_main_chain(block_hash)
+            if in_main_chain:
+                data["block"] = block_hash
+            data["locations"].append({"block": block_hash, "height": height, "position": position, "best_chain": in_main_chain})
+        return data, 200
+    return conditional(tip_etag("tx", tx_hash), REVALIDATE, build)
+
+@api.route("/addresses/<string:address>")
+def address_history(address):
+    height = request.args.get("height", type=int)
+    count = request.args.get("count", default=config.EXPLORER_PAGE_SIZE, type=int)
+    count = max(1, min(count, config.EXPLORER_MAX_PAGE_SIZE))
+    def build(chain):
+        entries, next_height = chain.get_address_history(address, height, count)
+        return {"address": address, "next_height": next_height, "entries": [{"height": entry_height, "block": block_hash,
+            "best_chain": chain.is_in_main_chain(block_hash), "tx": tx_hash, "output_index": output_index, "kind": kind,
+            "amount": amount, "spending_tx": spending_tx_hash}
+            for entry_height, block_hash, tx_hash, output_index, kind, amount, spending_tx_hash in entries]}, 200
+    return conditional(tip_etag("address", address, height, count), REVALIDATE, build)
+
+@api.route("/range")
+def block_range():
+    min_height = request.args.get("from", default=0, type=int)
+    max_height = request.args.get("to", default=min_height + config.EXPLORER_PAGE_SIZE - 1, type=int)
+    max_height = min(max_height, min_height + config.EXPLORER_MAX_PAGE_SIZE - 1)
+    def build(chain):
+        blocks = []
+        for block_hash in chain.main_chain_range(min_height, max_height):
+            block = chain.get_block(block_hash)
+            if block is not None: # header only below a snapshot
+                blocks.append(block_json(chain, block, transactions=False))
+        return {"from": min_height, "to": max_height, "blocks": blocks}, 200
+    return conditional(tip_etag("range", min_height, max_height), REVALIDATE, build)
+
+@api.route("/wallets/<string:user>")
+def wallet(user):
+    amount = request.args.get("amount", type=int)
+    count = request.args.get("count", default=config.EXPLORER_MAX_PAGE_SIZE, type=int)
+    count = max(1, min(count, config.EXPLORER_MAX_PAGE_SIZE))
+    def build(chain):
+        balance = chain.get_balance(user)
+        if amount is None:
+            outputs = chain.get_unspent_outputs(user, count + 1) # one more shows whether there are more
+            more = len(outputs) > count
+            outputs = outputs[:count]
+        else:
+            outputs = chain.select_coins(user, amount)
+            if outputs is None:
+                return {"error": "balance too low", "user": user, "balance": balance}, 409
+            more = False
+        return {"user": user, "balance": balance, "more": more,
+            "unspent": [{"input_ref": input_ref, "amount": output_amount} for input_ref, output_amount in outputs]}, 200
+    return conditional(tip_etag("wallet", user, amount, count), REVALIDATE, build)
+
+def export_batch(chain, min_height, max_height, best_only):
+    """ Read blocks for /api/blocks.ndjson, whole heights at a time until EXPORT_BATCH are collected.
+
+    Returns:
+        (:obj:`list` of str), int: NDJSON lines, and the height the next batch starts at (None after the last).
+    """
+    lines = []
+    for height in chain.get_heights_with_blocks(min_height, max_height):
+        if len(lines) >= EXPORT_BATCH:
+            return lines, height
+        for digest in chain.chain[height]:
+            block = chain.blocks.get(digest)
+            if block is None or (best_only and not chain.is_in_main_chain(block.hash)):
+                continue # header only, or off the best chain
+            lines.append(json.dumps(block_json(chain, block)) + "\n")
+    return lines, None
+
+@api.route("/blocks.ndjson")
+def export_blocks():
+    min_height = request.args.get("from", default=0, type=int)
+    max_height = request.args.get("to", type=int)
+    best_only = request.args.get("best", default=0, type=int)
+    def generate():
+        from webapp.app import open_chain, close_chain
+        next_height = min_height
+        while next_height is not None:
+            # the database is closed while each batch is sent, so a slow client never holds up other requests
+            # or p2p messages (and blocks added meanwhile show up in later batches)
+            chain = open_chain()
+            try:
+                lines, next_height = export_batch(chain, next_height, max_height, best_only)
+            finally:
+                close_chain()
+            yield "".join(lines)
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache"})
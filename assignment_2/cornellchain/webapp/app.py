@@ -2,50 +2,240 @@ import config
 import ZODB, ZODB.FileStorage
 import transaction
 import importlib
-from flask import Flask, render_template, request
+import functools
+import threading
+from flask import Flask, Response, redirect, render_template, request, stream_with_context, url_for
 from p2p import gossip
+from blockchain import events, metrics
+from blockchain.transaction import OutPoint
+from blockchain.chaindb import storages
+from webapp.cache import cache
+from webapp import push
 
 app = Flask(__name__)
 
-def get_all_blockhashes(chain):
-    block_hashes = []
-    for height in chain.get_heights_with_blocks():
-        for block_hash in chain.get_blockhashes_at_height(height):
-            block_hashes.append(block_hash)
-    block_hashes.reverse() # show newest block first
-    return block_hashes
+#: Last transaction committed to a shared chain storage that this process knows of (see check_storage)
+seen_transaction = None
 
-def get_best_chain_blockhashes(chain):
-    return chain.get_chain_ending_with(chain.get_heaviest_chain_tip().hash)
+@app.before_request
+def check_storage():
+    # when serving with workers, blocks are added by the p2p writer process, whose chain events never reach
+    # this one; spot its commits through the shared storage instead, so cached responses are dropped
+    global seen_transaction
+    last_transaction = storages.last_transaction()
+    if last_transaction is not None and last_transaction != seen_transaction: # None before anything is committed
+        seen_transaction = last_transaction
+        events.emit("chain-changed", transaction=last_transaction.hex())
 
-def render_chain(block_hashes_function):
+#: Held from open_chain to close_chain (and while handling a p2p message): reopening the database reloads the
+#: global chaindb module, which is not safe from two threads at once; worker processes are what serve in parallel
+chain_lock = threading.Lock()
+
+def open_chain():
+    """ Reopen the chain database (picking up blocks committed since the last request) and return the chain;
+    call close_chain when done with it. """
+    chain_lock.acquire()
     from blockchain import chaindb
     chaindb.connection.close()
     chaindb.db.close()
     importlib.reload(chaindb)
-    chain = chaindb.chain
+    return chaindb.chain
 
-    block_hashes = block_hashes_function(chain)
-
-    weights=chain.get_all_block_weights()
-    output = render_template('chain.html', block_hashes=block_hashes, chain=chain, weights=weights)
+def close_chain():
+    """ Close the chain database after a request. """
+    from blockchain import chaindb
     chaindb.connection.close()
     chaindb.db.close()
-    return output
+    chain_lock.release()
+
+def cached(view):
+    """ Serve a page view from the response cache when possible; the view returns (body, status), where
+    body is a str or an iterable of str chunks (a streamed page is cached once it has been sent in full).
+    Only successful responses are cached. """
+    @functools.wraps(view)
+    def cached_view(*args, **kwargs):
+        key = request.full_path
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        generation = cache.generation
+        body, status = view(*args, **kwargs)
+        if status != 200:
+            return body, status
+        if isinstance(body, str):
+            cache.put(key, body, status, generation)
+            return body, status
+        return cache.record(key, body, status, generation), status
+    return cached_view
+
+def stream_page(template_name, **context):
+    """ Render a template incrementally (in chunks of a few template statements), so a page
+    is sent as it renders and never held in memory as a whole. """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(20)
+    return stream
+
+def get_page_args():
+    """ Read the explorer's paging parameters from the query string.
+
+    Returns:
+        int, int: highest height to show (None for the top of the chain) and number of blocks per page.
+    """
+    height = request.args.get("height", type=int)
+    count = request.args.get("count", default=config.EXPLORER_PAGE_SIZE, type=int)
+    return height, max(1, min(count, config.EXPLORER_MAX_PAGE_SIZE))
+
+def get_all_blockhashes(chain, height, count):
+    """ Hashes of all blocks from a height down, newest first, whole heights at a time until count are collected.
+
+    Returns:
+        (:obj:`list` of str), int: block hashes, and the height the next page starts at (None on the last page).
+    """
+    block_hashes = []
+    for block_height in chain.iterate_heights_newest_first(height):
+        if len(block_hashes) >= count:
+            return block_hashes, block_height
+        block_hashes += chain.get_blockhashes_at_height(block_height)
+    return block_hashes, None
+
+def get_best_chain_blockhashes(chain, height, count):
+    """ Hashes of count best-chain blocks from a height down, newest first (see get_all_blockhashes). """
+    if height is None:
+        height = chain.get_max_height()
+    block_hashes = chain.main_chain_range(height - count + 1, height)
+    block_hashes.reverse() # show newest block first
+    return block_hashes, height - count if height - count >= 0 else None
+
+def block_summary(chain, block_hash):
+    """ Copy what chain.html shows of a block out of the database (None if only its header is known),
+    so the page can be sent after the database is closed. """
+    block = chain.get_block(block_hash)
+    if block is None:
+        return None
+    return {"hash": block.hash, "is_genesis": block.is_genesis, "height": block.height, "transactions": len(block.transactions),
+        "parent_hash": block.parent_hash, "timestamp": block.timestamp, "merkle": block.merkle, "seal_data": block.seal_data,
+        "weight": block.get_weight(), "total_weight": chain.get_block_weight(block_hash), "header": block.header()}
+
+def render_chain(block_hashes_function):
+    height, count = get_page_args()
+    chain = open_chain()
+    try:
+        block_hashes, next_height = block_hashes_function(chain, height, count)
+        # only the blocks on this page; transactions are loaded separately, when asked for
+        blocks = [(block_hash, block_summary(chain, block_hash)) for block_hash in block_hashes]
+    finally:
+        close_chain() # before sending anything, so a slow client never holds up other requests or p2p messages
+    return stream_with_context(stream_page('chain.html', blocks=blocks, view=request.path, next_height=next_height,
+        count=count)), 200
 
 @app.route('/')
+@cached
 def full_chain_view():
     return render_chain(get_all_blockhashes)
 
 @app.route('/best')
+@cached
 def best_chain_view():
     return render_chain(get_best_chain_blockhashes)
 
+@app.route('/block/<string:block_hash>')
+@cached
+def block_view(block_hash):
+    chain = open_chain()
+    try:
+        weight = chain.get_block_weight(block_hash)
+        output = render_template('block.html', block_hash=block_hash, block=chain.get_block(block_hash), weight=weight,
+            in_main_chain=chain.is_in_main_chain(block_hash))
+    finally:
+        close_chain()
+    return output, 200 if weight is not None else 404
+
+@app.route('/block/<string:block_hash>/transactions')
+@cached
+def block_transactions_view(block_hash):
+    chain = open_chain()
+    try:
+        block = chain.get_block(block_hash)
+        output = render_template('transactions.html', block=block)
+    finally:
+        close_chain()
+    return output, 200 if block is not None else 404
+
+@app.route('/tx/<string:tx_hash>')
+@cached
+def transaction_view(tx_hash):
+    chain = open_chain()
+    try:
+        tx = chain.get_transaction(tx_hash)
+        locations, spenders = [], []
+        if tx is not None:
+            locations = [(block_hash, height, position, chain.is_in_main_chain(block_hash))
+                for block_hash, height, position in chain.get_transaction_locations(tx_hash)]
+            spenders = [[digest.hex() for digest in chain.blocks_spending(OutPoint(tx.txid, output_index))]
+                for output_index in range(len(tx.outputs))]
+        output = render_template('tx.html', tx_hash=tx_hash, tx=tx, locations=locations, spenders=spenders)
+    finally:
+        close_chain()
+    return output, 200 if tx is not None else 404
+
+@app.route('/address/<string:address>')
+@cached
+def address_view(address):
+    height, count = get_page_args()
+    chain = open_chain()
+    try:
+        entries, next_height = chain.get_address_history(address, height, count)
+        in_main_chain = {entry[1]: chain.is_in_main_chain(entry[1]) for entry in entries}
+        output = render_template('address.html', address=address, balance=chain.get_balance(address), entries=entries,
+            in_main_chain=in_main_chain, height=height, next_height=next_height, count=count)
+    finally:
+        close_chain()
+    return output, 200
+
+@app.route('/search')
+def search_view():
+    # a hash is looked up as a block, then as a transaction; anything else is taken as an address
+    query = request.args.get("q", default="").strip()
+    if not query:
+        return redirect(url_for("full_chain_view"))
+    chain = open_chain()
+    try:
+        if chain.get_block_weight(query) is not None:
+            target = url_for("block_view", block_hash=query)
+        elif chain.get_transaction(query) is not None:
+            target = url_for("transaction_view", tx_hash=query)
+        else:
+            target = url_for("address_view", address=query)
+    finally:
+        close_chain()
+    return redirect(target)
+
+@app.route('/events')
+def event_stream():
+    # push new blocks, tip changes and BA rounds as server-sent events, instead of having clients poll
+    wanted_events = request.args.get("events")
+    wanted_events = wanted_events.split(",") if wanted_events else push.PUSH_EVENTS
+    return Response(push.stream_events(wanted_events), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/metrics')
+def metrics_view():
+    # this process's counters, in the Prometheus text format (see blockchain.metrics)
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# JSON API; imported here, as it reopens the database through open_chain and close_chain
+from webapp.api import api
+app.register_blueprint(api, url_prefix="/api")
+
 # Expose gossip interface in addition to web interface
 @app.route('/p2pmessage/<string:type>/<int:reply_port>', methods=['POST'])
 def route_message(type, reply_port):
+    if not config.P2P_WRITER:
+        # only the writer process adds to the chain; it listens on the node's receiving port
+        return "p2p messages go to port " + str(config.receiving_port), 421
     message = str(request.data.decode("utf8"))
     sender = "http://" + str(request.remote_addr) + ":" + str(reply_port) + "/"
-    gossip.handle_message(type, message, sender)
+    with chain_lock:
+        gossip.handle_message(type, message, sender)
     return "Yay!"
-
@@ -0,0 +1,190 @@
+""" Asynchronous (ASGI) front end for the webapp, for serving many slow or idle connections at once
+    (python3 run_node.py [node id] [web workers] [threads] asgi runs it under gunicorn; see webapp.server):
+        - /p2pmessage/<type>/<reply port> reads the message, queues it for a single ingest thread (which handles
+          messages one at a time, as gossip.handle_message expects) and answers at once: 202 "Yay!", or 503 if
+          the queue is full;
+        - /events streams server-sent events from a task per client rather than a thread (see webapp.push);
+        - every other request goes to the Flask app (webapp.app) on a pool of threads, so database reads and
+          template rendering never block the event loop; streamed pages are sent a chunk at a time as they render.
+"""
+import io
+import re
+import sys
+import queue
+import asyncio
+import threading
+import urllib.parse
+import concurrent.futures
+import config
+from p2p import gossip
+from blockchain import metrics
+from webapp import push
+from webapp.app import app, chain_lock
+
+P2P_PATH = re.compile(r"^/p2pmessage/([^/]+)/(\d+)$")
+
+class AsyncApp:
+    """ The ASGI application.
+
+    Attributes:
+        executor (:obj:`ThreadPoolExecutor`): Threads running the Flask app.
+        p2p_queue (:obj:`queue.Queue` of (str, str, str)): p2p messages waiting for the ingest thread,
+            as (type, message, sender).
+        ingest_thread (:obj:`threading.Thread`): Thread handling queued p2p messages; started with the first one.
+    """
+
+    def __init__(self, threads, queue_size=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.p2p_queue = queue.Queue(config.P2P_QUEUE_SIZE if queue_size is None else queue_size)
+        self.ingest_thread = None
+        metrics.queue_depth.track(self.p2p_queue.qsize, "p2p-ingest")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "websocket":
+            await send({"type": "websocket.close"}) # server-sent events only
+        elif scope["type"] == "http":
+            match = P2P_PATH.match(scope["path"])
+            if match and scope["method"] == "POST":
+                await self.p2p_message(scope, receive, send, match.group(1), match.group(2))
+            elif scope["path"] == "/events" and scope["method"] == "GET":
+                await self.event_stream(scope, receive, send)
+            else:
+                await self.call_flask(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return body
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    async def send_text(self, send, status, text):
+        await send({"type": "http.response.start", "status": status,
+            "headers": [(b"content-type", b"text/html; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": text.encode("utf8")})
+
+    def ingest_messages(self):
+        """ Handle queued p2p messages one at a time, forever. """
+        while True:
+            type, message, sender = self.p2p_queue.get()
+            try:
+                with chain_lock:
+                    gossip.handle_message(type, message, sender)
+            except Exception as e:
+                print("[p2p] Failed to handle", type, "message:", e)
+            self.p2p_queue.task_done()
+
+    async def p2p_message(self, scope, receive, send, type, reply_port):
+        message = (await self.read_body(receive)).decode("utf8")
+        if not config.P2P_WRITER:
+            # only the writer process adds to the chain; it listens on the node's receiving port
+            return await self.send_text(send, 421, "p2p messages go to port " + str(config.receiving_port))
+        if self.ingest_thread is None:
+            self.ingest_thread = threading.Thread(target=self.ingest_messages, daemon=True)
+            self.ingest_thread.start()
+        sender = "http://" + (scope.get("client") or ("127.0.0.1", 0))[0] + ":" + reply_port + "/"
+        try:
+            self.p2p_queue.put_nowait((type, message, sender))
+        except queue.Full:
+            return await self.send_text(send, 503, "p2p queue full")
+        await self.send_text(send, 202, "Yay!")
+
+    async def event_stream(self, scope, receive, send):
+        wanted_events = urllib.parse.parse_qs(scope["query_string"].decode("latin1")).get("events")
+        wanted_events = wanted_events[0].split(",") if wanted_events else push.PUSH_EVENTS
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+        chunks = push.stream_events_async(wanted_events)
+
+        async def send_chunks():
+            async for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk.encode("utf8"), "more_body": True})
+
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        tasks = [asyncio.ensure_future(send_chunks()), asyncio.ensure_future(wait_for_disconnect())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await chunks.aclose()
+
+    def wsgi_environ(self, scope, body):
+        """ Translate an ASGI HTTP scope and request body into a WSGI environment. """
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope["query_string"].decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": (scope.get("client") or ("127.0.0.1", 0))[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name = name.decode("latin1").upper().replace("-", "_")
+            if not name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = "HTTP_" + name
+            value = value.decode("latin1")
+            environ[name] = environ[name] + "," + value if name in environ else value
+        return environ
+
+    def run_flask(self, environ, send, loop):
+        """ Run the Flask app for one request (on an executor thread), sending the response through the event loop
+        as it is produced; waits for each chunk to be sent, so a slow client slows the page down rather than
+        having it pile up in memory. """
+        def send_now(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response_start = {"type": "http.response.start"}
+        def start_response(status, headers, exc_info=None):
+            response_start["status"] = int(status.split(" ", 1)[0])
+            response_start["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+
+        result = app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    send_now(response_start)
+                    started = True
+                if chunk:
+                    send_now({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                send_now(response_start)
+            send_now({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    async def call_flask(self, scope, receive, send):
+        body = await self.read_body(receive)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.run_flask, self.wsgi_environ(scope, body), send, loop)
@@ -0,0 +1,105 @@
+""" In-memory cache of rendered pages and API bodies, so repeated views skip the database and templates.
+
+    Entries are keyed by request path and query string, evicted least recently used first once they
+    add up to more than the cache's size limit (config.WEB_CACHE_SIZE), and all dropped whenever the
+    chain changes: on every "block-added" and "body-added" event from the chain database, and on every
+    "chain-changed" event from the webapp (when another process, eg the p2p writer, added to a shared chain).
+"""
+import threading
+import collections
+import config
+from blockchain import events
+
+class ResponseCache:
+    """ Size-bounded LRU cache of response bodies; safe to use from several request threads.
+
+    Attributes:
+        max_size (int): Limit on the total length of the cached bodies (0 disables the cache).
+        entries (:obj:`OrderedDict` of (str to (str, int))): Maps keys to (body, status), least recently used first.
+        size (int): Total length of the cached bodies.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that were not.
+        generation (int): Number of times the cache was cleared; a response built from the chain as it was
+            before a clear is never cached after it.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Look up a response.
+
+        Returns:
+            (str, int): the cached body and status, or None if key is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, status=200, generation=None):
+        """ Cache a response, evicting the least recently used ones to stay within max_size.
+
+        Args:
+            key (str): Request path and query string.
+            body (str): Response body.
+            status (int, optional): Response status.
+            generation (int, optional): Value of generation when the response was started; it is
+                not cached if the cache has been cleared since.
+        """
+        with self.lock:
+            if len(body) > self.max_size or (generation is not None and generation != self.generation):
+                return
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+            self.entries[key] = (body, status)
+            self.size += len(body)
+            while self.size > self.max_size:
+                old_body, old_status = self.entries.popitem(last=False)[1]
+                self.size -= len(old_body)
+
+    def record(self, key, chunks, status=200, generation=None):
+        """ Pass a streamed response body through, caching it once it is complete (see put);
+        it is not kept if it outgrows max_size on the way.
+
+        Yields:
+            str: the chunks, unchanged.
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            yield chunk
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > self.max_size:
+                    parts = None
+        if parts is not None:
+            self.put(key, "".join(parts), status, generation)
+
+    def clear(self):
+        """ Drop every cached response. """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.generation += 1
+
+#: The webapp's response cache
+cache = ResponseCache(config.WEB_CACHE_SIZE)
+
+def invalidate(**data):
+    """ Chain event listener dropping every cached response. """
+    cache.clear()
+
+for event in ("block-added", "body-added", "chain-changed"):
+    events.subscribe(event, invalidate)
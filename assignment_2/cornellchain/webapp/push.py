@@ -0,0 +1,171 @@
+""" Server-sent events push of chain and Byzantine agreement events, served at /events by webapp.app
+    (a thread per client) and webapp.asgi (a task per client).
+
+    One Broadcaster receives every event and appends it to a bounded queue per connected client, so
+    publishing costs one append per client and a slow client can never hold up the node: once its queue
+    is full, its oldest events are dropped, and it is sent a "dropped" event saying how many it missed.
+
+    Forwarded events (see blockchain.events): "block-added", "tip-changed", "block-finalized", "body-added",
+    "ba-round", "ba-done" and "chain-changed" (the only chain event reaching web workers when serving with
+    workers; see webapp.server). Clients can pick some with ?events=<comma separated names>.
+"""
+import json
+import asyncio
+import threading
+import collections
+import config
+from blockchain import events, metrics
+
+PUSH_EVENTS = ("block-added", "tip-changed", "block-finalized", "body-added", "ba-round", "ba-done", "chain-changed")
+
+class PushClient:
+    """ One connected client of a Broadcaster.
+
+    Attributes:
+        queue (:obj:`deque` of (int, str, dict)): Pending (event id, event name, data), oldest first; bounded.
+        events (:obj:`set` of str): Names of the events the client wants.
+        dropped (int): Events dropped from the queue since the client was last told.
+        wake (function): Called (with the broadcaster locked) after an event is queued, for clients not
+            waiting through Broadcaster.wait; None if there is nothing to call.
+    """
+
+    def __init__(self, buffer_size, wanted_events, wake=None):
+        self.queue = collections.deque(maxlen=buffer_size)
+        self.events = set(wanted_events)
+        self.dropped = 0
+        self.wake = wake
+
+class Broadcaster:
+    """ Fans events out to every subscribed PushClient.
+
+    Attributes:
+        buffer_size (int): Events each client can fall behind by before its oldest are dropped.
+        clients (:obj:`set` of :obj:`PushClient`): Subscribed clients.
+        last_id (int): Id of the last event published (ids count up from 1).
+        condition (:obj:`threading.Condition`): Guards the queues; notified on every event.
+    """
+
+    def __init__(self, buffer_size):
+        if buffer_size < 1:
+            # every event would be dropped on arrival, leaving clients nothing to resume from
+            raise ValueError("push buffer size must be at least 1, not " + str(buffer_size))
+        self.buffer_size = buffer_size
+        self.clients = set()
+        self.last_id = 0
+        self.condition = threading.Condition()
+
+    def subscribe(self, wanted_events=PUSH_EVENTS, wake=None):
+        """ Add a client that receives every later event named in wanted_events (see PushClient for wake). """
+        client = PushClient(self.buffer_size, wanted_events, wake)
+        with self.condition:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        """ Remove a client; does nothing if it is not subscribed. """
+        with self.condition:
+            self.clients.discard(client)
+
+    def publish(self, event, data):
+        """ Queue an event for every client that wants it, and wake their waiting readers. """
+        with self.condition:
+            self.last_id += 1
+            for client in self.clients:
+                if event in client.events:
+                    if len(client.queue) == client.queue.maxlen:
+                        client.dropped += 1
+                    client.queue.append((self.last_id, event, data))
+                    if client.wake is not None:
+                        client.wake()
+            self.condition.notify_all()
+
+    def take(self, client):
+        """ Take every pending event for a client, without waiting.
+
+        Returns:
+            (:obj:`list` of (int, str, dict)), int: the client's pending events, oldest first,
+            and the number dropped since the last call.
+        """
+        with self.condition:
+            pending = list(client.queue)
+            client.queue.clear()
+            dropped = client.dropped
+            client.dropped = 0
+        return pending, dropped
+
+    def pending(self):
+        """ Count the events queued for every client, not yet taken. """
+        with self.condition:
+            return sum(len(client.queue) for client in self.clients)
+
+    def wait(self, client, timeout):
+        """ Wait up to timeout seconds for events for a client, and take them all (see take; empty on timeout). """
+        with self.condition:
+            self.condition.wait_for(lambda: client.queue, timeout)
+            return self.take(client)
+
+#: The webapp's broadcaster, fed by the chain and BA events
+broadcaster = Broadcaster(config.PUSH_BUFFER_SIZE)
+metrics.queue_depth.track(broadcaster.pending, "push-events")
+
+def forward(event):
+    """ Make an events listener publishing event to the broadcaster. """
+    def listener(**data):
+        broadcaster.publish(event, data)
+    return listener
+
+for event in PUSH_EVENTS:
+    events.subscribe(event, forward(event))
+
+def format_event(event_id, event, data):
+    """ Encode one server-sent event. """
+    return "id: " + str(event_id) + "\nevent: " + event + "\ndata: " + json.dumps(data) + "\n\n"
+
+def format_pending(pending, dropped):
+    """ Encode events taken from the broadcaster, after a "dropped" event if any were dropped,
+    or a keepalive comment if there are none. """
+    chunks = []
+    if dropped:
+        chunks.append(format_event(pending[0][0] - 1, "dropped", {"count": dropped}))
+    for event_id, event, data in pending:
+        chunks.append(format_event(event_id, event, data))
+    return "".join(chunks) or ": keepalive\n\n"
+
+def stream_events(wanted_events=PUSH_EVENTS):
+    """ Subscribe to the broadcaster and stream its events to one client as server-sent events,
+    with a comment line every config.PUSH_KEEPALIVE seconds without events; unsubscribes when closed.
+    Holds a thread for as long as the client stays connected.
+
+    Yields:
+        str: encoded server-sent events.
+    """
+    client = broadcaster.subscribe(wanted_events)
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            yield format_pending(*broadcaster.wait(client, config.PUSH_KEEPALIVE))
+    finally:
+        broadcaster.unsubscribe(client)
+
+async def stream_events_async(wanted_events=PUSH_EVENTS):
+    """ Like stream_events, but waiting in the running event loop (woken from whichever thread publishes),
+    so an idle client costs a task rather than a thread. """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    def wake():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass # the loop has closed; the stream unsubscribes when it is closed
+    client = broadcaster.subscribe(wanted_events, wake)
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), config.PUSH_KEEPALIVE)
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
+            yield format_pending(*broadcaster.take(client))
+    finally:
+        broadcaster.unsubscribe(client)
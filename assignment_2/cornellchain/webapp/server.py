@@ -0,0 +1,128 @@
+""" Serving a node: with the Flask development server (python3 run_node.py [node id]), or for production,
+    with worker processes (python3 run_node.py [node id] [web workers] [threads per worker]):
+        - a ZEO server owns the chain database (config.DB_PATH), on config.ZEO_PORT_BASE + node id;
+        - a single writer process handles p2p messages, one at a time, on the node's receiving port, so
+          only one process ever adds blocks;
+        - gunicorn worker processes, each with a pool of threads, serve the explorer, API and event streams
+          on config.WEB_PORT_BASE + node id, reading the chain through ZEO, and follow the writer's commits
+          by watching the shared storage (see webapp.app.check_storage).
+    With asgi after the number of threads, the writer and workers run the asynchronous front end instead (see
+    webapp.asgi): p2p messages are queued rather than handled while the sender waits, event streams need no
+    thread each, and the threads only run the Flask app for other requests.
+    Production serving needs the gunicorn and ZEO packages.
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+import config
+
+#: Seconds between checks for new commits to the shared storage, in web workers
+STORAGE_POLL = 1
+
+def configure_node(node_id):
+    """ Store node-specific values in config; should probably move these to a node class. """
+    config.DB_PATH = "database" + os.sep + str(node_id) + os.sep + "node.db"
+    config.node_id = node_id
+    config.receiving_port = 5000 + node_id
+    config.PEERS.pop(node_id, None)
+
+def serve_dev(node_id):
+    """ Serve a node with the Flask development server (one process, in debug mode). """
+    configure_node(node_id)
+    from webapp.app import app
+    app.run(port=config.receiving_port, debug=True)
+
+def watch_storage():
+    """ Check the shared storage for commits by the writer every STORAGE_POLL seconds, so caches and event
+    streams follow the chain without waiting for a request. """
+    from webapp.app import check_storage
+    while True:
+        check_storage()
+        time.sleep(STORAGE_POLL)
+
+def node_app(node_id, writer):
+    """ Application factory for gunicorn, run in each worker process.
+
+    Args:
+        node_id (int): Id of the node being served (0 to keep the configured database path and ports).
+        writer (bool): Whether the worker is the p2p writer; other workers refuse p2p messages and watch
+            the shared storage for the writer's commits.
+
+    Returns:
+        (:obj:`flask.Flask`): the webapp.
+    """
+    if node_id:
+        configure_node(node_id)
+    config.P2P_WRITER = writer
+    from webapp.app import app
+    if not writer:
+        threading.Thread(target=watch_storage, daemon=True).start()
+    return app
+
+def node_asgi_app(node_id, writer, threads):
+    """ Application factory for gunicorn's ASGI workers: node_app, behind the asynchronous front end
+    running it on threads threads. """
+    node_app(node_id, writer)
+    from webapp.asgi import AsyncApp
+    return AsyncApp(threads)
+
+def start_zeo_server(path, port):
+    """ Start a ZEO server process for the database at path, listening on port.
+
+    Returns:
+        (:obj:`subprocess.Popen`): the server process.
+    """
+    return subprocess.Popen([sys.executable, "-m", "ZEO.runzeo", "-a", "127.0.0.1:" + str(port), "-f", path])
+
+def start_gunicorn(node_id, writer, port, workers, threads, zeo_port, asgi=False):
+    """ Start a gunicorn server process for a node's webapp (see node_app), using the ZEO server on zeo_port.
+
+    Args:
+        port (int): Port to listen on.
+        workers (int): Number of worker processes.
+        threads (int): Number of request threads per worker process.
+        asgi (bool, optional): Whether to run the asynchronous front end (see node_asgi_app), in
+            config.ASGI_WORKER_CLASS workers.
+
+    Returns:
+        (:obj:`subprocess.Popen`): the gunicorn master process.
+    """
+    environment = dict(os.environ, CORNELLCHAIN_STORAGE="zeo", CORNELLCHAIN_ZEO="127.0.0.1:" + str(zeo_port))
+    arguments = [sys.executable, "-m", "gunicorn", "--bind", "127.0.0.1:" + str(port), "--workers", str(workers)]
+    if asgi:
+        arguments += ["--worker-class", config.ASGI_WORKER_CLASS,
+            "webapp.server:node_asgi_app(" + str(node_id) + ", " + str(writer) + ", " + str(threads) + ")"]
+    else:
+        arguments += ["--threads", str(threads), "webapp.server:node_app(" + str(node_id) + ", " + str(writer) + ")"]
+    return subprocess.Popen(arguments, env=environment)
+
+def serve_production(node_id, workers, threads, asgi=False):
+    """ Serve a node with a ZEO server, a single p2p writer process and web worker processes (see above);
+    returns when any of them exits, after stopping the rest. """
+    configure_node(node_id)
+    os.makedirs(os.path.dirname(config.DB_PATH), exist_ok=True)
+    zeo_port = config.ZEO_PORT_BASE + node_id
+    web_port = config.WEB_PORT_BASE + node_id
+    processes = [start_zeo_server(config.DB_PATH, zeo_port)]
+    try:
+        # create the chain in a new database now, rather than have the workers race to
+        config.DB_STORAGE = "zeo"
+        config.ZEO_ADDRESS = ("127.0.0.1", zeo_port)
+        from blockchain import chaindb
+        chaindb.connection.close()
+        chaindb.db.close()
+        # the synchronous writer handles a message per request, so it gets a single thread; the asynchronous one
+        # queues them for its single ingest thread, and can serve reads alongside
+        processes.append(start_gunicorn(node_id, True, config.receiving_port, 1, threads if asgi else 1, zeo_port, asgi))
+        processes.append(start_gunicorn(node_id, False, web_port, workers, threads, zeo_port, asgi))
+        print("[server] p2p on port", config.receiving_port, "explorer and API on port", web_port,
+            "(" + str(workers), "ASGI" if asgi else "WSGI", "workers,", threads, "threads each)")
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    finally:
+        for process in reversed(processes):
+            if process.poll() is None:
+                process.terminate()
+                process.wait()